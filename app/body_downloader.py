@@ -0,0 +1,196 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from app.database import get_email_ids_without_body
+from app.gmail_batch import fetch_messages
+from app.profiling import get_profiler
+
+# ============== TẢI NỘI DUNG EMAIL NỀN THEO ĐỘ ƯU TIÊN (TẦNG 2) ================
+# Tầng 1 của đồng bộ chỉ lưu metadata để danh sách email hiện ngay. Luồng nền
+# này tải nội dung (format="full") theo từng batch, ưu tiên các email đang hiển
+# thị trên màn hình, rồi chấm điểm và lưu trong một transaction. Sau mỗi lô,
+# ``on_stored(danh sách id)`` được gọi để giao diện cập nhật các dòng liên quan.
+# Email không tải được (fetch_messages bỏ qua sau khi hết lượt thử lại, hoặc cả
+# lô lỗi) được xếp lại sau một khoảng backoff tăng dần, tối đa
+# ``BODY_MAX_ATTEMPTS`` lần; email Gmail trả 404 (đã bị xóa) thì bỏ hẳn.
+
+BODY_BATCH_SIZE = int(os.environ.get('PHISH_BODY_BATCH_SIZE', '20'))
+BODY_MAX_ATTEMPTS = 5
+BODY_RETRY_BACKOFF_SECONDS = 5.0
+
+# Độ ưu tiên (số nhỏ được tải trước)
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class BodyDownloader:
+    """Hàng đợi ưu tiên các email cần tải nội dung và luồng nền xử lý nó"""
+
+    def __init__(self, service_factory=None, batch_size=BODY_BATCH_SIZE):
+        self.service_factory = service_factory
+        self.batch_size = max(1, batch_size)
+        self.on_stored = None
+        self._heap = []
+        self._priorities = {}    # id -> độ ưu tiên tốt nhất đang chờ
+        self._delayed = []       # heap (thời điểm thử lại, thứ tự, id, độ ưu tiên)
+        self._attempts = {}      # id -> số lần tải không thành công
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._service = None
+        self._stopped = False
+
+    def enqueue(self, email_ids, priority=PRIORITY_BACKGROUND):
+        """Thêm email vào hàng đợi (hoặc nâng độ ưu tiên nếu đã có)"""
+        with self._condition:
+            for email_id in email_ids:
+                self._push(email_id, priority)
+            self._stopped = False
+            self._condition.notify()
+        self._ensure_thread()
+
+    def _push(self, email_id, priority):
+        current = self._priorities.get(email_id)
+        if current is None or priority < current:
+            self._priorities[email_id] = priority
+            heapq.heappush(self._heap, (priority, next(self._order), email_id))
+
+    def prioritize(self, email_ids):
+        """Đưa các email đang hiển thị lên đầu hàng đợi"""
+        self.enqueue(email_ids, PRIORITY_VISIBLE)
+
+    def resume_pending(self):
+        """Xếp lại các email còn thiếu nội dung từ lần chạy trước"""
+        pending = get_email_ids_without_body()
+        if pending:
+            print(f"[INFO] Còn {len(pending)} email chưa tải nội dung, tiếp tục tải nền")
+            self.enqueue(pending)
+
+    def clear(self):
+        """Bỏ toàn bộ hàng đợi (ví dụ khi đăng xuất)"""
+        with self._condition:
+            self._heap.clear()
+            self._priorities.clear()
+            self._delayed.clear()
+            self._attempts.clear()
+            # Client Gmail thuộc tài khoản cũ: tạo lại khi có việc mới
+            self._service = None
+            self._stopped = True
+            self._condition.notify()
+
+    @property
+    def pending(self):
+        with self._condition:
+            return len(self._priorities)
+
+    def _ensure_thread(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="BodyDownloader", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """Lấy tối đa ``batch_size`` id có độ ưu tiên cao nhất (chờ nếu hàng đợi rỗng)"""
+        with self._condition:
+            while True:
+                self._promote_due_retries()
+                if self._priorities or self._stopped:
+                    break
+                timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                self._condition.wait(timeout)
+            batch = []
+            while self._heap and len(batch) < self.batch_size:
+                priority, _, email_id = heapq.heappop(self._heap)
+                # Bỏ qua mục cũ đã được nâng độ ưu tiên
+                if self._priorities.get(email_id) == priority:
+                    del self._priorities[email_id]
+                    batch.append(email_id)
+            return batch
+
+    def _promote_due_retries(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, email_id, priority = heapq.heappop(self._delayed)
+            self._push(email_id, priority)
+
+    def _retry_later(self, email_ids, priority=PRIORITY_BACKGROUND):
+        """Xếp lại các email chưa tải được sau backoff tăng dần; bỏ sau ``BODY_MAX_ATTEMPTS`` lần"""
+        with self._condition:
+            now = time.monotonic()
+            for email_id in email_ids:
+                attempts = self._attempts.get(email_id, 0) + 1
+                if attempts >= BODY_MAX_ATTEMPTS:
+                    self._attempts.pop(email_id, None)
+                    print(f"[WARNING] Bỏ qua tải nội dung email {email_id} sau {attempts} lần không thành công")
+                    continue
+                self._attempts[email_id] = attempts
+                due = now + BODY_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                heapq.heappush(self._delayed, (due, next(self._order), email_id, priority))
+            self._condition.notify()
+
+    def _done(self, email_ids):
+        with self._condition:
+            for email_id in email_ids:
+                self._attempts.pop(email_id, None)
+
+    def _get_service(self):
+        # Client riêng của luồng nền (httplib2 không an toàn đa luồng)
+        if self._service is None:
+            factory = self.service_factory
+            if factory is None:
+                from app.fetch_emails import get_gmail_service
+                factory = get_gmail_service
+            self._service = factory()
+        return self._service
+
+    def _run(self):
+        from app.fetch_emails import extract_email_info, store_email_bodies
+
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopped:
+                    return
+                continue
+            try:
+                # Email có thể đã được tải nội dung (hoặc bị xóa) từ lúc xếp hàng
+                batch = get_email_ids_without_body(batch)
+                if not batch:
+                    continue
+                gone = set()
+                with get_profiler().stage('body_download'):
+                    messages = fetch_messages(self._get_service(), batch, not_found=gone, format="full")
+                stored = store_email_bodies([extract_email_info(message) for message in messages])
+                get_profiler().count('body_download.messages', stored)
+            except Exception as e:
+                print(f"[ERROR] Lỗi khi tải nội dung {len(batch)} email: {e}")
+                self._retry_later(batch)
+                continue
+            fetched = {message["id"] for message in messages}
+            self._done(fetched | gone)
+            missing = [email_id for email_id in batch if email_id not in fetched and email_id not in gone]
+            if missing:
+                get_profiler().count('body_download.retried', len(missing))
+                self._retry_later(missing)
+            if stored and self.on_stored:
+                try:
+                    self.on_stored([message["id"] for message in messages])
+                except Exception as e:
+                    print(f"[WARNING] Lỗi trong callback tải nội dung: {e}")
+
+
+_body_downloader = None
+_body_downloader_lock = threading.Lock()
+
+
+def get_body_downloader():
+    """BodyDownloader dùng chung cho toàn ứng dụng"""
+    global _body_downloader
+    if _body_downloader is None:
+        with _body_downloader_lock:
+            if _body_downloader is None:
+                _body_downloader = BodyDownloader()
+    return _body_downloader
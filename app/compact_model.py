@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import torch
+
+# ============== RÚT GỌN VOCABULARY VÀ BẢNG EMBEDDING ================
+# Công cụ offline, chạy một lần sau khi huấn luyện:
+#   python -m app.compact_model models/best_model.pth --corpus emails/ --from-db \
+#       --output models/best_model_compact --min-count 2 --rank 64
+# Các bước:
+#   1. Tách tập email tham chiếu thành phần dùng để chọn token và phần giữ lại
+#      (held-out, theo hash nội dung nên ổn định giữa các lần chạy); đếm token
+#      (qua TextPreprocessor) trên phần chọn token và đo độ phủ trên cả hai phần
+#   2. Chỉ giữ các dòng embedding của token xuất hiện đủ ``min_count`` lần (luôn
+#      giữ <pad>, <unk>), đánh lại index liên tục theo thứ tự cũ
+#   3. Tùy chọn: phân rã embedding hạng thấp (SVD) thành bảng V x r + phép chiếu
+#      r -> embedding_dim (LSTMModel(embedding_rank=r))
+#   4. Ghi ra artifact (app/model_artifact.py) và báo cáo kích thước, thời gian
+#      tải, độ lệch điểm so với model gốc đo trên phần held-out (token hiếm của
+#      email chưa thấy bị thay bằng <unk>, điều đo trên chính tập chọn token không thấy được)
+# SpamDetector tải thư mục kết quả như mọi artifact khác: truyền đường dẫn thư
+# mục làm model_path, hoặc (sau khi kiểm tra báo cáo) đổi tên thành models/best_model/
+# để thay model mặc định; main.spec sẽ đóng gói thư mục này thay cho file .pth.
+
+# Tỉ lệ email tham chiếu giữ lại để đo độ lệch điểm
+HOLDOUT_FRACTION = 0.2
+SPECIAL_TOKENS = ('<pad>', '<unk>')
+
+
+def load_corpus(paths=(), from_db=False, limit=None):
+    """Đọc tập email tham chiếu từ file/thư mục văn bản và/hoặc bảng emails trong database.
+
+    Mỗi file .txt/.eml là một email; file .jsonl là mỗi dòng một email (chuỗi
+    hoặc object có trường "text").
+    """
+    texts = []
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in sorted(names)]
+        for file_path in files:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                if file_path.endswith('.jsonl'):
+                    for line in f:
+                        if line.strip():
+                            item = json.loads(line)
+                            texts.append(item['text'] if isinstance(item, dict) else item)
+                else:
+                    texts.append(f.read())
+
+    if from_db:
+        from app.database import get_db_connection
+        from app.text_preprocessor import scoring_text
+        conn = get_db_connection()
+        try:
+            rows = conn.execute("SELECT from_address, subject, body FROM emails WHERE is_deleted = 0").fetchall()
+        finally:
+            conn.close()
+        for sender, subject, body in rows:
+            texts.append(scoring_text(sender, subject, body))
+
+    return texts[:limit] if limit else texts
+
+
+def _load_source(model_path):
+    """Đọc state_dict, dict token->index và tham số mô hình từ artifact hoặc checkpoint .pth"""
+    from app.model_artifact import find_artifact, load_state_dict, load_vocab, read_header, _vocab_tokens
+
+    artifact_dir = find_artifact([model_path])
+    if artifact_dir:
+        header = read_header(artifact_dir)
+        state_dict = {name: tensor.clone() for name, tensor in load_state_dict(artifact_dir, header).items()}
+        return state_dict, load_vocab(artifact_dir, header), dict(header["hyperparameters"])
+
+    from app.spam_detector import Vocabulary, checkpoint_hyperparameters
+    sys.modules['__main__'].Vocabulary = Vocabulary
+    checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
+    if not isinstance(checkpoint, dict) or 'model_state_dict' not in checkpoint or 'vocab' not in checkpoint:
+        raise ValueError("Checkpoint phải chứa 'model_state_dict' và 'vocab'")
+    tokens = _vocab_tokens(checkpoint['vocab'])
+    token2idx = {token: index for index, token in enumerate(tokens) if token}
+    return checkpoint['model_state_dict'], token2idx, checkpoint_hyperparameters(checkpoint)
+
+
+def token_counts(texts, preprocessor=None):
+    """Tần suất token (sau tiền xử lý như lúc suy luận) trên toàn tập tham chiếu"""
+    from app.text_preprocessor import get_text_preprocessor
+    preprocessor = preprocessor or get_text_preprocessor()
+    counts = Counter()
+    for text in texts:
+        counts.update(preprocessor.iter_tokens(text))
+    return counts
+
+
+def coverage(counts, token2idx):
+    """Tỉ lệ lượt token của tập tham chiếu có trong vocabulary (không rơi vào <unk>)"""
+    total = sum(counts.values())
+    covered = sum(count for token, count in counts.items() if token in token2idx)
+    return covered / total if total else 0.0
+
+
+def select_tokens(counts, token2idx, min_count=1, max_size=None):
+    """Chọn index cũ cần giữ: token đặc biệt + token có tần suất >= min_count.
+
+    Khi có ``max_size``, giữ các token phổ biến nhất. Kết quả được sắp theo
+    index cũ để <pad>/<unk> vẫn ở vị trí 0/1.
+    """
+    special = {token2idx[token] for token in SPECIAL_TOKENS if token in token2idx}
+    candidates = [(count, token2idx[token]) for token, count in counts.items()
+                  if count >= min_count and token in token2idx and token2idx[token] not in special]
+    candidates.sort(key=lambda item: (-item[0], item[1]))
+    if max_size is not None:
+        candidates = candidates[:max(0, max_size - len(special))]
+    return sorted(special | {index for _, index in candidates})
+
+
+def low_rank_factorize(weight, rank):
+    """Phân rã ma trận embedding V x D thành (V x r, D x r) bằng SVD rút gọn"""
+    U, S, Vh = torch.linalg.svd(weight.float(), full_matrices=False)
+    rank = min(rank, S.shape[0])
+    factors = U[:, :rank] * S[:rank]
+    # nn.Linear(r, D) lưu trọng số dạng (D, r): embedded = factors[idx] @ Vh[:rank]
+    projection = Vh[:rank].T.contiguous()
+    energy = float((S[:rank] ** 2).sum() / (S ** 2).sum()) if S.numel() else 1.0
+    return factors.contiguous(), projection, energy
+
+
+def compact_state_dict(state_dict, hyperparameters, keep_ids, rank=None):
+    """Tạo state_dict mới chỉ còn các dòng embedding ``keep_ids`` (và tùy chọn hạng thấp)"""
+    state_dict = dict(state_dict)
+    hyperparameters = dict(hyperparameters)
+    index = torch.tensor(keep_ids, dtype=torch.long)
+    embedding = state_dict['embedding.weight'].index_select(0, index)
+
+    info = {"energy": None}
+    if rank:
+        projection = state_dict.pop('embedding_projection.weight', None)
+        if projection is not None:
+            # Model nguồn đã được phân rã: dựng lại ma trận đầy đủ trước khi phân rã lại
+            embedding = embedding.float() @ projection.float().T
+        embedding, projection, info["energy"] = low_rank_factorize(embedding, rank)
+        state_dict['embedding_projection.weight'] = projection
+        hyperparameters['embedding_rank'] = projection.shape[1]
+
+    state_dict['embedding.weight'] = embedding.contiguous()
+    return state_dict, hyperparameters, info
+
+
+def artifact_size(path):
+    """Tổng dung lượng (byte) của file .pth hoặc thư mục artifact"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def measure_load(model_path):
+    """Tải SpamDetector mới (không qua registry), trả về (detector, số giây)"""
+    from app.spam_detector import SpamDetector
+    start = time.perf_counter()
+    detector = SpamDetector(model_path, precision='fp32')
+    return detector, time.perf_counter() - start
+
+
+def split_corpus(texts, holdout=HOLDOUT_FRACTION):
+    """Chia ``texts`` thành (phần chọn token, phần held-out) theo hash nội dung.
+
+    Email trùng nội dung luôn rơi vào cùng một phần, nên phần held-out thật sự
+    là email mà bước chọn token chưa thấy.
+    """
+    selection, held_out = [], []
+    for text in texts:
+        digest = hashlib.sha1(text.encode('utf-8', errors='replace')).digest()
+        bucket = int.from_bytes(digest[:4], 'big') / 2 ** 32
+        (held_out if bucket < holdout else selection).append(text)
+    return selection, held_out
+
+
+def score_drift(original, compacted, texts, threshold=None):
+    """So sánh điểm spam của hai detector trên cùng tập email (nên là tập held-out).
+
+    ``label_flips`` đếm số email đổi nhãn theo ngưỡng is_spam của ứng dụng
+    (``score > get_spam_threshold()``, giống database.update_spam_score).
+    """
+    if threshold is None:
+        from app.database import get_spam_threshold
+        threshold = get_spam_threshold()
+    before = original.predict_batch(texts)
+    after = compacted.predict_batch(texts)
+    diffs = [abs(a - b) for a, b in zip(before, after)]
+    flips = sum((a > threshold) != (b > threshold) for a, b in zip(before, after))
+    return {
+        "count": len(diffs),
+        "mean_abs": sum(diffs) / len(diffs) if diffs else 0.0,
+        "max_abs": max(diffs, default=0.0),
+        "threshold": threshold,
+        "label_flips": flips,
+    }
+
+
+def compact_model(model_path, output_dir, texts, min_count=1, max_size=None, rank=None,
+                  holdout=HOLDOUT_FRACTION):
+    """Rút gọn model theo tập tham chiếu ``texts``, ghi artifact và trả về báo cáo.
+
+    Token được chọn từ phần ``1 - holdout`` của ``texts``; độ lệch điểm đo trên
+    phần còn lại (``drift`` là None nếu phần held-out trống).
+    """
+    from app.model_artifact import artifact_dir_for, source_fingerprint, write_artifact
+
+    if os.path.abspath(output_dir) in (os.path.abspath(model_path), os.path.abspath(artifact_dir_for(model_path))):
+        raise ValueError("Thư mục kết quả trùng với model nguồn, hãy ghi ra thư mục khác rồi đổi tên sau khi kiểm tra")
+
+    state_dict, token2idx, hyperparameters = _load_source(model_path)
+    selection, held_out = split_corpus(texts, holdout)
+    if not selection:
+        raise ValueError("Không còn email nào để chọn token sau khi tách tập held-out")
+    if not held_out:
+        print("[WARNING] Tập held-out trống (quá ít email tham chiếu), không đo được độ lệch điểm")
+    counts = token_counts(selection)
+    held_out_counts = token_counts(held_out)
+    keep_ids = select_tokens(counts, token2idx, min_count, max_size)
+
+    idx2token = {index: token for token, index in token2idx.items()}
+    vocab_tokens = [idx2token.get(index, '') for index in keep_ids]
+    new_token2idx = {token: index for index, token in enumerate(vocab_tokens) if token}
+
+    new_state_dict, new_hyperparameters, info = compact_state_dict(state_dict, hyperparameters, keep_ids, rank)
+    # Ghi checkpoint nguồn để artifact vẫn hợp lệ khi được đổi tên thành models/best_model/
+    write_artifact(output_dir, new_state_dict, vocab_tokens, new_hyperparameters,
+                   source_fingerprint(model_path))
+
+    original, original_load = measure_load(model_path)
+    compacted, compacted_load = measure_load(output_dir)
+    report = {
+        "source": model_path,
+        "output": output_dir,
+        "corpus": {"emails": len(selection), "held_out_emails": len(held_out),
+                   "tokens": sum(counts.values()), "distinct_tokens": len(counts)},
+        "vocab_size": {"before": len(token2idx), "after": len(new_token2idx)},
+        "coverage": {"before": coverage(counts, token2idx), "after": coverage(counts, new_token2idx)},
+        "held_out_coverage": {"before": coverage(held_out_counts, token2idx),
+                              "after": coverage(held_out_counts, new_token2idx)},
+        "embedding_rank": new_hyperparameters.get('embedding_rank'),
+        "svd_energy": info["energy"],
+        "size_bytes": {"before": artifact_size(model_path), "after": artifact_size(output_dir)},
+        "load_seconds": {"before": original_load, "after": compacted_load},
+        "drift": (score_drift(original, compacted, held_out)
+                  if held_out and original.model and compacted.model else None),
+    }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rút gọn vocabulary và bảng embedding của SpamDetector")
+    parser.add_argument("model_path", nargs="?", default="models/best_model.pth",
+                        help="Checkpoint .pth hoặc thư mục artifact nguồn")
+    parser.add_argument("--output", default="models/best_model_compact", help="Thư mục artifact kết quả")
+    parser.add_argument("--corpus", nargs="*", default=[], help="File/thư mục email tham chiếu (.txt, .eml, .jsonl)")
+    parser.add_argument("--from-db", action="store_true", help="Dùng thêm email trong database làm tập tham chiếu")
+    parser.add_argument("--limit", type=int, help="Số email tham chiếu tối đa")
+    parser.add_argument("--min-count", type=int, default=1, help="Tần suất tối thiểu để giữ một token")
+    parser.add_argument("--max-size", type=int, help="Kích thước vocabulary tối đa")
+    parser.add_argument("--rank", type=int, help="Hạng của embedding sau khi phân rã (bỏ trống: không phân rã)")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION,
+                        help="Tỉ lệ email tham chiếu giữ lại để đo độ lệch điểm")
+    parser.add_argument("--max-drift", type=float, help="Báo lỗi nếu độ lệch điểm tối đa vượt ngưỡng này")
+    parser.add_argument("--report", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args(argv)
+
+    texts = load_corpus(args.corpus, args.from_db, args.limit)
+    if not texts:
+        print("[ERROR] Tập email tham chiếu trống, dùng --corpus hoặc --from-db")
+        return 1
+
+    report = compact_model(args.model_path, args.output, texts, args.min_count, args.max_size, args.rank,
+                           args.holdout)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+    drift = report["drift"]
+    if args.max_drift is not None and drift and drift["max_abs"] > args.max_drift:
+        print(f"[ERROR] Độ lệch điểm {drift['max_abs']:.4f} vượt ngưỡng {args.max_drift}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
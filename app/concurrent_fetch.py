@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.gmail_batch import fetch_messages
+from app.profiling import get_profiler
+
+# ============== TẢI EMAIL SONG SONG ================
+# Đối tượng httplib2 phía sau build("gmail", "v1", ...) không an toàn đa luồng,
+# nên mỗi luồng tải có Gmail client riêng (threading.local). Danh sách id được
+# chia thành từng phần; các luồng tải (theo batch request) và trích xuất song
+# song rồi đẩy vào một hàng đợi có giới hạn. Một luồng ghi duy nhất (luồng gọi
+# ``run``) lấy từ hàng đợi, chấm điểm và ghi SQLite theo lô trong một
+# transaction. Khi chấm điểm chậm hơn tải, hàng đợi đầy và các luồng tải phải
+# chờ (backpressure) thay vì giữ hết email trong bộ nhớ.
+
+FETCH_CONCURRENCY = int(os.environ.get('PHISH_FETCH_CONCURRENCY', '4'))
+# Số email mỗi luồng tải trong một lượt (một batch request)
+FETCH_CHUNK_SIZE = int(os.environ.get('PHISH_FETCH_CHUNK_SIZE', '25'))
+# Số email ghi vào SQLite trong một transaction
+WRITE_BATCH_SIZE = int(os.environ.get('PHISH_WRITE_BATCH_SIZE', '25'))
+# Số email đã tải nhưng chưa được ghi tối đa
+FETCH_QUEUE_SIZE = int(os.environ.get('PHISH_FETCH_QUEUE_SIZE', '100'))
+# Ghi lô chưa đầy nếu không có email mới trong khoảng thời gian này
+WRITE_FLUSH_SECONDS = 0.2
+
+_CHUNK_DONE = object()
+
+
+class ConcurrentFetcher:
+    """Tải và trích xuất email song song, ghi vào database bằng một luồng ghi duy nhất"""
+
+    def __init__(self, service_factory=None, concurrency=FETCH_CONCURRENCY, chunk_size=FETCH_CHUNK_SIZE,
+                 write_batch_size=WRITE_BATCH_SIZE, queue_size=FETCH_QUEUE_SIZE, writer=None, **get_params):
+        self.service_factory = service_factory
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = max(1, chunk_size)
+        self.write_batch_size = max(1, write_batch_size)
+        self.queue_size = max(1, queue_size)
+        self.writer = writer            # writer(danh sách email_info) -> số email đã ghi
+        self.get_params = get_params    # tham số cho messages.get (mặc định format="full")
+        self._local = threading.local()
+        self._cancelled = threading.Event()
+
+    def _service(self):
+        """Gmail client riêng của luồng hiện tại"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            factory = self.service_factory
+            if factory is None:
+                from app.fetch_emails import get_gmail_service
+                factory = get_gmail_service
+            service = self._local.service = factory()
+        return service
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _fetch_chunk(self, message_ids, results):
+        """Chạy trong luồng tải: lấy một phần id, trích xuất và đẩy vào hàng đợi"""
+        from app.fetch_emails import extract_email_info
+        try:
+            if self._cancelled.is_set():
+                return
+            messages = fetch_messages(self._service(), message_ids, **self.get_params)
+            for message in messages:
+                try:
+                    email_info = extract_email_info(message)
+                except Exception as e:
+                    print(f"[ERROR] Không thể trích xuất email {message.get('id')}: {e}")
+                    continue
+                # Chặn khi hàng đợi đầy: luồng ghi chưa theo kịp
+                while not self._cancelled.is_set():
+                    try:
+                        results.put(email_info, timeout=0.5)
+                        break
+                    except queue.Full:
+                        get_profiler().count('fetch.backpressure_waits')
+        except Exception as e:
+            print(f"[ERROR] Lỗi khi tải {len(message_ids)} email: {e}")
+        finally:
+            results.put(_CHUNK_DONE)
+
+    def _write(self, email_infos):
+        if self.writer is not None:
+            return self.writer(email_infos)
+        from app.fetch_emails import store_emails_in_database
+        return store_emails_in_database(email_infos)
+
+    def run(self, message_ids):
+        """Tải, chấm điểm và lưu các email; trả về số email đã ghi"""
+        message_ids = list(dict.fromkeys(message_ids))
+        chunks = [message_ids[i:i + self.chunk_size] for i in range(0, len(message_ids), self.chunk_size)]
+        if not chunks:
+            return 0
+
+        self._cancelled.clear()
+        results = queue.Queue(maxsize=self.queue_size)
+        stored = 0
+        pending_chunks = len(chunks)
+        workers = min(self.concurrency, len(chunks))
+        print(f"[INFO] Tải {len(message_ids)} email bằng {workers} luồng")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="GmailFetch") as pool:
+            for chunk in chunks:
+                pool.submit(self._fetch_chunk, chunk, results)
+
+            # Luồng ghi duy nhất: gom đủ một lô (hoặc khi các luồng tải tạm chưa có gì mới) rồi ghi
+            batch = []
+            while pending_chunks:
+                try:
+                    item = results.get(timeout=WRITE_FLUSH_SECONDS if batch else None)
+                except queue.Empty:
+                    item = None
+                if item is _CHUNK_DONE:
+                    pending_chunks -= 1
+                elif item is not None:
+                    batch.append(item)
+                if batch and (len(batch) >= self.write_batch_size or not pending_chunks or item is None):
+                    try:
+                        stored += self._write(batch)
+                    except Exception as e:
+                        print(f"[ERROR] Lỗi khi ghi {len(batch)} email: {e}")
+                    batch = []
+        return stored
@@ -1,5 +1,8 @@
 import sqlite3
 import os
+import json
+import threading
+import time
 
 # Đường dẫn database cần được sửa để luôn tìm thấy đúng file
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
@@ -10,9 +13,16 @@ if not os.path.exists(DB_PATH):
     if not os.path.exists(DB_PATH) and not os.path.exists(os.path.dirname(DB_PATH)):
         # Nếu không tìm thấy, sử dụng đường dẫn mặc định
         DB_PATH = "emails.db"
+# PHISH_DB_PATH cho phép dùng database riêng (kiểm thử, benchmark) thay vì database của ứng dụng
+DB_PATH = os.environ.get('PHISH_DB_PATH') or DB_PATH
 
 print(f"Sử dụng database: {DB_PATH}")
 
+# Ngưỡng điểm spam mặc định (is_spam = spam_score > ngưỡng), có thể đổi trong bảng settings
+DEFAULT_SPAM_THRESHOLD = 0.7
+# Khoảng dưới ngưỡng được tô màu cảnh báo (cam) trên giao diện
+SPAM_WARNING_MARGIN = 0.2
+
 # Hàm helper để tạo kết nối đến database
 def get_db_connection():
     """Tạo và trả về kết nối đến database"""
@@ -43,7 +53,13 @@ def init_db():
                 is_read INTEGER DEFAULT 0,
                 spam_score REAL DEFAULT 0.0,
                 is_spam INTEGER DEFAULT 0,
-                is_deleted INTEGER DEFAULT 0
+                is_deleted INTEGER DEFAULT 0,
+                spam_model_version TEXT,
+                spam_override INTEGER,
+                has_body INTEGER DEFAULT 1,
+                body_html TEXT,
+                attachments TEXT,
+                sender_authenticated INTEGER DEFAULT 0
             )
         ''')
         print(f"Đã tạo bảng emails trong database {DB_PATH}")
@@ -63,7 +79,13 @@ def init_db():
             'is_read': 'INTEGER DEFAULT 0',
             'spam_score': 'REAL DEFAULT 0.0',
             'is_spam': 'INTEGER DEFAULT 0',
-            'is_deleted': 'INTEGER DEFAULT 0'
+            'is_deleted': 'INTEGER DEFAULT 0',
+            'spam_model_version': 'TEXT',
+            'spam_override': 'INTEGER',
+            'has_body': 'INTEGER DEFAULT 1',
+            'body_html': 'TEXT',
+            'attachments': 'TEXT',
+            'sender_authenticated': 'INTEGER DEFAULT 0'
         }
         
         for col_name, col_type in required_columns.items():
@@ -71,6 +93,43 @@ def init_db():
                 cursor.execute(f"ALTER TABLE emails ADD COLUMN {col_name} {col_type}")
                 print(f"Đã thêm cột {col_name} vào bảng emails")
     
+    # Bảng cache điểm spam theo nội dung (khóa: hash văn bản + loại + phiên bản model)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spam_score_cache (
+            text_hash TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            model_version TEXT NOT NULL,
+            score REAL NOT NULL,
+            keywords TEXT,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (text_hash, kind, model_version)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_spam_score_cache_last_used ON spam_score_cache (last_used)")
+
+    # Thiết lập dạng khóa-giá trị (ví dụ ngưỡng spam)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+    # Chỉ số cho phân loại lại theo ngưỡng: chỉ gồm email không bị người dùng ghi đè
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_emails_auto_spam_score ON emails (spam_score) WHERE spam_override IS NULL"
+    )
+
+    # Vị trí đã chấm lại (theo id) của công việc chấm điểm lại cho từng phiên bản model
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_checkpoint (
+            model_version TEXT PRIMARY KEY,
+            last_id TEXT NOT NULL,
+            rescored INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
     print("Khởi tạo database hoàn tất")
@@ -90,8 +149,9 @@ def save_emails_to_db(emails):
         
         cursor.execute('''
             INSERT OR IGNORE INTO emails 
-            (id, thread_id, subject, snippet, from_address, to_address, date, body, is_read, spam_score, is_spam, is_deleted)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (id, thread_id, subject, snippet, from_address, to_address, date, body, is_read, spam_score, is_spam, is_deleted,
+             sender_authenticated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (email["id"], 
               email.get("threadId", ""), 
               email.get("subject", ""), 
@@ -103,42 +163,44 @@ def save_emails_to_db(emails):
               0,  # is_read
               spam_score, 
               is_spam,
-              0   # is_deleted
+              0,  # is_deleted
+              1 if email.get("sender_authenticated") else 0
             ))
     
     conn.commit()
     conn.close()
 
-def update_spam_score(email_id, spam_score, is_spam=None):
-    """Cập nhật điểm spam cho email"""
+def update_spam_score(email_id, spam_score, is_spam=None, model_version=None):
+    """Cập nhật điểm spam cho email (kèm phiên bản model đã chấm điểm)"""
     if not email_id:
         return
         
     # Xác định is_spam dựa trên ngưỡng nếu không được chỉ định
     if is_spam is None:
-        is_spam = 1 if spam_score > 0.7 else 0
-    
+        is_spam = 1 if spam_score > get_spam_threshold() else 0
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    
+
+    # Email đã được người dùng đánh dấu thủ công giữ nguyên is_spam
     cursor.execute('''
-        UPDATE emails SET spam_score = ?, is_spam = ? WHERE id = ?
-    ''', (spam_score, is_spam, email_id))
+        UPDATE emails SET spam_score = ?, is_spam = COALESCE(spam_override, ?), spam_model_version = ? WHERE id = ?
+    ''', (spam_score, is_spam, model_version, email_id))
     
     conn.commit()
     conn.close()
 
 def mark_as_spam(email_id, is_spam=1):
-    """Đánh dấu email là spam hoặc không phải spam"""
+    """Đánh dấu email là spam hoặc không phải spam (ghi đè thủ công, không bị ngưỡng thay đổi)"""
     if not email_id:
         return
-        
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    
+
     cursor.execute('''
-        UPDATE emails SET is_spam = ? WHERE id = ?
-    ''', (is_spam, email_id))
+        UPDATE emails SET is_spam = ?, spam_override = ? WHERE id = ?
+    ''', (is_spam, is_spam, email_id))
     
     conn.commit()
     conn.close()
@@ -154,11 +216,11 @@ def get_emails_from_db(page, limit=20, show_spam=False, show_trash=False):
     cursor = conn.cursor()
 
     if show_trash:
-        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam FROM emails WHERE is_deleted = 1 ORDER BY date DESC LIMIT ? OFFSET ?"
+        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam, has_body FROM emails WHERE is_deleted = 1 ORDER BY date DESC LIMIT ? OFFSET ?"
     elif show_spam:
-        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam FROM emails WHERE is_spam = 1 AND (is_deleted IS NULL OR is_deleted = 0) ORDER BY date DESC LIMIT ? OFFSET ?"
+        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam, has_body FROM emails WHERE is_spam = 1 AND (is_deleted IS NULL OR is_deleted = 0) ORDER BY date DESC LIMIT ? OFFSET ?"
     else:
-        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam FROM emails WHERE is_spam = 0 AND (is_deleted IS NULL OR is_deleted = 0) ORDER BY date DESC LIMIT ? OFFSET ?"
+        query = "SELECT id, from_address, subject, snippet, spam_score, is_spam, has_body FROM emails WHERE is_spam = 0 AND (is_deleted IS NULL OR is_deleted = 0) ORDER BY date DESC LIMIT ? OFFSET ?"
 
     cursor.execute(query, (limit, offset))
     emails = cursor.fetchall()
@@ -170,7 +232,8 @@ def get_emails_from_db(page, limit=20, show_spam=False, show_trash=False):
         "subject": row[2],
         "snippet": row[3],
         "spam_score": row[4],
-        "is_spam": row[5]
+        "is_spam": row[5],
+        "has_body": row[6]
     } for row in emails]
 
 
@@ -188,11 +251,28 @@ def get_total_emails_count(show_spam=False):
     conn.close()
     return total_emails
 
+def get_folder_counts():
+    """Số email trong từng thư mục: {'inbox', 'spam', 'trash'} (một lần quét)"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('''
+            SELECT
+                COALESCE(SUM(is_deleted = 1), 0),
+                COALESCE(SUM(is_spam = 1 AND (is_deleted IS NULL OR is_deleted = 0)), 0),
+                COALESCE(SUM(is_spam = 0 AND (is_deleted IS NULL OR is_deleted = 0)), 0)
+            FROM emails
+        ''').fetchone()
+    finally:
+        conn.close()
+    return {"trash": row[0], "spam": row[1], "inbox": row[2]}
+
 def clear_database():
     """Xóa toàn bộ email khi đăng xuất"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM emails")
+    # Mốc đồng bộ và các email chờ tải lại thuộc về hộp thư vừa đăng xuất
+    cursor.execute("DELETE FROM settings WHERE key IN ('gmail_history_id', 'gmail_pending_message_ids')")
     conn.commit()
     conn.close()
 
@@ -218,30 +298,17 @@ def recreate_database():
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Xóa bảng nếu đã tồn tại
+    # Xóa bảng email (cùng các chỉ số của nó) và vị trí chấm lại vốn trỏ vào các email cũ;
+    # cache điểm theo nội dung và thiết lập vẫn dùng được nên giữ lại
     cursor.execute("DROP TABLE IF EXISTS emails")
-    
-    # Tạo lại bảng với cấu trúc mới
-    cursor.execute('''
-        CREATE TABLE emails (
-            id TEXT PRIMARY KEY,
-            thread_id TEXT,
-            subject TEXT,
-            snippet TEXT,
-            from_address TEXT,
-            to_address TEXT,
-            date TEXT,
-            body TEXT,
-            is_read INTEGER DEFAULT 0,
-            spam_score REAL DEFAULT 0.0,
-            is_spam INTEGER DEFAULT 0,
-            is_deleted INTEGER DEFAULT 0
-        )
-    ''')
+    cursor.execute("DROP TABLE IF EXISTS rescore_checkpoint")
     
     conn.commit()
     conn.close()
     
+    # Tạo lại bảng, chỉ số và các bảng phụ còn thiếu theo cùng một định nghĩa với init_db
+    init_db()
+    
     print(f"Đã xóa và tạo lại database {DB_PATH} với cấu trúc mới.")
     return True
 
@@ -335,6 +402,75 @@ def search_emails_in_db(keyword, target='inbox'):
 
     return result
 
+def get_cached_spam_score(text_hash, kind, model_version):
+    """Lấy điểm spam đã cache, trả về (score, keywords_json) hoặc None.
+
+    Chỉ đọc: thời điểm sử dụng (last_used) do SpamScoreCache gom lại và ghi
+    cùng lần lưu kế tiếp (``touch_cached_spam_scores``).
+    """
+    conn = get_db_connection()
+    try:
+        return conn.execute('''
+            SELECT score, keywords FROM spam_score_cache
+            WHERE text_hash = ? AND kind = ? AND model_version = ?
+        ''', (text_hash, kind, model_version)).fetchone()
+    finally:
+        conn.close()
+
+def touch_cached_spam_scores(touches, cursor=None):
+    """Cập nhật last_used cho các mục [(last_used, text_hash, kind, model_version), ...] trong một lần ghi"""
+    if not touches:
+        return
+    if cursor is not None:
+        cursor.executemany('''
+            UPDATE spam_score_cache SET last_used = MAX(last_used, ?)
+            WHERE text_hash = ? AND kind = ? AND model_version = ?
+        ''', touches)
+        return
+    conn = get_db_connection()
+    try:
+        with conn:
+            touch_cached_spam_scores(touches, conn.cursor())
+    finally:
+        conn.close()
+
+def save_cached_spam_score(text_hash, kind, model_version, score, keywords=None, max_entries=5000, touches=()):
+    """Lưu điểm spam vào cache và loại bỏ các mục ít dùng nhất khi vượt giới hạn.
+
+    ``touches`` là các lần trúng cache đang chờ ghi, được áp dụng trong cùng
+    transaction trước khi loại bỏ mục cũ.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    touch_cached_spam_scores(touches, cursor)
+    cursor.execute('''
+        INSERT OR REPLACE INTO spam_score_cache (text_hash, kind, model_version, score, keywords, last_used)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (text_hash, kind, model_version, score, keywords, time.time()))
+
+    cursor.execute("SELECT COUNT(*) FROM spam_score_cache")
+    overflow = cursor.fetchone()[0] - max_entries
+    if overflow > 0:
+        cursor.execute('''
+            DELETE FROM spam_score_cache WHERE rowid IN (
+                SELECT rowid FROM spam_score_cache ORDER BY last_used ASC LIMIT ?
+            )
+        ''', (overflow,))
+
+    conn.commit()
+    conn.close()
+
+def purge_spam_score_cache(model_version):
+    """Xóa các điểm spam cache được tính bởi phiên bản model khác"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM spam_score_cache WHERE model_version != ?", (model_version,))
+    removed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
 def clear_all_emails():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -345,10 +481,309 @@ def clear_all_emails():
     conn.close()
 
 
+# ============== CHẤM ĐIỂM LẠI KHI MODEL THAY ĐỔI ================
+def count_stale_emails(model_version):
+    """Số email có điểm spam do phiên bản model khác ``model_version`` tạo ra"""
+    conn = get_db_connection()
+    try:
+        return conn.execute(
+            "SELECT COUNT(*) FROM emails WHERE has_body = 1 AND (spam_model_version IS NULL OR spam_model_version != ?)",
+            (model_version,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
 
 
+def get_stale_emails_batch(model_version, after_id='', limit=64):
+    """Lấy tối đa ``limit`` email cần chấm lại có id lớn hơn ``after_id`` (keyset theo id)"""
+    conn = get_db_connection()
+    try:
+        return conn.execute('''
+            SELECT id, from_address, subject, body, sender_authenticated FROM emails
+            WHERE id > ? AND has_body = 1 AND (spam_model_version IS NULL OR spam_model_version != ?)
+            ORDER BY id LIMIT ?
+        ''', (after_id, model_version, limit)).fetchall()
+    finally:
+        conn.close()
+
+
+def get_rescore_checkpoint(model_version):
+    """Trả về (last_id, số email đã chấm lại) của lần chạy trước, hoặc ('', 0)"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT last_id, rescored FROM rescore_checkpoint WHERE model_version = ?", (model_version,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return (row[0], row[1]) if row else ('', 0)
 
 
+def apply_rescored_batch(model_version, updates, last_id, rescored):
+    """Ghi điểm mới của một lô và checkpoint trong cùng một transaction.
 
+    ``updates`` là danh sách (email_id, spam_score, is_spam).
+    """
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE emails SET spam_score = ?, is_spam = COALESCE(spam_override, ?), spam_model_version = ? "
+                "WHERE id = ?",
+                [(score, is_spam, model_version, email_id) for email_id, score, is_spam in updates]
+            )
+            conn.execute('''
+                INSERT OR REPLACE INTO rescore_checkpoint (model_version, last_id, rescored, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (model_version, last_id, rescored, time.time()))
+    finally:
+        conn.close()
+
+
+def clear_rescore_checkpoint(model_version=None):
+    """Xóa checkpoint khi đã chấm lại xong (hoặc toàn bộ nếu không chỉ định phiên bản)"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            if model_version is None:
+                conn.execute("DELETE FROM rescore_checkpoint")
+            else:
+                conn.execute("DELETE FROM rescore_checkpoint WHERE model_version = ?", (model_version,))
+    finally:
+        conn.close()
+
+
+# ============== THIẾT LẬP (BẢNG settings) ================
+def get_setting(key, default=None):
+    """Đọc một thiết lập dạng chuỗi, trả về ``default`` nếu chưa có"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else default
+
+
+def set_setting(key, value):
+    """Ghi một thiết lập (None để xóa)"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            if value is None:
+                conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+    finally:
+        conn.close()
+
+
+# ============== ĐỒNG BỘ THAY ĐỔI TỪ GMAIL ================
+# Nhãn Gmail được phản ánh vào các cột của bảng emails
+LABEL_COLUMNS = {
+    # nhãn: (cột, giá trị khi có nhãn, giá trị khi bỏ nhãn)
+    'TRASH': ('is_deleted', 1, 0),
+    'UNREAD': ('is_read', 0, 1),
+}
+
+
+def get_existing_email_ids(email_ids):
+    """Tập con các id đã có trong database"""
+    email_ids = list(email_ids)
+    existing = set()
+    conn = get_db_connection()
+    try:
+        # Chia nhỏ để không vượt giới hạn số tham số của SQLite
+        for start in range(0, len(email_ids), 500):
+            chunk = email_ids[start:start + 500]
+            existing.update(row[0] for row in conn.execute(
+                f"SELECT id FROM emails WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+    finally:
+        conn.close()
+    return existing
 
 
+def get_all_email_ids():
+    """Id của mọi email đang lưu"""
+    conn = get_db_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM emails")]
+    finally:
+        conn.close()
+
+
+def delete_emails(email_ids):
+    """Xóa hẳn các email đã bị xóa vĩnh viễn trên Gmail; trả về số email đã xóa"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            return conn.executemany("DELETE FROM emails WHERE id = ?", [(i,) for i in email_ids]).rowcount
+    finally:
+        conn.close()
+
+
+def apply_label_changes(label_changes):
+    """Áp dụng thay đổi nhãn Gmail: ``{email_id: {label: True (thêm) / False (bỏ)}}``.
+
+    TRASH -> is_deleted, UNREAD -> is_read; SPAM là người dùng đánh dấu trên
+    Gmail nên được ghi như một lần ``mark_as_spam`` (spam_override).
+    Trả về số email thực sự bị thay đổi (nhãn đã đúng thì không tính).
+    """
+    updates = []
+    for email_id, labels in label_changes.items():
+        for label, added in labels.items():
+            if label in LABEL_COLUMNS:
+                column, when_added, when_removed = LABEL_COLUMNS[label]
+                value = when_added if added else when_removed
+                updates.append((email_id, f"UPDATE emails SET {column} = ? WHERE id = ? AND {column} IS NOT ?",
+                                (value, email_id, value)))
+            elif label == 'SPAM':
+                updates.append((email_id, "UPDATE emails SET is_spam = ?, spam_override = ? "
+                                          "WHERE id = ? AND (is_spam IS NOT ? OR spam_override IS NOT ?)",
+                                (int(added), int(added), email_id, int(added), int(added))))
+
+    changed = set()
+    conn = get_db_connection()
+    try:
+        with conn:
+            for email_id, query, params in updates:
+                if conn.execute(query, params).rowcount:
+                    changed.add(email_id)
+    finally:
+        conn.close()
+    return len(changed)
+
+
+# ============== TẢI NỘI DUNG SAU (ĐỒNG BỘ HAI TẦNG) ================
+def get_email_ids_without_body(email_ids=None, limit=500):
+    """Id các email mới có metadata (chưa tải nội dung), lọc theo ``email_ids`` nếu có"""
+    conn = get_db_connection()
+    try:
+        if email_ids is None:
+            rows = conn.execute(
+                "SELECT id FROM emails WHERE has_body = 0 ORDER BY date DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            email_ids = list(email_ids)
+            rows = []
+            for start in range(0, len(email_ids), 500):
+                chunk = email_ids[start:start + 500]
+                rows.extend(conn.execute(
+                    f"SELECT id FROM emails WHERE has_body = 0 AND id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+# ============== KHO EMAIL CỤC BỘ ================
+# Nội dung đã phân tích (tiêu đề, người gửi, văn bản, HTML, danh sách file đính
+# kèm dạng JSON) được lưu lúc đồng bộ để cửa sổ chi tiết mở ngay, không cần mạng.
+# attachments IS NULL nghĩa là email chưa được lưu đầy đủ (chỉ có metadata, hoặc
+# được lưu trước khi có kho này).
+def get_stored_email_content(email_id):
+    """Nội dung email từ database, hoặc None nếu chưa được lưu đầy đủ"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT subject, from_address, body, body_html, attachments FROM emails "
+            "WHERE id = ? AND has_body = 1 AND attachments IS NOT NULL",
+            (email_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        "subject": row[0] or "No Subject",
+        "sender": row[1] or "Unknown Sender",
+        "body": row[2] or "",
+        "body_html": row[3] or "",
+        "attachments": json.loads(row[4])
+    }
+
+
+def save_email_content(email_id, body, body_html, attachments):
+    """Bổ sung nội dung cho email đã có (không chấm điểm lại)"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE emails SET body = ?, body_html = ?, attachments = ? WHERE id = ?",
+                (body, body_html, json.dumps(attachments), email_id)
+            )
+    finally:
+        conn.close()
+
+
+# ============== NGƯỠNG SPAM ================
+_spam_threshold = None
+_spam_threshold_lock = threading.Lock()
+
+
+def get_spam_threshold():
+    """Ngưỡng điểm spam đang dùng (đọc từ bảng settings một lần rồi giữ trong bộ nhớ)"""
+    global _spam_threshold
+    if _spam_threshold is None:
+        with _spam_threshold_lock:
+            if _spam_threshold is None:
+                _spam_threshold = float(get_setting('spam_threshold', DEFAULT_SPAM_THRESHOLD))
+    return _spam_threshold
+
+
+def set_spam_threshold(threshold):
+    """Lưu ngưỡng mới và phân loại lại is_spam ngay, không chấm điểm lại.
+
+    Chỉ các email có điểm nằm giữa ngưỡng cũ và mới (và không bị người dùng
+    ghi đè) có thể đổi nhãn, nên câu UPDATE chỉ quét một khoảng của chỉ số
+    idx_emails_auto_spam_score. Trả về danh sách id các email chưa xóa đã
+    chuyển giữa Hộp thư đến và Thư rác (để giao diện cập nhật số đếm).
+    """
+    global _spam_threshold
+    threshold = float(threshold)
+    if not 0.0 < threshold < 1.0:
+        raise ValueError(f"Ngưỡng spam phải nằm trong khoảng (0, 1): {threshold}")
+
+    with _spam_threshold_lock:
+        old_threshold = _spam_threshold
+        conn = get_db_connection()
+        try:
+            with conn:
+                if old_threshold is None:
+                    row = conn.execute("SELECT value FROM settings WHERE key = 'spam_threshold'").fetchone()
+                    old_threshold = float(row[0]) if row else DEFAULT_SPAM_THRESHOLD
+                conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('spam_threshold', ?)", (repr(threshold),)
+                )
+                low, high = min(old_threshold, threshold), max(old_threshold, threshold)
+                changed = [row[0] for row in conn.execute('''
+                    SELECT id FROM emails INDEXED BY idx_emails_auto_spam_score
+                    WHERE spam_override IS NULL AND spam_score > ? AND spam_score <= ?
+                    AND is_spam != CASE WHEN spam_score > ? THEN 1 ELSE 0 END
+                    AND (is_deleted IS NULL OR is_deleted = 0)
+                ''', (low, high, threshold))]
+                conn.execute('''
+                    UPDATE emails SET is_spam = CASE WHEN spam_score > ? THEN 1 ELSE 0 END
+                    WHERE spam_override IS NULL AND spam_score > ? AND spam_score <= ?
+                    AND is_spam != CASE WHEN spam_score > ? THEN 1 ELSE 0 END
+                ''', (threshold, low, high, threshold))
+        finally:
+            conn.close()
+        _spam_threshold = threshold
+    print(f"[INFO] Ngưỡng spam {old_threshold} -> {threshold}: {len(changed)} email đổi nhãn")
+    return changed
+
+
+def reclassify_all_emails():
+    """Đặt lại is_spam cho mọi email không bị ghi đè theo ngưỡng hiện tại (một câu UPDATE)"""
+    threshold = get_spam_threshold()
+    conn = get_db_connection()
+    try:
+        with conn:
+            cursor = conn.execute('''
+                UPDATE emails SET is_spam = CASE WHEN spam_score > ? THEN 1 ELSE 0 END
+                WHERE spam_override IS NULL AND is_spam != CASE WHEN spam_score > ? THEN 1 ELSE 0 END
+            ''', (threshold, threshold))
+            return cursor.rowcount
+    finally:
+        conn.close()
@@ -0,0 +1,242 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+# ============== BỘ ĐO HIỆU NĂNG SPAM DETECTOR ================
+# Chạy offline, không cần Gmail API:
+#   python -m app.detector_benchmark --size 500 --output bench.json
+#   python -m app.detector_benchmark --baseline bench.json --max-regression 0.1
+# Đo số email/giây, độ trễ p50/p95/p99 và bộ nhớ của từng giai đoạn:
+# text_preprocessor, numericalize, forward của LSTMModel và keyword_based_prediction
+# (cùng preprocess_text gốc nếu máy có NLTK và dữ liệu punkt). Bộ so khớp từ khóa
+# Aho–Corasick (keyword_scan) được đo cạnh cách quét cũ, mỗi cụm từ một lần
+# ``phrase in text`` (keyword_scan_legacy), kèm số văn bản cho kết quả khác nhau.
+# Bộ nhớ là RSS lấy mẫu trong lúc giai đoạn chạy (so với lúc bắt đầu giai đoạn),
+# không phải mức cao nhất trong cả đời tiến trình. Không đụng tới database.
+
+RSS_SAMPLE_INTERVAL = 0.002
+
+
+def current_rss_mb():
+    """RSS hiện tại của tiến trình (MB) đọc từ /proc/self/statm, None nếu hệ điều hành không hỗ trợ"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RssSampler:
+    """Lấy mẫu RSS trong luồng nền khi một giai đoạn đang chạy.
+
+    Cho biết mức RSS tăng thêm (cuối giai đoạn và đỉnh) so với lúc bắt đầu
+    giai đoạn, nên giai đoạn sau không thừa hưởng đỉnh của giai đoạn trước.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_mb = self.end_mb = self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and rss > self.peak_mb:
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        gc.collect()
+        self.start_mb = self.peak_mb = current_rss_mb()
+        if self.start_mb is not None:
+            self._thread = threading.Thread(target=self._run, name="RssSampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            self.end_mb = current_rss_mb()
+
+    def stats(self):
+        if self.start_mb is None:
+            return {"rss_start_mb": None, "rss_delta_mb": None, "peak_rss_delta_mb": None}
+        return {"rss_start_mb": self.start_mb, "rss_delta_mb": self.end_mb - self.start_mb,
+                "peak_rss_delta_mb": self.peak_mb - self.start_mb}
+
+
+def seed_texts():
+    """Văn bản gốc: các email mẫu spam-test-* và tập hiệu chuẩn của SpamDetector"""
+    from app.sample_emails import sample_email_texts
+    from app.spam_detector import CALIBRATION_TEXTS
+
+    return sample_email_texts() + list(CALIBRATION_TEXTS)
+
+
+def build_corpus(size, mean_words=200, sigma=0.8, seed=13, seeds=None):
+    """Sinh tập email tổng hợp với độ dài (số từ) theo phân phối log-normal"""
+    import math
+
+    rng = random.Random(seed)
+    words = [text.split() for text in (seeds or seed_texts())]
+    mu = math.log(max(mean_words, 1)) - sigma ** 2 / 2
+    corpus = []
+    for _ in range(size):
+        length = max(1, int(rng.lognormvariate(mu, sigma)))
+        source = rng.choice(words)
+        start = rng.randrange(len(source))
+        # Lặp lại văn bản gốc từ vị trí ngẫu nhiên cho đến khi đủ độ dài
+        corpus.append(' '.join(source[(start + i) % len(source)] for i in range(length)))
+    return corpus
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(function, items):
+    """Gọi ``function`` cho từng phần tử, trả về kết quả và thống kê thời gian"""
+    latencies = []
+    results = []
+    with RssSampler() as memory:
+        start = time.perf_counter()
+        for item in items:
+            begin = time.perf_counter()
+            results.append(function(item))
+            latencies.append(time.perf_counter() - begin)
+        total = time.perf_counter() - start
+
+    latencies.sort()
+    stats = {
+        "count": len(items),
+        "emails_per_sec": len(items) / total if total > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+    stats.update(memory.stats())
+    return results, stats
+
+
+def legacy_keyword_scan(engine, text):
+    """Cách quét trước bộ Aho–Corasick: một lần ``phrase in text`` cho mỗi rule (chỉ để so sánh)"""
+    return {index for index, rule in enumerate(engine.rules) if rule.phrase and rule.phrase in text}
+
+
+def benchmark_keyword_scan(corpus, engine=None):
+    """Đo KeywordEngine.matched_rules so với cách quét cũ trên cùng văn bản chữ thường"""
+    from app.keyword_engine import get_keyword_engine
+
+    engine = engine or get_keyword_engine()
+    lowered = [text.lower() for text in corpus]
+    stages = {}
+    matched, stages["keyword_scan"] = measure(engine.matched_rules, lowered)
+    legacy, stages["keyword_scan_legacy"] = measure(lambda text: legacy_keyword_scan(engine, text), lowered)
+    legacy_rate = stages["keyword_scan_legacy"]["emails_per_sec"]
+    stages["keyword_scan"]["speedup_vs_legacy"] = (
+        stages["keyword_scan"]["emails_per_sec"] / legacy_rate if legacy_rate else None)
+    stages["keyword_scan"]["mismatches_vs_legacy"] = sum(a != b for a, b in zip(matched, legacy))
+    return stages
+
+
+def run_benchmark(corpus, detector=None):
+    """Đo từng giai đoạn của SpamDetector trên ``corpus``"""
+    from app.nltk_resources import reference_tokenizer_available
+    from app.spam_detector import get_spam_detector
+    from app.text_preprocessor import get_text_preprocessor
+
+    detector = detector or get_spam_detector()
+    stages = {}
+
+    # preprocess_text gốc cần NLTK + punkt; bộ tiền xử lý dùng khi suy luận thì không
+    if reference_tokenizer_available():
+        from app.spam_detector import preprocess_text
+        _, stages["preprocess_text"] = measure(preprocess_text, corpus)
+    tokens, stages["text_preprocessor"] = measure(get_text_preprocessor().tokenize, corpus)
+
+    if detector.vocab is not None:
+        token2idx, unk_index = detector.vocab.token_index()
+        lookup = token2idx.get
+        indices, stages["numericalize"] = measure(
+            lambda sequence: [lookup(token, unk_index) for token in sequence[:detector.max_len]], tokens)
+
+        if detector.model is not None:
+            indices = [sequence for sequence in indices if sequence]
+            _, stages["lstm_forward"] = measure(lambda sequence: detector._score_indices([sequence]), indices)
+
+    _, stages["keyword_based_prediction"] = measure(detector.keyword_based_prediction, corpus)
+    stages.update(benchmark_keyword_scan(corpus))
+    return stages
+
+
+def check_regression(results, baseline, max_regression):
+    """Trả về danh sách giai đoạn có thông lượng giảm quá ``max_regression`` so với baseline"""
+    failures = []
+    for stage, stats in baseline.get("stages", {}).items():
+        current = results["stages"].get(stage)
+        if not current or not stats.get("emails_per_sec"):
+            continue
+        drop = 1 - current["emails_per_sec"] / stats["emails_per_sec"]
+        if drop > max_regression:
+            failures.append((stage, drop))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng SpamDetector")
+    parser.add_argument("--size", type=int, default=500, help="Số email tổng hợp")
+    parser.add_argument("--mean-words", type=int, default=200, help="Số từ trung bình mỗi email")
+    parser.add_argument("--sigma", type=float, default=0.8, help="Độ phân tán log-normal của độ dài")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File JSON kết quả lần chạy trước để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Tỉ lệ giảm thông lượng tối đa cho phép so với baseline")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.size, args.mean_words, args.sigma, args.seed)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"size": args.size, "mean_words": args.mean_words, "sigma": args.sigma, "seed": args.seed},
+        "stages": run_benchmark(corpus),
+    }
+    # Histogram theo giai đoạn do app.profiling thu thập trong lúc chạy
+    from app.profiling import get_profiler
+    results["profile"] = get_profiler().snapshot()
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = check_regression(results, baseline, args.max_regression)
+        for stage, drop in failures:
+            print(f"[ERROR] {stage}: thông lượng giảm {drop:.1%} so với baseline")
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
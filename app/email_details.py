@@ -2,7 +2,7 @@ from PyQt6.QtWidgets import QFrame, QWidget, QVBoxLayout, QLabel, QPushButton, Q
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QColor, QPalette
 from app.fetch_emails import get_email_content, download_attachment
-from app.database import get_email_spam_score
+from app.database import get_email_spam_score, get_spam_threshold, SPAM_WARNING_MARGIN
 from app.reply_forward_dialog import ReplyForwardDialog 
 
 class EmailDetailsWindow(QWidget):
@@ -42,12 +42,15 @@ class EmailDetailsWindow(QWidget):
         spam_layout = QHBoxLayout()
 
         spam_percent = int(self.spam_score * 100)
+        # Mức đỏ/cam theo ngưỡng spam hiện tại
+        spam_limit = get_spam_threshold() * 100
+        warning_limit = spam_limit - SPAM_WARNING_MARGIN * 100
         spam_text = QLabel(f"⚠️ Mức độ lừa đảo: {spam_percent}%")
         
         # Đổi màu chữ dựa vào mức độ spam
-        if spam_percent > 70:
+        if spam_percent > spam_limit:
             spam_text.setStyleSheet("color: red; font-weight: bold")
-        elif spam_percent > 50:
+        elif spam_percent > warning_limit:
             spam_text.setStyleSheet("color: orange; font-weight: bold")
         else:
             spam_text.setStyleSheet("color: green;")
@@ -59,9 +62,9 @@ class EmailDetailsWindow(QWidget):
         spam_progress.setRange(0, 100)
         spam_progress.setValue(spam_percent)
 
-        if spam_percent > 70:
+        if spam_percent > spam_limit:
             spam_progress.setStyleSheet("QProgressBar::chunk { background-color: red; }")
-        elif spam_percent > 50:
+        elif spam_percent > warning_limit:
             spam_progress.setStyleSheet("QProgressBar::chunk { background-color: orange; }")
         else:
             spam_progress.setStyleSheet("QProgressBar::chunk { background-color: green; }")
@@ -83,7 +86,9 @@ class EmailDetailsWindow(QWidget):
         frame_layout = QVBoxLayout(self.body_frame)
 
         self.body_text = QTextEdit(self.body_frame)
-        body_content = self.email_content.get("body", "Không có nội dung")
+        # Ưu tiên hiển thị phần HTML; với email chỉ có HTML, "body" là văn bản rút ra để chấm điểm
+        body_content = (self.email_content.get("body_html") or self.email_content.get("body")
+                        or "Không có nội dung")
         
         # Nếu email có file đính kèm
         attachments = self.email_content.get("attachments", [])
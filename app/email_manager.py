@@ -1,15 +1,16 @@
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, 
     QPushButton, QLabel, QHBoxLayout, QTabWidget, QMessageBox, QMenu,
-    QListWidget, QListWidgetItem, QSplitter, QStackedWidget, QFrame, QHeaderView, QLineEdit
+    QListWidget, QListWidgetItem, QSplitter, QStackedWidget, QFrame, QHeaderView, QLineEdit, QDoubleSpinBox
 )
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import QLabel
-from PyQt6.QtCore import Qt, QPoint, QSize
+from PyQt6.QtCore import Qt, QPoint, QSize, QObject, pyqtSignal
 from PyQt6.QtGui import QColor, QIcon, QFont
 import sys
 import os
 from app.database import get_emails_from_db, clear_database, get_total_emails_count, mark_as_spam, mark_as_restored
+from app.database import get_folder_counts, get_spam_threshold, set_spam_threshold, SPAM_WARNING_MARGIN
 from app.fetch_emails import get_latest_emails
 from app.email_details import EmailDetailsWindow
 from app.send_email import SendEmailWindow
@@ -26,6 +27,18 @@ else:
 logo_path = os.path.join(BASE_DIR, "assets", "gmail_logo.png")
 
 
+class RescoreSignals(QObject):
+    """Chuyển tiến độ chấm điểm lại từ luồng nền về luồng giao diện"""
+    model_ready = pyqtSignal(bool)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, bool)
+
+
+class BodySignals(QObject):
+    """Báo về luồng giao diện các email vừa được tải nội dung và chấm điểm"""
+    stored = pyqtSignal(list)
+
+
 class EmailManagerWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -92,9 +105,25 @@ class EmailManagerWindow(QWidget):
         trash_item = QListWidgetItem("🗑️ Thùng rác")
         trash_item.setData(Qt.ItemDataRole.UserRole, "trash")
         self.sidebar.addItem(trash_item)
+        self.folder_items = {"inbox": inbox_item, "spam": spam_item, "trash": trash_item}
+        self.folder_titles = {"inbox": "📥 Hộp thư đến", "spam": "🚫 Thư rác", "trash": "🗑️ Thùng rác"}
+        self.folder_counts = {}
 
         self.sidebar.currentItemChanged.connect(self.on_sidebar_item_changed)
         sidebar_layout.addWidget(self.sidebar)
+
+        # ==== Ngưỡng thư rác (đổi nhãn ngay, không chấm điểm lại) ====
+        threshold_label = QLabel("🎚️ Ngưỡng thư rác")
+        threshold_label.setStyleSheet("font-size: 12px; color: #555; padding-top: 6px;")
+        sidebar_layout.addWidget(threshold_label)
+        self.threshold_spin = QDoubleSpinBox()
+        self.threshold_spin.setRange(0.05, 0.95)
+        self.threshold_spin.setSingleStep(0.05)
+        self.threshold_spin.setDecimals(2)
+        self.threshold_spin.setValue(get_spam_threshold())
+        self.threshold_spin.setKeyboardTracking(False)  # Chỉ áp dụng khi gõ xong
+        self.threshold_spin.valueChanged.connect(self.on_spam_threshold_changed)
+        sidebar_layout.addWidget(self.threshold_spin)
         sidebar_layout.addStretch()
 
         # ==== Hiển thị tài khoản ====
@@ -108,6 +137,14 @@ class EmailManagerWindow(QWidget):
         """)
         sidebar_layout.addWidget(self.account_label)
 
+        # ==== Tiến độ chấm điểm lại khi model thay đổi ====
+        self.rescore_label = QLabel("")
+        self.rescore_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.rescore_label.setWordWrap(True)
+        self.rescore_label.setStyleSheet("font-size: 12px; color: #1976d2; padding: 4px;")
+        self.rescore_label.hide()
+        sidebar_layout.addWidget(self.rescore_label)
+
         # ==== Gói sidebar vào QWidget rồi add vào main_layout ====
         sidebar_container = QWidget()
         sidebar_container.setLayout(sidebar_layout)
@@ -169,6 +206,14 @@ class EmailManagerWindow(QWidget):
         self.spam_table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.spam_table.customContextMenuRequested.connect(self.show_spam_email_context_menu)
 
+        # ==== Tải nội dung email nền (đồng bộ hai tầng) ====
+        from app.body_downloader import get_body_downloader
+        self.body_signals = BodySignals(self)
+        self.body_signals.stored.connect(self.on_bodies_stored)
+        self.body_downloader = get_body_downloader()
+        self.body_downloader.on_stored = self.body_signals.stored.emit
+        self.body_downloader.resume_pending()
+
         # ==== Load email mặc định ====
         self.sidebar.setCurrentRow(0)
         from app.database import get_total_emails_count
@@ -181,7 +226,80 @@ class EmailManagerWindow(QWidget):
 
         self.load_emails(is_spam=False)
 
+        # ==== Chấm điểm lại nền sau khi model AI nạp xong ====
+        self.rescoring_job = None
+        self.rescore_signals = RescoreSignals(self)
+        self.rescore_signals.model_ready.connect(self.start_rescoring)
+        self.rescore_signals.progress.connect(self.on_rescore_progress)
+        self.rescore_signals.finished.connect(self.on_rescore_finished)
+        from app.model_warmup import start_model_warmup
+        start_model_warmup().add_done_callback(self.rescore_signals.model_ready.emit)
+
+    def start_rescoring(self, model_loaded=True):
+        """Chạy công việc chấm điểm lại các email có điểm do model cũ tạo ra"""
+        if not model_loaded or (self.rescoring_job and self.rescoring_job.running):
+            return
+        from app.rescoring import RescoringJob
+        self.rescoring_job = RescoringJob(
+            on_progress=self.rescore_signals.progress.emit,
+            on_finished=self.rescore_signals.finished.emit,
+        ).start()
+
+    def on_rescore_progress(self, done, total):
+        self.rescore_label.setText(f"🔁 Đang chấm lại điểm AI: {done}/{total}")
+        self.rescore_label.show()
+
+    def on_rescore_finished(self, rescored, cancelled):
+        self.rescore_label.hide()
+        if rescored and not cancelled:
+            self.reload_current_page()
+
+    def on_bodies_stored(self, email_ids):
+        """Nội dung vừa tải xong có điểm spam mới: tải lại trang nếu có email đang hiển thị"""
+        shown = getattr(self, ("current_normal_emails", "current_spam_emails", "current_trash_emails")[
+            self.stack.currentIndex()], [])
+        email_ids = set(email_ids)
+        if any(email["id"] in email_ids for email in shown):
+            self.reload_current_page()
+        else:
+            self.update_folder_counts()
+
+    def reload_current_page(self, refresh_counts=True):
+        """Tải lại bảng của mục đang chọn"""
+        index = self.stack.currentIndex()
+        if index == 1:
+            self.load_emails(is_spam=True, refresh_counts=refresh_counts)
+        elif index == 2:
+            self.load_emails(is_trash=True, refresh_counts=refresh_counts)
+        else:
+            self.load_emails(is_spam=False, refresh_counts=refresh_counts)
+
+    def update_folder_counts(self, counts=None):
+        """Hiển thị số email cạnh từng mục sidebar (đếm lại từ database nếu không truyền vào)"""
+        self.folder_counts = counts if counts is not None else get_folder_counts()
+        for folder, item in self.folder_items.items():
+            item.setText(f"{self.folder_titles[folder]} ({self.folder_counts.get(folder, 0)})")
+
+    def on_spam_threshold_changed(self, value):
+        """Đổi ngưỡng: phân loại lại trong database rồi chỉ cập nhật phần giao diện bị ảnh hưởng"""
+        old_threshold = get_spam_threshold()
+        try:
+            moved = set_spam_threshold(value)
+        except Exception as e:
+            print(f"[ERROR] Không thể đổi ngưỡng spam: {e}")
+            return
+
+        # Tăng ngưỡng: email chuyển từ Thư rác sang Hộp thư đến, giảm ngưỡng thì ngược lại
+        if moved and self.folder_counts:
+            delta = len(moved) if value < old_threshold else -len(moved)
+            counts = dict(self.folder_counts)
+            counts["spam"] += delta
+            counts["inbox"] -= delta
+            self.update_folder_counts(counts)
 
+        # Màu điểm trên trang hiện tại phụ thuộc ngưỡng; trang Thùng rác không đổi
+        if self.stack.currentIndex() != 2:
+            self.reload_current_page(refresh_counts=False)
 
     def setup_inbox_page(self):
         layout = QVBoxLayout()
@@ -531,8 +649,13 @@ class EmailManagerWindow(QWidget):
         self.load_emails(is_trash=True)  # Refresh Trash page
 
 
-    def load_emails(self, is_spam=False, is_trash=False):
+    def load_emails(self, is_spam=False, is_trash=False, refresh_counts=True):
         """ Hiển thị email theo trang và loại (spam/normal) """
+        if refresh_counts:
+            self.update_folder_counts()
+        # Mức màu theo ngưỡng spam hiện tại
+        spam_limit = get_spam_threshold() * 100
+        warning_limit = spam_limit - SPAM_WARNING_MARGIN * 100
         if is_spam:
             # Load email spam
             self.current_spam_emails = get_emails_from_db(self.spam_page_num, show_spam=True)
@@ -547,11 +670,11 @@ class EmailManagerWindow(QWidget):
                 
                 # Hiển thị phần trăm spam
                 spam_percent = int(email["spam_score"] * 100)
-                spam_item = QTableWidgetItem(f"{spam_percent}%")
+                spam_item = QTableWidgetItem(f"{spam_percent}%" if email["has_body"] else "⏳")
 
-                if spam_percent > 70:
+                if spam_percent > spam_limit:
                     spam_item.setForeground(QColor(255, 0, 0))  # Đỏ đậm
-                elif spam_percent > 50:
+                elif spam_percent > warning_limit:
                     spam_item.setForeground(QColor(255, 140, 0))  # Cam
                 else:
                     spam_item.setForeground(QColor(34, 139, 34))  # Xanh lá đậm
@@ -594,7 +717,7 @@ class EmailManagerWindow(QWidget):
                 self.trash_table.setItem(row, 2, QTableWidgetItem(snippet))
                 
                 spam_percent = int(email["spam_score"] * 100)
-                spam_item = QTableWidgetItem(f"{spam_percent}%")
+                spam_item = QTableWidgetItem(f"{spam_percent}%" if email["has_body"] else "⏳")
                 spam_item.setForeground(QColor(128, 128, 128))
                 self.trash_table.setItem(row, 3, spam_item)
                 
@@ -632,10 +755,10 @@ class EmailManagerWindow(QWidget):
                 
                 # Hiển thị phần trăm spam
                 spam_percent = int(email["spam_score"] * 100)
-                spam_item = QTableWidgetItem(f"-{spam_percent}%")
+                spam_item = QTableWidgetItem(f"-{spam_percent}%" if email["has_body"] else "⏳")
                 
                 # Đổi màu theo mức độ spam
-                if spam_percent > 50:
+                if spam_percent > warning_limit:
                     spam_item.setForeground(QColor(255, 165, 0))  # Màu cam
                 else:
                     spam_item.setForeground(QColor(0, 128, 0))  # Màu xanh lá
@@ -664,6 +787,14 @@ class EmailManagerWindow(QWidget):
             self.normal_table.resizeColumnsToContents()
             print(f"Đang load email: Spam={is_spam}, Trash={is_trash}")
 
+        # Ưu tiên tải nội dung của các email đang hiển thị mà mới có metadata
+        shown = self.current_spam_emails if is_spam else self.current_trash_emails if is_trash \
+            else self.current_normal_emails
+        pending = [email["id"] for email in shown if not email["has_body"]]
+        if pending:
+            from app.body_downloader import get_body_downloader
+            get_body_downloader().prioritize(pending)
+
 
     def open_email_details(self, row, col, is_spam=False, is_trash=False):
         """ Mở màn hình xem chi tiết email khi người dùng nhấp vào """
@@ -798,20 +929,30 @@ class EmailManagerWindow(QWidget):
         from app.fetch_emails import refresh_emails_safely
         from PyQt6.QtWidgets import QMessageBox
 
-        print("🔄 Đang kiểm tra email mới trên Gmail API...")
-        num_added = refresh_emails_safely(50)
+        print("🔄 Đang kiểm tra thay đổi trên Gmail API...")
+        result = refresh_emails_safely(50)
 
-        if num_added > 0:
-            QMessageBox.information(self, "✅ Đã làm mới hộp thư", f"Đã thêm {num_added} email mới.")
+        if result.changed:
+            details = [f"Đã thêm {result.added} email mới."]
+            if result.deleted:
+                details.append(f"Đã xóa {result.deleted} email không còn trên Gmail.")
+            if result.labels_changed:
+                details.append(f"Đã cập nhật trạng thái {result.labels_changed} email.")
+            QMessageBox.information(self, "✅ Đã làm mới hộp thư", "\n".join(details))
         else:
             QMessageBox.information(self, "📬 Hộp thư đã cập nhật", "Không có email mới.")
 
-        self.load_emails(is_spam=False)
+        self.reload_current_page()
 
     def logout(self):
         """ Đăng xuất, xóa database và token.json """
         from app.login_window import LoginWindow  # Import LoginWindow để quay lại màn hình đăng nhập
 
+        # Dừng chấm điểm lại trước khi xóa dữ liệu
+        if self.rescoring_job:
+            self.rescoring_job.cancel(wait=True)
+        self.body_downloader.clear()
+
         # Xóa database
         clear_database()
         
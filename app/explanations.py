@@ -0,0 +1,134 @@
+import html
+
+from app.keyword_engine import get_keyword_engine
+from app.score_cache import get_score_cache
+from app.text_preprocessor import get_text_preprocessor
+
+# ============== GIẢI THÍCH ĐIỂM SPAM CHO CỬA SỔ CHI TIẾT ================
+# Giải thích đúng văn bản bộ chấm điểm nhận (scoring_text: From, Subject, nội
+# dung). Với model LSTM: occlusion theo từng token trên mọi cửa sổ mà model
+# chấm (email dài có tới ba cửa sổ). Mỗi token khác nhau được thay bằng <unk>
+# ở mọi vị trí trong mọi cửa sổ; điểm gộp giảm bao nhiêu thì token đóng góp bấy
+# nhiêu. Bản gốc và tất cả biến thể được chấm trong MỘT lần forward theo lô.
+# Khi model chưa nạp xong thì dùng các từ khóa khớp (không cache, rẻ hơn một
+# lần đọc cache). Kết quả occlusion được cache theo nội dung email và phiên
+# bản model; vị trí tô sáng lấy từ offset của bộ tách token (hoặc của bộ so
+# khớp từ khóa), không tìm lại bằng regex.
+
+# Số token khác nhau tối đa được che (mỗi token thêm một dòng mỗi cửa sổ vào lô forward)
+MAX_OCCLUSION_FEATURES = 64
+# Bỏ qua token có đóng góp nhỏ hơn mức này
+MIN_ATTRIBUTION = 0.01
+
+
+def model_available(detector):
+    return getattr(detector, 'model', None) is not None and getattr(detector, 'vocab', None) is not None
+
+
+def occlusion_attribution(detector, text, max_features=MAX_OCCLUSION_FEATURES):
+    """Trả về (điểm gốc, [(token, đóng góp), ...]) sắp theo đóng góp giảm dần.
+
+    Đóng góp dương nghĩa là token kéo điểm về phía spam. Điểm là điểm gộp của
+    các cửa sổ (``detector._aggregate``), chưa trộn với bộ chấm từ khóa.
+    """
+    windows = detector._encode_windows(text)
+    if not windows:
+        return 0.0, []
+    token2idx, unk_index = detector.vocab.token_index()
+
+    # Chỉ che các từ có trong từ điển (che <unk> hay dấu câu không có ý nghĩa),
+    # theo thứ tự xuất hiện đầu tiên trong các cửa sổ
+    candidates = dict.fromkeys(index for window in windows for index in window if index != unk_index)
+    names = {index: token for token, index in token2idx.items() if index in candidates}
+    features = [index for index in candidates if names.get(index, '')[:1].isalpha()][:max_features]
+
+    variants = list(windows)
+    for feature in features:
+        variants.extend([unk_index if index == feature else index for index in window] for window in windows)
+
+    probabilities = detector._score_indices(variants)
+    count = len(windows)
+    base = detector._aggregate(probabilities[:count])
+    attributions = []
+    for position, feature in enumerate(features, start=1):
+        contribution = base - detector._aggregate(probabilities[position * count:(position + 1) * count])
+        if contribution >= MIN_ATTRIBUTION:
+            attributions.append((names[feature], contribution))
+    attributions.sort(key=lambda item: item[1], reverse=True)
+    return base, attributions
+
+
+def occlusion_spans(detector, text, terms):
+    """Vị trí (start, end) trong ``text`` của mọi token có cùng index với các token được giải thích"""
+    token2idx, unk_index = detector.vocab.token_index()
+    targets = {token2idx.get(term, unk_index) for term in terms} - {unk_index}
+    if not targets:
+        return []
+    return [(start, end) for token, start, end in get_text_preprocessor().iter_token_spans(text)
+            if token2idx.get(token, unk_index) in targets]
+
+
+def keyword_spans(text, keywords):
+    """Vị trí (start, end) trong ``text`` của các cụm từ khóa đã khớp, lấy từ bộ so khớp từ khóa"""
+    keywords = set(keywords)
+    if not keywords:
+        return []
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Giữ nguyên ký tự có chữ thường dài hơn một ký tự để offset khớp với văn bản gốc
+        lowered = ''.join(char if len(char.lower()) != 1 else char.lower() for char in text)
+    engine = get_keyword_engine()
+    return [(start, end) for index, start, end in engine.find_matches(lowered)
+            if engine.rules[index].kind == 'keyword' and engine.rules[index].phrase in keywords]
+
+
+def explain_text(detector, text):
+    """Giải thích cho một văn bản (kết quả occlusion có cache).
+
+    Trả về (loại, [(cụm từ, đóng góp hoặc None), ...], [(start, end), ...]);
+    loại là 'occlusion' khi dùng model, 'keywords' khi chỉ có bộ chấm từ khóa.
+    Danh sách cuối là vị trí các cụm từ đó trong ``text`` để tô sáng.
+    """
+    if not model_available(detector):
+        _, keywords = detector.keyword_based_prediction(text)
+        keywords = list(dict.fromkeys(keywords))
+        return 'keywords', [(keyword, None) for keyword in keywords], keyword_spans(text, keywords)
+
+    cache = get_score_cache()
+    model_version = detector.model_version
+    cached = cache.get(text, 'occlusion', model_version)
+    if cached is not None:
+        attributions = [tuple(item) for item in cached[1]]
+    else:
+        score, attributions = occlusion_attribution(detector, text)
+        cache.put(text, 'occlusion', model_version, score, [list(item) for item in attributions])
+    return 'occlusion', attributions, occlusion_spans(detector, text, [term for term, _ in attributions])
+
+
+def spans_in(spans, start, end):
+    """Các span nằm trọn trong [start, end), dời về tọa độ của đoạn con ``text[start:end]``"""
+    return [(span_start - start, span_end - start) for span_start, span_end in spans
+            if span_start >= start and span_end <= end]
+
+
+def highlight_html(text, spans, style="color:red;font-weight:bold"):
+    """Tô đậm các đoạn ``text[start:end]`` và escape HTML trong một lần duyệt văn bản.
+
+    Các span chồng lấn hoặc liền nhau được gộp lại; phần giữa các span được
+    escape rồi nối lại theo offset.
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    parts = []
+    last = 0
+    for start, end in merged:
+        parts.append(html.escape(text[last:start]))
+        parts.append(f"<span style='{style}'>{html.escape(text[start:end])}</span>")
+        last = end
+    parts.append(html.escape(text[last:]))
+    return ''.join(parts)
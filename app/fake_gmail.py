@@ -0,0 +1,505 @@
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# ============== GMAIL GIẢ LẬP CHẠY CỤC BỘ ================
+# Máy chủ HTTP nhỏ trả lời một phần Gmail API (messages.list, messages.get,
+# getProfile, history.list và endpoint batch multipart/mixed) để thử và đo tốc
+# độ đồng bộ mà không cần mạng hay tài khoản Google. Có thể giả lập độ trễ mỗi
+# HTTP request, lỗi 429 ngẫu nhiên cho từng email và các thay đổi trong hộp
+# thư (email mới, xóa, đổi nhãn, history hết hạn). Hỗ trợ format=metadata,
+# tham số fields (partial response) và nén gzip như Gmail thật.
+#   python -m app.fake_gmail serve --port 8765      (rồi đặt PHISH_GMAIL_ENDPOINT=http://127.0.0.1:8765)
+#   python -m app.fake_gmail bench --messages 200 --latency-ms 50
+#   python -m app.fake_gmail bytes --messages 50 --body-kb 20
+
+API_PREFIX = "/gmail/v1/users/me"
+
+_SPAM_BODIES = [
+    "URGENT: your account has been suspended. Verify your password now at http://secure-login.example",
+    "Congratulations! You won a $1,000,000 lottery prize. Send your bank details to claim.",
+]
+_HAM_BODIES = [
+    "Hi, attached are the notes from today's meeting. Let me know if anything is missing.",
+    "The build finished successfully. Release notes are on the wiki.",
+]
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def make_message(index, body_kb=0):
+    """Tạo một message Gmail tổng hợp (dạng format=full), nội dung dài khoảng ``body_kb`` KB"""
+    message_id = f"{index + 1:016x}"
+    spam = index % 4 == 0
+    body = (_SPAM_BODIES if spam else _HAM_BODIES)[index % 2] + f"\n\nMessage #{index}"
+    if body_kb:
+        rng = random.Random(index)
+        words = [f"w{rng.randrange(5000)}" for _ in range(body_kb * 1024 // 6)]
+        body += "\n\n" + " ".join(words)
+    headers = [
+        {"name": "From", "value": f"Sender {index} <sender{index}@{'promo.example' if spam else 'example.com'}>"},
+        {"name": "To", "value": "me@example.com"},
+        {"name": "Subject", "value": f"{'Action required' if spam else 'Weekly update'} #{index}"},
+        {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(1700000000 + index * 60))},
+    ]
+    payload = {
+        "mimeType": "multipart/alternative",
+        "headers": headers,
+        "body": {"size": 0},
+        "parts": [
+            {"partId": "0", "mimeType": "text/plain", "filename": "", "headers": [],
+             "body": {"size": len(body), "data": _b64(body)}},
+            {"partId": "1", "mimeType": "text/html", "filename": "", "headers": [],
+             "body": {"size": len(body) + 13, "data": _b64(f"<p>{body}</p>")}},
+        ],
+    }
+    if index % 3 == 0:
+        # Mỗi email thứ ba có một file đính kèm (multipart/mixed)
+        payload["body"] = {"size": 0}
+        payload = {
+            "mimeType": "multipart/mixed",
+            "headers": payload.pop("headers"),
+            "body": {"size": 0},
+            "parts": [dict(payload, partId="0", filename="", headers=[]),
+                      {"partId": "1", "mimeType": "application/pdf", "filename": f"invoice-{index}.pdf",
+                       "headers": [], "body": {"size": len(_attachment_data(index)),
+                                               "attachmentId": f"att-{message_id}"}}],
+        }
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": body[:100],
+        "historyId": str(index + 1),
+        "internalDate": str((1700000000 + index * 60) * 1000),
+        "sizeEstimate": len(body) * 2,
+        "payload": payload,
+    }
+
+
+def _attachment_data(index):
+    return f"%PDF-1.4 fake invoice #{index}\n".encode("utf-8") * 8
+
+
+def _parse_fields(spec, pos=0):
+    """Phân tích tham số ``fields`` (ví dụ "id,payload/headers,a(b,c)") thành cây {tên: cây con hoặc None}"""
+    tree = {}
+    while pos < len(spec) and spec[pos] != ")":
+        name, subtree, pos = _parse_field(spec, pos)
+        if name:
+            tree[name] = None if name in tree and tree[name] is None else subtree
+        if pos < len(spec) and spec[pos] == ",":
+            pos += 1
+    return tree, pos
+
+
+def _parse_field(spec, pos):
+    start = pos
+    while pos < len(spec) and spec[pos] not in ",/()":
+        pos += 1
+    name = spec[start:pos].strip()
+    if pos < len(spec) and spec[pos] == "(":
+        subtree, pos = _parse_fields(spec, pos + 1)
+        return name, subtree, pos + 1
+    if pos < len(spec) and spec[pos] == "/":
+        child, grandchild, pos = _parse_field(spec, pos + 1)
+        return name, {child: grandchild}, pos
+    return name, None, pos
+
+
+def _select_fields(value, tree):
+    """Giữ lại các trường theo cây ``fields`` (partial response)"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_select_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _select_fields(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def _error(status, reason, message):
+    return status, {"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}}
+
+
+class FakeGmail:
+    """Trạng thái hộp thư giả lập và bộ định tuyến request"""
+
+    def __init__(self, message_count=100, latency_ms=0, fail_rate=0.0, seed=0, body_kb=0):
+        # Mới nhất trước, giống messages.list của Gmail
+        self.body_kb = body_kb
+        self.messages = {}
+        self.order = []
+        for index in reversed(range(message_count)):
+            message = make_message(index, body_kb)
+            self.messages[message["id"]] = message
+            self.order.append(message["id"])
+        self.history = []
+        self.history_id = message_count
+        self.oldest_history_id = 1
+        self._next_index = message_count
+        self.latency = latency_ms / 1000
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.http_requests = 0
+        self.message_gets = 0
+        self.bytes_sent = 0
+
+    # ---- Thay đổi hộp thư (ghi lại history giống Gmail) ----
+    def _record(self, **changes):
+        self.history_id += 1
+        self.history.append(dict(id=str(self.history_id), **changes))
+
+    def _ref(self, message_id):
+        message = self.messages[message_id]
+        return {"id": message_id, "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+
+    def add_message(self):
+        """Thêm một email mới vào đầu hộp thư, trả về id"""
+        with self._lock:
+            message = make_message(self._next_index, self.body_kb)
+            self._next_index += 1
+            self.messages[message["id"]] = message
+            self.order.insert(0, message["id"])
+            self._record(messagesAdded=[{"message": self._ref(message["id"])}])
+            message["historyId"] = str(self.history_id)
+            return message["id"]
+
+    def delete_message(self, message_id):
+        """Xóa vĩnh viễn một email"""
+        with self._lock:
+            ref = self._ref(message_id)
+            del self.messages[message_id]
+            self.order.remove(message_id)
+            self._record(messagesDeleted=[{"message": ref}])
+
+    def modify_labels(self, message_id, add=(), remove=()):
+        """Thêm/bỏ nhãn của một email (ví dụ TRASH, UNREAD, SPAM)"""
+        with self._lock:
+            labels = self.messages[message_id]["labelIds"]
+            added = [label for label in add if label not in labels]
+            removed = [label for label in remove if label in labels]
+            labels.extend(added)
+            for label in removed:
+                labels.remove(label)
+            if added:
+                self._record(labelsAdded=[{"message": self._ref(message_id), "labelIds": added}])
+            if removed:
+                self._record(labelsRemoved=[{"message": self._ref(message_id), "labelIds": removed}])
+
+    def expire_history(self):
+        """Giả lập Gmail xóa history cũ: mọi startHistoryId hiện có trở nên không hợp lệ"""
+        with self._lock:
+            self.history.clear()
+            self.history_id += 1
+            self.oldest_history_id = self.history_id
+
+    def _list_history(self, query):
+        start = int(query["startHistoryId"][0])
+        if start < self.oldest_history_id:
+            return _error(404, "notFound", "Requested entity was not found.")
+        types = set(query.get("historyTypes", []))
+        type_keys = {"messageAdded": "messagesAdded", "messageDeleted": "messagesDeleted",
+                     "labelAdded": "labelsAdded", "labelRemoved": "labelsRemoved"}
+        wanted = {type_keys[t] for t in types} if types else set(type_keys.values())
+        with self._lock:
+            records = [
+                {key: value for key, value in record.items() if key == "id" or key in wanted}
+                for record in self.history if int(record["id"]) > start
+            ]
+            history_id = str(self.history_id)
+        records = [record for record in records if len(record) > 1]
+        offset = int(query.get("pageToken", ["0"])[0])
+        limit = int(query.get("maxResults", ["100"])[0])
+        response = {"history": records[offset:offset + limit], "historyId": history_id}
+        if offset + limit < len(records):
+            response["nextPageToken"] = str(offset + limit)
+        return 200, response
+
+    def _should_fail(self):
+        with self._lock:
+            return self.fail_rate and self._random.random() < self.fail_rate
+
+    def route(self, method, path, query):
+        """Xử lý một lời gọi API, trả về (status, dict JSON)"""
+        if not path.startswith(API_PREFIX):
+            return _error(404, "notFound", f"Unknown path {path}")
+        resource = path[len(API_PREFIX):].strip("/").split("/")
+
+        if method == "GET" and resource == ["profile"]:
+            return 200, {"emailAddress": "me@example.com", "messagesTotal": len(self.order),
+                         "threadsTotal": len(self.order), "historyId": str(self.history_id)}
+
+        if method == "GET" and resource == ["history"]:
+            return self._list_history(query)
+
+        if method == "GET" and resource == ["messages"]:
+            offset = int(query.get("pageToken", ["0"])[0])
+            limit = int(query.get("maxResults", ["100"])[0])
+            page = self.order[offset:offset + limit]
+            response = {"messages": [{"id": i, "threadId": self.messages[i]["threadId"]} for i in page],
+                        "resultSizeEstimate": len(self.order)}
+            if offset + limit < len(self.order):
+                response["nextPageToken"] = str(offset + limit)
+            return 200, response
+
+        if method == "GET" and len(resource) == 2 and resource[0] == "messages":
+            with self._lock:
+                self.message_gets += 1
+            if self._should_fail():
+                return _error(429, "rateLimitExceeded", "Too many concurrent requests for user")
+            message = self.messages.get(resource[1])
+            if message is None:
+                return _error(404, "notFound", "Requested entity was not found.")
+            response = self.format_message(message, query)
+            if "fields" in query:
+                response = _select_fields(response, _parse_fields(query["fields"][0])[0])
+            return 200, response
+
+        if (method == "GET" and len(resource) == 4 and resource[0] == "messages"
+                and resource[2] == "attachments" and resource[1] in self.messages):
+            index = int(resource[1], 16) - 1
+            if resource[3] != f"att-{resource[1]}" or index % 3:
+                return _error(404, "notFound", "Requested entity was not found.")
+            data = _attachment_data(index)
+            return 200, {"size": len(data), "data": base64.urlsafe_b64encode(data).decode("ascii")}
+
+        return _error(404, "notFound", f"Unknown method {method} {path}")
+
+    def format_message(self, message, query):
+        """Áp dụng tham số ``format`` của messages.get"""
+        message_format = query.get("format", ["full"])[0]
+        if message_format == "minimal":
+            return {key: value for key, value in message.items() if key != "payload"}
+        if message_format == "metadata":
+            wanted = {name.lower() for name in query.get("metadataHeaders", [])}
+            headers = [h for h in message["payload"]["headers"] if not wanted or h["name"].lower() in wanted]
+            result = {key: value for key, value in message.items() if key != "payload"}
+            result["payload"] = {"mimeType": message["payload"]["mimeType"], "headers": headers}
+            return result
+        return message
+
+    def handle_batch(self, content_type, body):
+        """Tách request multipart/mixed, xử lý từng phần và ghép response multipart/mixed"""
+        container = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+        boundary = "batch_fake_gmail"
+        chunks = []
+        for part in container.get_payload():
+            request_line, _, _ = part.get_payload().partition("\n")
+            method, target, _ = request_line.strip().split(" ", 2)
+            url = urlsplit(target)
+            status, payload = self.route(method, url.path, parse_qs(url.query))
+            content_id = part["Content-ID"] or "<fake + 0>"
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", "".join(chunks)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        data = body.encode("utf-8")
+        # Như Gmail: chỉ nén khi client chấp nhận gzip và User-Agent có chữ "gzip"
+        compress = ("gzip" in self.headers.get("Accept-Encoding", "")
+                    and "gzip" in self.headers.get("User-Agent", ""))
+        if compress:
+            data = gzip.compress(data)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        gmail = self.server.gmail
+        with gmail._lock:
+            gmail.bytes_sent += len(data)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _begin(self):
+        gmail = self.server.gmail
+        with gmail._lock:
+            gmail.http_requests += 1
+        if gmail.latency:
+            time.sleep(gmail.latency)
+        return gmail
+
+    def do_GET(self):
+        gmail = self._begin()
+        url = urlsplit(self.path)
+        status, payload = gmail.route("GET", url.path, parse_qs(url.query))
+        self._send(status, "application/json; charset=UTF-8", json.dumps(payload))
+
+    def do_POST(self):
+        gmail = self._begin()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if urlsplit(self.path).path == "/batch":
+            content_type, response = gmail.handle_batch(self.headers["Content-Type"], body)
+            self._send(200, content_type, response)
+        else:
+            status, payload = _error(404, "notFound", f"Unknown path {self.path}")
+            self._send(status, "application/json; charset=UTF-8", json.dumps(payload))
+
+
+class FakeGmailServer:
+    """Chạy FakeGmail trên 127.0.0.1 trong một luồng nền (dùng được với ``with``)"""
+
+    def __init__(self, port=0, **kwargs):
+        self.gmail = FakeGmail(**kwargs)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.gmail = self.gmail
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeGmail", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def build_fake_service(base_url, gzip_user_agent=True):
+    """Tạo Gmail service của googleapiclient trỏ tới máy chủ giả lập (kể cả endpoint batch)"""
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    from googleapiclient.http import set_user_agent
+
+    from app.gmail_batch import GMAIL_USER_AGENT
+
+    document = json.loads(get_static_doc("gmail", "v1"))
+    document["rootUrl"] = document["baseUrl"] = base_url.rstrip("/") + "/"
+    http = httplib2.Http()
+    if gzip_user_agent:
+        http = set_user_agent(http, GMAIL_USER_AGENT)
+    return build_from_document(document, http=http)
+
+
+def benchmark(message_count=200, latency_ms=50, batch_size=None, fail_rate=0.0, concurrency=None):
+    """So sánh lấy email lần lượt, theo batch và theo batch song song trên máy chủ giả lập"""
+    from app.concurrent_fetch import FETCH_CONCURRENCY, ConcurrentFetcher
+    from app.gmail_batch import GMAIL_BATCH_SIZE, fetch_messages
+
+    results = {}
+    with FakeGmailServer(message_count=message_count, latency_ms=latency_ms) as server:
+        service = build_fake_service(server.base_url)
+        ids = list(server.gmail.order)
+
+        server.gmail.http_requests = 0
+        start = time.perf_counter()
+        for message_id in ids:
+            service.users().messages().get(userId="me", id=message_id, format="full").execute()
+        results["sequential"] = {"seconds": time.perf_counter() - start, "http_requests": server.gmail.http_requests}
+
+        server.gmail.http_requests = 0
+        server.gmail.fail_rate = fail_rate
+        start = time.perf_counter()
+        fetched = fetch_messages(service, ids, batch_size=batch_size or GMAIL_BATCH_SIZE, backoff=0.05)
+        results["batched"] = {"seconds": time.perf_counter() - start, "http_requests": server.gmail.http_requests,
+                              "messages": len(fetched)}
+
+        # Song song: mỗi luồng một client, bỏ qua bước chấm điểm/ghi database
+        server.gmail.http_requests = 0
+        fetcher = ConcurrentFetcher(service_factory=lambda: build_fake_service(server.base_url),
+                                    concurrency=concurrency or FETCH_CONCURRENCY, writer=len)
+        start = time.perf_counter()
+        fetched = fetcher.run(ids)
+        results["concurrent"] = {"seconds": time.perf_counter() - start,
+                                 "http_requests": server.gmail.http_requests, "messages": fetched}
+
+    for name, stats in results.items():
+        print(f"  {name:<10} {stats['seconds']:.2f}s  {stats['http_requests']} HTTP request")
+    return results
+
+
+def benchmark_bytes(message_count=50, body_kb=20, latency_ms=0):
+    """So sánh số byte phải tải trước khi danh sách email dùng được: format=full với metadata + fields + gzip"""
+    from app.gmail_batch import fetch_messages
+
+    metadata_params = {"format": "metadata", "metadataHeaders": ["From", "To", "Subject", "Date"],
+                       "fields": "id,threadId,labelIds,snippet,internalDate,payload/headers"}
+    results = {}
+    with FakeGmailServer(message_count=message_count, latency_ms=latency_ms, body_kb=body_kb) as server:
+        ids = list(server.gmail.order)
+        for name, gzip_user_agent, params in (("full", False, {"format": "full"}),
+                                              ("metadata+gzip", True, metadata_params)):
+            service = build_fake_service(server.base_url, gzip_user_agent=gzip_user_agent)
+            server.gmail.bytes_sent = 0
+            start = time.perf_counter()
+            fetched = fetch_messages(service, ids, **params)
+            results[name] = {"seconds": time.perf_counter() - start, "bytes": server.gmail.bytes_sent,
+                             "messages": len(fetched)}
+
+    for name, stats in results.items():
+        print(f"  {name:<14} {stats['bytes'] / 1024:9.1f} KB  {stats['seconds']:.2f}s  ({stats['messages']} email)")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gmail API giả lập để thử/đo tốc độ đồng bộ")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Chạy máy chủ giả lập")
+    serve.add_argument("--port", type=int, default=8765)
+    bench = subparsers.add_parser("bench", help="So sánh lấy lần lượt với lấy theo batch")
+    bench.add_argument("--batch-size", type=int, default=None)
+    bench.add_argument("--concurrency", type=int, default=None)
+    size = subparsers.add_parser("bytes", help="So sánh số byte tải về: full với metadata + fields + gzip")
+    for sub in (serve, bench, size):
+        sub.add_argument("--messages", type=int, default=200)
+        sub.add_argument("--latency-ms", type=float, default=50)
+        sub.add_argument("--fail-rate", type=float, default=0.0)
+        sub.add_argument("--body-kb", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        benchmark(args.messages, args.latency_ms, args.batch_size, args.fail_rate, args.concurrency)
+        return
+    if args.command == "bytes":
+        benchmark_bytes(args.messages, args.body_kb or 20, args.latency_ms)
+        return
+
+    server = FakeGmailServer(port=args.port, message_count=args.messages, latency_ms=args.latency_ms,
+                             fail_rate=args.fail_rate, body_kb=args.body_kb).start()
+    print(f"[INFO] Gmail giả lập đang chạy tại {server.base_url} (Ctrl+C để dừng)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,166 @@
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
-from app.database import save_emails_to_db, get_total_emails_count, update_spam_score, DB_PATH
+from app.database import (save_emails_to_db, get_total_emails_count, update_spam_score, get_spam_threshold,
+                          get_existing_email_ids, get_email_ids_without_body, get_stored_email_content,
+                          save_email_content, DB_PATH)
+from app.profiling import get_profiler
+from app.gmail_batch import GMAIL_USER_AGENT, fetch_messages
+from app.sample_emails import get_sample_email, is_sample_email
+from app.sender_auth import sender_authenticated
+from app.text_preprocessor import scoring_text
+from html.parser import HTMLParser
 import base64
 import os
 import json
-import importlib.util
 import sqlite3
 
 SCOPES = ["https://mail.google.com/"]
 
 
+# Đặt PHISH_GMAIL_ENDPOINT=http://127.0.0.1:8765 để dùng Gmail giả lập (python -m app.fake_gmail serve)
+GMAIL_ENDPOINT = os.environ.get('PHISH_GMAIL_ENDPOINT')
+
+# Đồng bộ hai tầng: tầng 1 chỉ lấy metadata đủ cho danh sách email, nội dung được tải sau
+METADATA_FIRST = os.environ.get('PHISH_METADATA_FIRST', '1') != '0'
+METADATA_HEADERS = ["From", "To", "Subject", "Date", "Authentication-Results"]
+METADATA_FIELDS = "id,threadId,labelIds,snippet,internalDate,payload/headers"
+
+
 def get_gmail_service():
     """ Kết nối đến Gmail API """
+    if GMAIL_ENDPOINT:
+        from app.fake_gmail import build_fake_service
+        return build_fake_service(GMAIL_ENDPOINT)
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import set_user_agent
+
     creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    service = build("gmail", "v1", credentials=creds)
+    http = set_user_agent(AuthorizedHttp(creds, http=httplib2.Http()), GMAIL_USER_AGENT)
+    service = build("gmail", "v1", http=http)
     return service
 
 def refresh_emails_safely(max_results=50):
-    """Refresh để lấy email mới nhất từ trên xuống, dừng khi gặp email đã có"""
-    service = get_gmail_service()
+    """Làm mới hộp thư bằng Gmail History API: chỉ áp dụng các thay đổi kể từ lần đồng bộ trước.
 
-    results = service.users().messages().list(
-        userId="me",
-        maxResults=max_results
-    ).execute()
+    Lần đầu (hoặc khi historyId hết hạn) đồng bộ lại ``max_results`` email mới
+    nhất. Trả về ``SyncResult`` (số email thêm/xóa, số thay đổi nhãn).
+    """
+    from app.gmail_sync import sync_mailbox
 
-    messages = results.get("messages", [])
-    if not messages:
-        print("📭 Không tìm thấy email mới.")
-        return 0
+    result = sync_mailbox(get_gmail_service(), full_sync_results=max_results)
+    print(f"✅ Đã thêm {result.added} email mới.")
+    return result
 
-    # Lấy danh sách id hiện có
-    existing_ids = set()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM emails")
-    existing_ids.update(row[0] for row in cursor.fetchall())
-    conn.close()
+def store_messages(service, message_ids, metadata_first=METADATA_FIRST):
+    """Lấy các email theo id, trích xuất và lưu vào database; trả về số email đã lưu.
+
+    Mặc định chỉ tải metadata (người gửi, tiêu đề, snippet, ngày) để danh sách
+    hiện ngay, rồi xếp nội dung vào hàng đợi tải nền của ``BodyDownloader``
+    (email đó được chấm điểm khi có nội dung). Ít email: một batch request
+    bằng ``service``; nhiều email: tải song song bằng ``ConcurrentFetcher``.
+    """
+    from app.concurrent_fetch import FETCH_CHUNK_SIZE, ConcurrentFetcher
 
-    added_count = 0
-    for msg_meta in messages:
-        email_id = msg_meta["id"]
+    if not message_ids:
+        return 0
+    if metadata_first:
+        params = {"format": "metadata", "metadataHeaders": METADATA_HEADERS, "fields": METADATA_FIELDS}
+        writer = store_email_metadata
+    else:
+        params = {"format": "full"}
+        writer = store_emails_in_database
 
-        if email_id in existing_ids:
-            print(f"⛔ Gặp email đã có ({email_id}), dừng lại.")
-            break
+    if len(message_ids) > FETCH_CHUNK_SIZE:
+        stored = ConcurrentFetcher(writer=writer, **params).run(message_ids)
+    else:
+        stored = writer([extract_email_info(msg) for msg in fetch_messages(service, message_ids, **params)])
+
+    if metadata_first and stored:
+        from app.body_downloader import get_body_downloader
+        get_body_downloader().enqueue(message_ids)
+    return stored
+
+def _decode_body(data):
+    return base64.urlsafe_b64decode(data).decode("utf-8", errors="replace")
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Lấy phần chữ hiển thị của HTML: bỏ thẻ, script/style; thẻ khối thành xuống dòng"""
+    SKIP_TAGS = {"script", "style", "head", "title"}
+    BLOCK_TAGS = {"br", "p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html_body):
+    """Chuyển HTML thành văn bản thuần (dùng khi email không có phần text/plain)"""
+    if not html_body:
+        return ""
+    extractor = _HTMLTextExtractor()
+    extractor.feed(html_body)
+    extractor.close()
+    lines = (" ".join(line.split()) for line in "".join(extractor.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def parse_payload(payload):
+    """Duyệt cây MIME: trả về (văn bản thuần, HTML, danh sách file đính kèm).
+
+    Email chỉ có HTML thì văn bản thuần được rút ra từ HTML (bỏ thẻ) để chấm
+    điểm và tìm kiếm; HTML gốc vẫn được giữ để hiển thị.
+    """
+    text, html_body = None, None
+    attachments = []
 
-        msg = service.users().messages().get(userId="me", id=email_id, format="full").execute()
-        email_info = extract_email_info(msg)
-        store_email_in_database(email_info)
-        added_count += 1
+    def walk(part):
+        nonlocal text, html_body
+        filename = part.get("filename")
+        body = part.get("body", {})
+        mime_type = part.get("mimeType", "")
+
+        if filename and "attachmentId" in body:
+            attachments.append({
+                "filename": filename,
+                "attachmentId": body["attachmentId"],
+                "size": body.get("size", 0),
+                "mimeType": mime_type
+            })
+        elif not filename and "data" in body:
+            if mime_type == "text/html":
+                if html_body is None:
+                    html_body = _decode_body(body["data"])
+            elif text is None and (mime_type == "text/plain" or "parts" not in part):
+                text = _decode_body(body["data"])
+
+        for child in part.get("parts", []):
+            walk(child)
+
+    walk(payload)
+    html_body = html_body or ""
+    if not text and html_body:
+        text = html_to_text(html_body)
+    return text or "", html_body, attachments
 
-    print(f"✅ Đã thêm {added_count} email mới.")
-    return added_count
 
 def extract_email_info(email_data):
     """Trích xuất thông tin cần thiết từ email data của Gmail API"""
@@ -63,6 +171,7 @@ def extract_email_info(email_data):
     
     # Trích xuất headers
     headers = email_data.get("payload", {}).get("headers", [])
+    authentication_results = []
     for header in headers:
         name = header.get("name", "").lower()
         value = header.get("value", "")
@@ -75,25 +184,22 @@ def extract_email_info(email_data):
             email_info["subject"] = value
         elif name == "date":
             email_info["date"] = value
+        elif name == "authentication-results":
+            authentication_results.append(value)
     
     # Lấy snippet
     email_info["snippet"] = email_data.get("snippet", "")
     
-    # Trích xuất nội dung
-    body = ""
+    # Trích xuất nội dung (văn bản, HTML và danh sách file đính kèm)
+    body, body_html, attachments = "", "", []
     try:
-        payload = email_data.get("payload", {})
-        if "body" in payload and "data" in payload["body"]:
-            body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-        elif "parts" in payload:
-            for part in payload["parts"]:
-                if part.get("mimeType") == "text/plain" and "body" in part and "data" in part["body"]:
-                    body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
-                    break
+        body, body_html, attachments = parse_payload(email_data.get("payload", {}))
     except Exception as e:
         print(f"Lỗi khi giải mã nội dung email: {e}")
     
     email_info["body"] = body
+    email_info["body_html"] = body_html
+    email_info["attachments"] = attachments
     
     # Đảm bảo các trường cơ bản tồn tại
     if "from" not in email_info:
@@ -104,68 +210,152 @@ def extract_email_info(email_data):
         email_info["to"] = ""
     if "date" not in email_info:
         email_info["date"] = ""
+
+    # From chỉ đáng tin khi SPF/DKIM/DMARC của máy chủ nhận khớp tên miền người gửi
+    email_info["sender_authenticated"] = sender_authenticated(email_info["from"], authentication_results)
     
     return email_info
 
 
-def store_email_in_database(email_info, database_path=DB_PATH):
-    """Lưu thông tin email vào cơ sở dữ liệu"""
-    if not email_info:
-        print("Không có thông tin email để lưu")
-        return
-    
-    # Tạo đối tượng kết nối
+def store_emails_in_database(email_infos, database_path=DB_PATH):
+    """Chấm điểm rồi lưu nhiều email trong một transaction; trả về số email đã thêm"""
+    email_infos = [info for info in email_infos if info]
+    if not email_infos:
+        return 0
+
     conn = sqlite3.connect(database_path)
-    cursor = conn.cursor()
-    
-    # Kiểm tra xem email đã tồn tại chưa
-    cursor.execute("SELECT id FROM emails WHERE id = ?", (email_info["id"],))
-    existing_email = cursor.fetchone()
-    
-    if existing_email:
-        print(f"Email {email_info['id']} đã tồn tại trong cơ sở dữ liệu")
-        conn.close()
-        return
-    
-    # Chuẩn bị dữ liệu để lưu trữ
-    email_id = email_info["id"]
-    thread_id = email_info.get("threadId", "")
-    subject = email_info.get("subject", "Không có tiêu đề")
-    snippet = email_info.get("snippet", "")
-    sender = email_info.get("from", "")
-    receiver = email_info.get("to", "")
-    date = email_info.get("date", "")
-    
-    # Phân tích email để tìm dấu hiệu lừa đảo
-    spam_score = analyze_email_for_spam(email_info, email_id)
-    is_spam = 1 if spam_score > 0.7 else 0
-    
-    # Lưu thông tin email vào bảng emails
     try:
-        cursor.execute(
-            """
-            INSERT INTO emails (id, thread_id, subject, snippet, from_address, to_address, date, body, is_read, spam_score, is_spam, is_deleted)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (email_id, thread_id, subject, snippet, sender, receiver, date,
-             email_info.get("body", ""), 0, spam_score, is_spam, 0)
-        )
-        conn.commit()
-        print(f"Đã lưu email {email_id} vào cơ sở dữ liệu")
+        ids = [info["id"] for info in email_infos]
+        existing = {row[0] for row in conn.execute(
+            f"SELECT id FROM emails WHERE id IN ({','.join('?' * len(ids))})", ids)}
+
+        new_infos = []
+        for info in email_infos:
+            email_id = info["id"]
+            if email_id in existing:
+                print(f"Email {email_id} đã tồn tại trong cơ sở dữ liệu")
+                continue
+            existing.add(email_id)
+            new_infos.append(info)
+
+        threshold = get_spam_threshold()
+        rows = []
+        for info, (spam_score, model_version) in zip(new_infos, analyze_emails_for_spam(new_infos)):
+            rows.append((info["id"], info.get("threadId", ""), info.get("subject", "Không có tiêu đề"),
+                         info.get("snippet", ""), info.get("from", ""), info.get("to", ""),
+                         info.get("date", ""), info.get("body", ""), 0, spam_score,
+                         1 if spam_score > threshold else 0, 0, model_version, info.get("body_html", ""),
+                         json.dumps(info.get("attachments", [])), 1 if info.get("sender_authenticated") else 0))
+
+        with get_profiler().stage('db_update'), conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO emails (id, thread_id, subject, snippet, from_address, to_address, date, body, is_read, spam_score, is_spam, is_deleted, spam_model_version, body_html, attachments, sender_authenticated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+        print(f"Đã lưu {len(rows)} email vào cơ sở dữ liệu")
+        return len(rows)
     except sqlite3.Error as e:
         print(f"Lỗi khi lưu email: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def store_email_metadata(email_infos, database_path=DB_PATH):
+    """Lưu các email mới chỉ có metadata (has_body = 0, chưa chấm điểm); trả về số email đã thêm"""
+    rows = [(info["id"], info.get("threadId", ""), info.get("subject", "Không có tiêu đề"), info.get("snippet", ""),
+             info.get("from", ""), info.get("to", ""), info.get("date", ""),
+             1 if info.get("sender_authenticated") else 0)
+            for info in email_infos if info]
+    if not rows:
+        return 0
+    conn = sqlite3.connect(database_path)
+    try:
+        with get_profiler().stage('db_update'), conn:
+            cursor = conn.executemany(
+                """
+                INSERT OR IGNORE INTO emails (id, thread_id, subject, snippet, from_address, to_address, date, sender_authenticated, is_read, spam_score, is_spam, is_deleted, has_body)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0.0, 0, 0, 0)
+                """,
+                rows
+            )
+            added = cursor.rowcount
+        print(f"Đã lưu metadata của {added} email vào cơ sở dữ liệu")
+        return added
+    except sqlite3.Error as e:
+        print(f"Lỗi khi lưu metadata email: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def store_email_bodies(email_infos, database_path=DB_PATH):
+    """Chấm điểm và lưu nội dung cho các email đã có metadata (một transaction); trả về số email cập nhật"""
+    email_infos = [info for info in email_infos if info]
+    threshold = get_spam_threshold()
+    rows = []
+    for info, (spam_score, model_version) in zip(email_infos, analyze_emails_for_spam(email_infos)):
+        rows.append((info.get("body", ""), info.get("body_html", ""), json.dumps(info.get("attachments", [])),
+                     spam_score, 1 if spam_score > threshold else 0, model_version,
+                     1 if info.get("sender_authenticated") else 0, info["id"]))
+    if not rows:
+        return 0
+    conn = sqlite3.connect(database_path)
+    try:
+        with get_profiler().stage('db_update'), conn:
+            conn.executemany(
+                "UPDATE emails SET body = ?, body_html = ?, attachments = ?, spam_score = ?, "
+                "is_spam = COALESCE(spam_override, ?), "
+                "spam_model_version = ?, sender_authenticated = ?, has_body = 1 WHERE id = ?",
+                rows
+            )
+        return len(rows)
+    except sqlite3.Error as e:
+        print(f"Lỗi khi lưu nội dung email: {e}")
+        return 0
     finally:
         conn.close()
 
-def analyze_email_for_spam(email_content, email_id, database_path=DB_PATH):
-    """Phân tích nội dung email để phát hiện lừa đảo"""
+def analyze_emails_for_spam(email_infos):
+    """Chấm điểm cả lô email, trả về danh sách (điểm, phiên bản model) theo thứ tự đầu vào.
+
+    Các email cần LSTM được gửi cùng lúc cho dịch vụ suy luận thay vì từng email
+    một (mỗi lời gọi đơn lẻ phải chờ hết thời gian gom lô).
+    """
+    if not email_infos:
+        return []
+    from app.scoring_cascade import get_scoring_cascade
+
+    items = [(scoring_text(info.get('from', ''), info.get('subject', ''), info.get('body', '')),
+              info.get('from', ''), bool(info.get('sender_authenticated'))) for info in email_infos]
+    try:
+        with get_profiler().stage('score'):
+            return get_scoring_cascade().score_batch_with_version(items)
+    except Exception as e:
+        print(f"[ERROR] Lỗi khi chấm điểm lô {len(items)} email, chấm lại từng email: {e}")
+        get_profiler().count('exceptions.analyze_email')
+        return [analyze_email_for_spam(info, info["id"], database_path=None, return_version=True)
+                for info in email_infos]
+
+
+def analyze_email_for_spam(email_content, email_id, database_path=DB_PATH, return_version=False):
+    """Phân tích nội dung email để phát hiện lừa đảo.
+
+    Trả về điểm spam, hoặc (điểm, phiên bản model) khi ``return_version=True``.
+    Với ``database_path=None`` chỉ chấm điểm, không cập nhật database (người
+    gọi tự ghi, ví dụ ``store_emails_in_database``).
+    """
+    model_version = None
     print(f"Phân tích email ID: {email_id} để tìm dấu hiệu lừa đảo...")
     
     try:
-        from app.spam_detector import SpamDetector
+        from app.scoring_cascade import get_scoring_cascade
         
-        # Tải detector với đường dẫn đầy đủ
-        detector = SpamDetector()
+        profiler = get_profiler()
+        
+        # Chấm điểm theo tầng: allowlist -> cache -> từ khóa -> LSTM (qua dịch vụ suy luận chung)
+        cascade = get_scoring_cascade()
         
         # Kết hợp tiêu đề và nội dung để phân tích
         if email_content and isinstance(email_content, dict):
@@ -174,44 +364,46 @@ def analyze_email_for_spam(email_content, email_id, database_path=DB_PATH):
             sender = email_content.get('from', '')
             
             # Kết hợp thông tin để phân tích
-            combined_text = f"From: {sender}\nSubject: {subject}\n\n{body}"
+            combined_text = scoring_text(sender, subject, body)
             
             # Phân tích spam
-            spam_result = detector.predict(combined_text)
-
-            # Nếu predict trả về tuple (score, keywords), lấy phần đầu
-            if isinstance(spam_result, tuple):
-                spam_score = spam_result[0]
-            else:
-                spam_score = spam_result
+            with profiler.stage('score'):
+                spam_score, model_version = cascade.score_with_version(
+                    combined_text, sender=sender, authenticated=bool(email_content.get('sender_authenticated')))
 
             print(f"Email ID {email_id}: Điểm lừa đảo = {spam_score:.2f}")
 
             
             # Cập nhật cơ sở dữ liệu
-            conn = sqlite3.connect(database_path)
-            cursor = conn.cursor()
-            
-            # Đánh dấu là spam nếu điểm > 0.7
-            is_spam = 1 if spam_score > 0.7 else 0
-            
-            # Lưu điểm spam và trạng thái vào cơ sở dữ liệu
-            cursor.execute(
-                "UPDATE emails SET spam_score = ?, is_spam = ? WHERE id = ?",
-                (spam_score, is_spam, email_id)
-            )
-            conn.commit()
-            conn.close()
+            if database_path is None:
+                return (spam_score, model_version) if return_version else spam_score
+            with profiler.stage('db_update'):
+                conn = sqlite3.connect(database_path)
+                cursor = conn.cursor()
+                
+                # Đánh dấu là spam nếu điểm vượt ngưỡng hiện tại
+                is_spam = 1 if spam_score > get_spam_threshold() else 0
+                
+                # Lưu điểm spam và trạng thái (giữ nguyên nếu người dùng đã đánh dấu thủ công)
+                cursor.execute(
+                    "UPDATE emails SET spam_score = ?, is_spam = COALESCE(spam_override, ?), spam_model_version = ? "
+                    "WHERE id = ?",
+                    (spam_score, is_spam, model_version, email_id)
+                )
+                conn.commit()
+                conn.close()
             
-            return spam_score
+            return (spam_score, model_version) if return_version else spam_score
         else:
             print(f"[ERROR] Email ID {email_id}: Không thể phân tích - không có nội dung email")
-            return 0.0
+            profiler.count('empty_email')
+            return (0.0, None) if return_version else 0.0
     except Exception as e:
         import traceback
         print(f"[ERROR] Lỗi khi phân tích email ID {email_id}: {str(e)}")
+        get_profiler().count('exceptions.analyze_email')
         traceback.print_exc()
-        return 0.0
+        return (0.0, None) if return_version else 0.0
     
 
 
@@ -272,155 +464,58 @@ def get_latest_emails(max_results=20):
 
     print(f"📥 Đã tìm thấy {len(messages)} email mới.")
 
-    count_added = 0
-    for message in messages:
-        email_id = message["id"]
-
-        # Kiểm tra trùng
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM emails WHERE id = ?", (email_id,))
-        if cursor.fetchone():
-            print(f"⛔ Email {email_id} đã có, bỏ qua.")
-            conn.close()
-            continue
-        conn.close()
+    # Kiểm tra trùng (một truy vấn cho cả trang)
+    ids = [message["id"] for message in messages]
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id FROM emails WHERE id IN ({','.join('?' * len(ids))})", ids)
+    existing_ids = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    for email_id in existing_ids:
+        print(f"⛔ Email {email_id} đã có, bỏ qua.")
 
-        # Lấy chi tiết và lưu
-        msg = service.users().messages().get(userId="me", id=email_id, format="full").execute()
-        email_info = extract_email_info(msg)
-        store_email_in_database(email_info)
-        count_added += 1
+    # Lấy chi tiết theo batch và lưu
+    count_added = store_messages(service, [email_id for email_id in ids if email_id not in existing_ids])
 
     print(f"✅ Đã thêm {count_added} email mới vào database.")
     return count_added
 
 
 def get_email_content(email_id):
-    """ Lấy nội dung chi tiết của email và giải mã Base64 """
-    # Kiểm tra nếu là email mẫu
-    if email_id.startswith("spam-test"):
-        # Trả về nội dung cứng cho email mẫu
-        spam_emails_content = {
-            "spam-test-1": {
-                "subject": "URGENT: $5,000,000 inheritance waiting for you",
-                "sender": "Nigerian Prince <prince@nigeria.com>",
-                "body": """Dear Sir/Madam,
-                
-I am Prince Alyusi Islassis, the only son of the late King of Nigeria. I am writing to you because I need your urgent assistance in transferring the sum of $5,000,000 USD from Nigeria to your country.
-
-Due to certain political circumstances and government restrictions on my family's assets, I cannot transfer these funds directly. I am seeking a foreign partner who can help me transfer this money out of Nigeria.
-
-For your assistance, I am prepared to offer you 30% of the total funds. To proceed, I will need:
-1. Your full name
-2. Your bank account details
-3. A small administrative fee of $1,000 to cover transfer costs
-
-Please reply urgently as this matter is very sensitive and confidential.
-
-Yours faithfully,
-Prince Alyusi Islassis
-"""
-            },
-            "spam-test-2": {
-                "subject": "Your account has been BLOCKED - Verify NOW",
-                "sender": "Bank Security <security@bank-verificati0n.com>",
-                "body": """URGENT SECURITY NOTICE
-                
-Your bank account has been temporarily BLOCKED due to suspicious activity.
-
-We have detected multiple unauthorized login attempts to your account from different locations. To protect your funds, we have temporarily restricted access to your account.
-
-To verify your identity and restore access immediately, please click on the link below:
-
-[SECURE VERIFICATION LINK]
-
-You must complete this verification within 24 hours, or your account will be permanently suspended and your funds may be seized.
-
-Bank Security Team
-"""
-            },
-            "spam-test-3": {
-                "subject": "CONGRATULATIONS! You've WON $10,000,000!",
-                "sender": "Lottery Winner <claim@megamillions-winner.org>",
-                "body": """CONGRATULATIONS!!!
-                
-Your email address has been randomly selected as the winner of our $10,000,000 USD International Lottery!
-
-Your email was chosen from over 250 million email addresses worldwide. This is not a joke or scam - you have actually won!
-
-To claim your prize, you need to:
-
-1. Send us your full name, address, and phone number
-2. Provide a copy of your ID/passport
-3. Pay a small processing fee of $500 USD to cover transfer taxes
-
-Please note that this offer is valid for 5 days only. Respond immediately to claim your millions!
-
-Best regards,
-International Lottery Commission
-"""
-            }
-        }
-        
-        if email_id in spam_emails_content:
-            return spam_emails_content[email_id]
-        else:
-            return {
-                "subject": "Unknown Sample Email",
-                "sender": "Unknown Sender",
-                "body": "This is a sample email content."
-            }
-
-    # Nếu không phải email mẫu, lấy từ Gmail API
+    """ Lấy nội dung chi tiết của email: từ database nếu đã lưu, nếu không thì tải từ Gmail và lưu lại """
+    # Email mẫu có nội dung cứng
+    if is_sample_email(email_id):
+        return get_sample_email(email_id)
+
+    # Đọc từ kho cục bộ trước: mở email tức thì và không cần mạng
+    with get_profiler().stage('email_content.local'):
+        stored = get_stored_email_content(email_id)
+    if stored is not None:
+        get_profiler().count('email_content.local_hits')
+        return stored
+
+    # Chưa có trong kho: lấy từ Gmail API rồi lưu lại cho những lần mở sau
+    get_profiler().count('email_content.network_fetches')
     service = get_gmail_service()
     email_data = service.users().messages().get(userId="me", id=email_id, format="full").execute()
-
-    email_info = {
-        "subject": "No Subject",
-        "sender": "Unknown Sender",
-        "body": "Không có nội dung",
+    email_info = extract_email_info(email_data)
+
+    if get_email_ids_without_body([email_id]):
+        # Email mới có metadata: chấm điểm luôn, luồng tải nền sẽ bỏ qua email này
+        store_email_bodies([email_info])
+    elif get_existing_email_ids([email_id]):
+        # Email đã chấm điểm nhưng lưu trước khi có kho nội dung
+        save_email_content(email_id, email_info["body"], email_info["body_html"], email_info["attachments"])
+    else:
+        store_emails_in_database([email_info])
+
+    return {
+        "subject": email_info["subject"],
+        "sender": email_info["from"],
+        "body": email_info["body"],
+        "body_html": email_info["body_html"],
+        "attachments": email_info["attachments"]
     }
-    attachments = []
-
-    def find_attachments(parts_list):
-        """Đệ quy tìm file đính kèm trong các parts"""
-        for part in parts_list:
-            filename = part.get("filename")
-            body = part.get("body", {})
-            mime_type = part.get("mimeType", "")
-
-            if filename and "attachmentId" in body:
-                attachments.append({
-                    "filename": filename,
-                    "attachmentId": body["attachmentId"]
-                })
-
-            if "parts" in part:
-                find_attachments(part["parts"])
-
-
-    # Lấy tiêu đề và người gửi
-    for header in email_data["payload"]["headers"]:
-        if header["name"] == "Subject":
-            email_info["subject"] = header["value"]
-        if header["name"] == "From":
-            email_info["sender"] = header["value"]
-
-    # Lấy nội dung email (dạng Base64)
-    if "parts" in email_data["payload"]:
-        parts = email_data["payload"]["parts"]
-        find_attachments(parts)
-
-        for part in parts:
-            if part["mimeType"] == "text/plain" and "body" in part:
-                body_data = part["body"].get("data")
-                if body_data:
-                    decoded_body = base64.urlsafe_b64decode(body_data).decode("utf-8")
-                    email_info["body"] = decoded_body
-
-    email_info["attachments"] = attachments
-    return email_info
 
 def download_attachment(email_id, attachment_id, filename, save_path="attachments"):
     """ Tải file đính kèm từ email """
@@ -0,0 +1,108 @@
+import os
+import random
+import time
+
+from app.profiling import get_profiler
+
+# ============== LẤY NHIỀU EMAIL BẰNG GMAIL BATCH REQUEST ================
+# Thay vì gọi messages.get(...).execute() lần lượt cho từng email (mỗi email
+# một lượt HTTPS), gộp tối đa ``batch_size`` lời gọi vào một HTTP request
+# multipart/mixed. Mỗi email có kết quả riêng: email lỗi tạm thời (429, 5xx,
+# vượt hạn mức) được thử lại với backoff, chỉ những email đó; email lỗi hẳn
+# (ví dụ 404 do đã bị xóa) được bỏ qua.
+
+# Gmail khuyến nghị tối đa 50 lời gọi mỗi batch (giới hạn cứng là 100)
+GMAIL_BATCH_SIZE = int(os.environ.get('PHISH_GMAIL_BATCH_SIZE', '50'))
+MAX_GMAIL_BATCH_SIZE = 100
+BATCH_MAX_RETRIES = 4
+BATCH_BACKOFF_SECONDS = 1.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError'}
+# Google chỉ nén gzip response khi User-Agent chứa "gzip" (httplib2 đã gửi Accept-Encoding: gzip)
+GMAIL_USER_AGENT = "PhisEmailApp (gzip)"
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def is_not_found(error):
+    """Lỗi 404: email không còn tồn tại trên Gmail"""
+    return getattr(getattr(error, 'resp', None), 'status', None) in (404, '404')
+
+
+def is_retryable(error):
+    """Lỗi tạm thời (nên thử lại) hay lỗi hẳn của một phần tử trong batch"""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        # Lỗi mạng/giao thức của cả batch
+        return True
+    status = int(status)
+    if status in RETRYABLE_STATUS:
+        return True
+    if status == 403:
+        return any(reason in str(error) for reason in RETRYABLE_REASONS)
+    return False
+
+
+def fetch_messages(service, message_ids, batch_size=GMAIL_BATCH_SIZE, max_retries=BATCH_MAX_RETRIES,
+                   backoff=BATCH_BACKOFF_SECONDS, not_found=None, **get_params):
+    """Lấy các message theo id bằng batch request, trả về danh sách theo thứ tự ``message_ids``.
+
+    ``get_params`` được truyền cho ``messages.get`` (mặc định ``format="full"``).
+    Email không lấy được sau ``max_retries`` lần thử lại bị bỏ khỏi kết quả;
+    nếu truyền ``not_found`` (một set), id của các email trả về 404 (đã bị xóa)
+    được thêm vào đó.
+    """
+    get_params.setdefault('format', 'full')
+    batch_size = max(1, min(batch_size, MAX_GMAIL_BATCH_SIZE))
+    profiler = get_profiler()
+    messages_api = service.users().messages()
+
+    results = {}
+    pending = list(dict.fromkeys(message_ids))
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            # Backoff lũy thừa có jitter trước khi thử lại các email lỗi
+            time.sleep(backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            profiler.count('gmail.retried_messages', len(pending))
+            print(f"[INFO] Thử lại {len(pending)} email (lần {attempt})")
+
+        retry = []
+        for chunk in _chunks(pending, batch_size):
+            failures = {}
+
+            def on_response(request_id, response, exception, failures=failures):
+                if exception is None:
+                    results[request_id] = response
+                else:
+                    failures[request_id] = exception
+
+            batch = service.new_batch_http_request(callback=on_response)
+            for message_id in chunk:
+                batch.add(messages_api.get(userId="me", id=message_id, **get_params), request_id=message_id)
+
+            try:
+                with profiler.stage('gmail_batch'):
+                    batch.execute()
+                profiler.count('gmail.batch_requests')
+            except Exception as e:
+                # Cả batch thất bại: thử lại những email chưa có kết quả
+                print(f"[WARNING] Batch request lỗi: {e}")
+                failures.update({message_id: e for message_id in chunk if message_id not in results})
+
+            for message_id, error in failures.items():
+                if attempt < max_retries and is_retryable(error):
+                    retry.append(message_id)
+                elif not_found is not None and is_not_found(error):
+                    not_found.add(message_id)
+                else:
+                    profiler.count('gmail.failed_messages')
+                    print(f"[ERROR] Không thể lấy email {message_id}: {error}")
+        pending = retry
+
+    profiler.count('gmail.messages_fetched', len(results))
+    return [results[message_id] for message_id in dict.fromkeys(message_ids) if message_id in results]
@@ -0,0 +1,229 @@
+import json
+
+from app.database import (apply_label_changes, delete_emails, get_all_email_ids, get_existing_email_ids,
+                          get_setting, set_setting)
+from app.gmail_batch import fetch_messages, is_not_found
+
+# ============== ĐỒNG BỘ TĂNG DẦN BẰNG GMAIL HISTORY API ================
+# Sau mỗi lần đồng bộ, historyId của hộp thư được lưu trong bảng settings.
+# Lần sau chỉ cần gọi users.history.list từ mốc đó để nhận đúng các thay đổi:
+# email mới, email bị xóa vĩnh viễn và nhãn được thêm/bỏ (TRASH, UNREAD, SPAM).
+# Chi phí mỗi lần làm mới là vài request nhỏ, không phụ thuộc kích thước hộp
+# thư. Khi mốc đã quá cũ (Gmail trả 404) thì đồng bộ lại từ đầu: lấy historyId
+# hiện tại, tải các email mới nhất còn thiếu và đối chiếu nhãn/xóa cho các email
+# đã lưu.
+#
+# historyId luôn được tiến lên, nhưng email mới không tải được (lỗi mạng, hết
+# hạn mức) được ghi lại trong settings và tải lại ở các lần đồng bộ sau, tối đa
+# MAX_FETCH_ATTEMPTS lần, để không email nào bị bỏ sót vĩnh viễn.
+
+HISTORY_ID_KEY = 'gmail_history_id'
+PENDING_IDS_KEY = 'gmail_pending_message_ids'
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+HISTORY_PAGE_SIZE = 500
+MAX_FETCH_ATTEMPTS = 5
+# Đối chiếu khi đồng bộ toàn bộ chỉ cần id và nhãn
+LABEL_FIELDS = "id,labelIds"
+
+
+class HistoryExpired(Exception):
+    """historyId đã lưu không còn hợp lệ, cần đồng bộ lại toàn bộ"""
+
+
+class SyncResult:
+    """Tóm tắt một lần đồng bộ"""
+
+    def __init__(self, full_sync=False):
+        self.full_sync = full_sync
+        self.added = 0
+        self.deleted = 0
+        self.labels_changed = 0
+        self.pending = 0
+        self.history_id = None
+
+    @property
+    def changed(self):
+        return bool(self.added or self.deleted or self.labels_changed)
+
+    def __repr__(self):
+        kind = "toàn bộ" if self.full_sync else "tăng dần"
+        return (f"SyncResult({kind}: +{self.added} email, -{self.deleted} email, "
+                f"{self.labels_changed} thay đổi nhãn, {self.pending} email chờ tải lại, "
+                f"historyId={self.history_id})")
+
+
+class MailboxSync:
+    """Đồng bộ bảng emails với hộp thư Gmail dựa trên historyId"""
+
+    def __init__(self, service=None, full_sync_results=50):
+        self._service = service
+        self.full_sync_results = full_sync_results
+
+    @property
+    def service(self):
+        if self._service is None:
+            from app.fetch_emails import get_gmail_service
+            self._service = get_gmail_service()
+        return self._service
+
+    @property
+    def history_id(self):
+        return get_setting(HISTORY_ID_KEY)
+
+    @staticmethod
+    def load_pending():
+        """Các email chưa tải được ở lần đồng bộ trước: ``{id: số lần đã thử}``"""
+        try:
+            return json.loads(get_setting(PENDING_IDS_KEY) or '{}')
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def save_pending(pending):
+        set_setting(PENDING_IDS_KEY, json.dumps(pending) if pending else None)
+
+    def list_history(self, start_history_id):
+        """Đọc toàn bộ bản ghi history sau ``start_history_id``; trả về (bản ghi, historyId mới nhất)"""
+        history_api = self.service.users().history()
+        records = []
+        latest = start_history_id
+        page_token = None
+        while True:
+            params = {"userId": "me", "startHistoryId": start_history_id,
+                      "historyTypes": HISTORY_TYPES, "maxResults": HISTORY_PAGE_SIZE}
+            if page_token:
+                params["pageToken"] = page_token
+            try:
+                response = history_api.list(**params).execute()
+            except Exception as e:
+                if is_not_found(e):
+                    raise HistoryExpired(start_history_id) from e
+                raise
+            records.extend(response.get("history", []))
+            latest = response.get("historyId", latest)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return records, latest
+
+    @staticmethod
+    def collapse_history(records):
+        """Gộp các bản ghi history theo thứ tự thành (id thêm mới, id bị xóa, thay đổi nhãn)"""
+        added = {}
+        deleted = set()
+        label_changes = {}
+        for record in records:
+            for item in record.get("messagesAdded", []):
+                message = item["message"]
+                if "DRAFT" not in message.get("labelIds", []):
+                    added[message["id"]] = True
+                    deleted.discard(message["id"])
+            for item in record.get("messagesDeleted", []):
+                message_id = item["message"]["id"]
+                added.pop(message_id, None)
+                label_changes.pop(message_id, None)
+                deleted.add(message_id)
+            for key, value in (("labelsAdded", True), ("labelsRemoved", False)):
+                for item in record.get(key, []):
+                    message_id = item["message"]["id"]
+                    if message_id in deleted:
+                        continue
+                    labels = label_changes.setdefault(message_id, {})
+                    for label in item.get("labelIds", []):
+                        labels[label] = value
+        return list(added), deleted, label_changes
+
+    def store_new(self, message_ids, result, deleted=()):
+        """Tải và lưu các email mới cùng các email còn chờ từ lần trước.
+
+        Email vẫn chưa có trong database sau khi tải được ghi lại để thử lại lần
+        sau; bỏ hẳn sau ``MAX_FETCH_ATTEMPTS`` lần hoặc khi Gmail báo đã xóa.
+        """
+        from app.fetch_emails import store_messages
+
+        pending = self.load_pending()
+        wanted = [i for i in dict.fromkeys([*pending, *message_ids]) if i not in deleted]
+        existing = get_existing_email_ids(wanted)
+        to_fetch = [i for i in wanted if i not in existing]
+        result.added = store_messages(self.service, to_fetch)
+
+        stored = get_existing_email_ids(to_fetch)
+        remaining = {}
+        for message_id in to_fetch:
+            if message_id in stored:
+                continue
+            attempts = pending.get(message_id, 0) + 1
+            if attempts >= MAX_FETCH_ATTEMPTS:
+                print(f"[WARNING] Bỏ qua email {message_id} sau {attempts} lần tải không thành công")
+            else:
+                remaining[message_id] = attempts
+        if remaining:
+            print(f"[WARNING] {len(remaining)} email chưa tải được, sẽ thử lại ở lần đồng bộ sau")
+        self.save_pending(remaining)
+        result.pending = len(remaining)
+
+    def reconcile(self, result):
+        """Đối chiếu các email đã lưu với Gmail khi không có history: nhãn và email bị xóa.
+
+        Chỉ tải ``id,labelIds`` (format=minimal) của từng email đã lưu; email
+        Gmail trả 404 bị xóa khỏi database, các email khác được cập nhật
+        TRASH/UNREAD theo nhãn hiện tại và SPAM nếu đang có nhãn đó.
+        """
+        gone = set()
+        messages = fetch_messages(self.service, get_all_email_ids(), not_found=gone,
+                                  format="minimal", fields=LABEL_FIELDS)
+        label_changes = {}
+        for message in messages:
+            labels = set(message.get("labelIds", []))
+            changes = {"TRASH": "TRASH" in labels, "UNREAD": "UNREAD" in labels}
+            if "SPAM" in labels:
+                changes["SPAM"] = True
+            label_changes[message["id"]] = changes
+        if gone:
+            result.deleted = delete_emails(gone)
+        if label_changes:
+            result.labels_changed = apply_label_changes(label_changes)
+        return gone
+
+    def full_sync(self):
+        """Đồng bộ lại từ đầu: lưu historyId hiện tại, đối chiếu các email đã lưu rồi tải email mới nhất còn thiếu"""
+        result = SyncResult(full_sync=True)
+        # Lấy mốc trước khi liệt kê để không bỏ sót thay đổi xảy ra trong lúc đồng bộ
+        result.history_id = self.service.users().getProfile(userId="me").execute()["historyId"]
+        listing = self.service.users().messages().list(
+            userId="me", maxResults=self.full_sync_results, includeSpamTrash=True).execute()
+        ids = [message["id"] for message in listing.get("messages", [])]
+        gone = self.reconcile(result)
+        self.store_new(ids, result, deleted=gone)
+        set_setting(HISTORY_ID_KEY, result.history_id)
+        return result
+
+    def sync(self):
+        """Áp dụng các thay đổi kể từ lần đồng bộ trước (hoặc đồng bộ toàn bộ nếu cần)"""
+        start_history_id = self.history_id
+        if not start_history_id:
+            print("[INFO] Chưa có historyId, đồng bộ toàn bộ")
+            return self.full_sync()
+
+        try:
+            records, latest = self.list_history(start_history_id)
+        except HistoryExpired:
+            print(f"[WARNING] historyId {start_history_id} đã hết hạn, đồng bộ lại toàn bộ")
+            return self.full_sync()
+
+        result = SyncResult()
+        added, deleted, label_changes = self.collapse_history(records)
+        self.store_new(added, result, deleted=deleted)
+        if deleted:
+            result.deleted = delete_emails(deleted)
+        if label_changes:
+            result.labels_changed = apply_label_changes(label_changes)
+        result.history_id = latest
+        set_setting(HISTORY_ID_KEY, latest)
+        return result
+
+
+def sync_mailbox(service=None, full_sync_results=50):
+    """Đồng bộ hộp thư một lần; trả về ``SyncResult``"""
+    result = MailboxSync(service, full_sync_results).sync()
+    print(f"[INFO] {result}")
+    return result
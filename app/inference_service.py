@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# ============== DỊCH VỤ SUY LUẬN GOM LÔ (MICRO-BATCHING) ================
+# Các nơi gọi (lấy email, refresh, cửa sổ chi tiết) gửi văn bản vào hàng đợi
+# và nhận về Future. Mỗi lời gọi là một yêu cầu trong hàng đợi: ``predict_batch``
+# gửi cả danh sách thành một yêu cầu. Luồng nền lấy hết các yêu cầu đang chờ
+# rồi chạy predict_batch theo lô tối đa ``max_batch_size``. Chỉ khi có yêu cầu
+# của nơi gọi khác đến cùng lúc mới chờ thêm tối đa ``max_wait_ms`` để lô đầy
+# hơn; một yêu cầu đơn lẻ được chấm ngay, không phải chờ.
+# Số luồng intra-op của torch do ứng dụng (main.py) đặt qua OMP_NUM_THREADS. Số
+# luồng inter-op không có biến môi trường tương ứng nên được đặt một lần ở đây,
+# ngay trước khi dịch vụ nạp model lần đầu (torch chỉ cho đặt trước khi có việc
+# song song nào chạy).
+
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('PHISH_BATCH_WAIT_MS', '5'))
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get('PHISH_BATCH_SIZE', '32'))
+DEFAULT_NUM_INTEROP_THREADS = int(os.environ.get('PHISH_TORCH_INTEROP_THREADS', '1'))
+
+_STOP = object()
+
+_interop_configured = False
+_interop_lock = threading.Lock()
+
+
+def configure_interop_threads(num_threads=DEFAULT_NUM_INTEROP_THREADS):
+    """Đặt số luồng inter-op của torch (chỉ lần gọi đầu tiên có tác dụng)"""
+    global _interop_configured
+    with _interop_lock:
+        if _interop_configured:
+            return
+        _interop_configured = True
+        try:
+            import torch
+            torch.set_num_interop_threads(num_threads)
+            print(f"[INFO] Số luồng inter-op của torch: {num_threads}")
+        except ImportError:
+            pass
+        except RuntimeError as e:
+            # torch đã chạy việc song song trước đó (ví dụ nơi khác đã nạp model)
+            print(f"[WARNING] Không thể đặt số luồng inter-op của torch: {e}")
+
+
+class InferenceService:
+    """Luồng nền gom các yêu cầu chấm điểm thành lô cho SpamDetector"""
+
+    def __init__(self, detector=None, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        self._detector = detector
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.requests = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="InferenceService", daemon=True)
+        self._thread.start()
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            configure_interop_threads()
+            from app.spam_detector import get_spam_detector
+            self._detector = get_spam_detector()
+        return self._detector
+
+    @property
+    def model_version(self):
+        return self.detector.model_version
+
+    def submit(self, text):
+        """Gửi một văn bản để chấm điểm, trả về Future chứa xác suất spam"""
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        """Gửi nhiều văn bản thành một yêu cầu, trả về danh sách Future theo thứ tự"""
+        entries = [(text, Future()) for text in texts]
+        if entries:
+            self._queue.put(entries)
+        return [future for _, future in entries]
+
+    def predict(self, text, timeout=None):
+        """Chấm điểm đồng bộ (chờ kết quả của lô chứa văn bản này)"""
+        return self.submit(text).result(timeout)
+
+    def predict_batch(self, texts, timeout=None):
+        return [future.result(timeout) for future in self.submit_many(texts)]
+
+    def stop(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect_batch(self, first):
+        """Lấy các yêu cầu đang chờ; chỉ chờ thêm (tối đa ``max_wait``) khi có yêu cầu từ nơi gọi khác"""
+        batch = list(first)
+        requests = 1
+        deadline = None
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                if requests == 1:
+                    break  # Chỉ một nơi gọi: chấm ngay, không chờ
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_wait
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                self._queue.put(_STOP)  # Xử lý nốt lô hiện tại rồi mới dừng
+                break
+            batch.extend(item)
+            requests += 1
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            entries = [entry for entry in self._collect_batch(item)
+                       if entry[1].set_running_or_notify_cancel()]
+            for start in range(0, len(entries), self.max_batch_size):
+                self._score(entries[start:start + self.max_batch_size])
+
+    def _score(self, batch):
+        try:
+            scores = self.detector.predict_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        for (_, future), score in zip(batch, scores):
+            future.set_result(score)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_inference_service():
+    """Trả về dịch vụ suy luận dùng chung cho toàn ứng dụng"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = InferenceService()
+    return _service
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import deque
+
+if getattr(sys, 'frozen', False):
+    RULES_DIR = os.path.join(sys._MEIPASS, 'app')
+else:
+    RULES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_RULES_PATH = os.path.join(RULES_DIR, 'spam_keywords.json')
+
+# Các nhóm từ khóa được keyword_based_prediction cộng điểm riêng
+CATEGORIES = ('urgent', 'money', 'security', 'sensitive_info')
+
+
+class KeywordRule:
+    """Một cụm từ khóa cùng nhóm (category) và trọng số của nó"""
+
+    def __init__(self, phrase, category=None, weight=1, kind='keyword'):
+        self.phrase = phrase.lower()
+        self.category = category
+        self.weight = weight
+        self.kind = kind  # 'keyword' hoặc 'pattern' (mẫu câu đáng ngờ)
+
+
+class KeywordEngine:
+    """Bộ so khớp nhiều mẫu Aho–Corasick được biên dịch một lần.
+
+    Trie của mọi cụm từ (goto) được bổ sung liên kết fail theo BFS, rồi gộp
+    thành bảng chuyển trạng thái đầy đủ cho từng trạng thái (DFA): mỗi ký tự
+    của văn bản chỉ cần một lần tra dict, không phải lần theo fail lúc quét.
+    Mỗi trạng thái giữ danh sách rule kết thúc tại đó (kể cả qua fail), nên
+    các cụm chồng lên nhau ("verify" và "verify identity") đều được báo. Chỉ
+    một lượt quét qua văn bản, chi phí không phụ thuộc số cụm từ.
+    """
+
+    def __init__(self, keywords, suspicious_patterns=()):
+        self.rules = list(keywords) + [KeywordRule(p, kind='pattern') for p in suspicious_patterns]
+
+        # Trie (goto): trạng thái i có goto[i] = {ký tự: trạng thái con}, outputs[i] = rule kết thúc tại i
+        goto = [{}]
+        outputs = [[]]
+        for index, rule in enumerate(self.rules):
+            if not rule.phrase:
+                continue
+            state = 0
+            for char in rule.phrase:
+                child = goto[state].get(char)
+                if child is None:
+                    child = len(goto)
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][char] = child
+                state = child
+            outputs[state].append(index)
+
+        # Liên kết fail theo BFS; bảng chuyển của một trạng thái = bảng của trạng thái fail + goto của nó
+        self._delta = [None] * len(goto)
+        self._delta[0] = dict(goto[0])
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            target = fail[state]
+            outputs[state].extend(outputs[target])
+            delta = dict(self._delta[target])
+            delta.update(goto[state])
+            self._delta[state] = delta
+            for char, child in goto[state].items():
+                fail[child] = self._delta[target].get(char, 0)
+                queue.append(child)
+        self._outputs = [tuple(output) for output in outputs]
+        self._lengths = [len(rule.phrase) for rule in self.rules]
+
+        # Các từ đơn xuất hiện trong cụm từ khóa, dùng để ước lượng mật độ từ khóa theo token
+        self.keyword_tokens = frozenset(
+            word for rule in self.rules if rule.kind == 'keyword' for word in rule.phrase.split())
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES_PATH):
+        """Đọc bộ quy tắc từ file JSON ({"keywords": [...], "suspicious_patterns": [...]})"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        keywords = [
+            KeywordRule(item['phrase'], item.get('category'), item.get('weight', 1))
+            for item in data.get('keywords', [])
+        ]
+        return cls(keywords, data.get('suspicious_patterns', []))
+
+    def find_matches(self, text):
+        """Trả về mọi lần xuất hiện dưới dạng (rule_index, start, end); text phải là chữ thường"""
+        matches = []
+        delta = self._delta
+        outputs = self._outputs
+        lengths = self._lengths
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    matches.append((index, end - lengths[index], end))
+        return matches
+
+    def matched_rules(self, text):
+        """Tập index các rule xuất hiện trong ``text`` (chữ thường), không cần vị trí"""
+        matched = set()
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                matched.update(outputs[state])
+        return matched
+
+    def scan(self, text):
+        """Tổng hợp kết quả so khớp cho keyword_based_prediction.
+
+        Trả về (danh sách cụm từ khóa khớp theo thứ tự trong file quy tắc,
+        tổng trọng số từ khóa, trọng số theo từng nhóm, có mẫu câu đáng ngờ hay không).
+        """
+        matched = sorted(self.matched_rules(text))
+        keywords = []
+        keyword_weight = 0
+        category_weights = dict.fromkeys(CATEGORIES, 0)
+        has_pattern = False
+        for index in matched:
+            rule = self.rules[index]
+            if rule.kind == 'pattern':
+                has_pattern = True
+                continue
+            keywords.append(rule.phrase)
+            keyword_weight += rule.weight
+            if rule.category in category_weights:
+                category_weights[rule.category] += rule.weight
+        return keywords, keyword_weight, category_weights, has_pattern
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_keyword_engine():
+    """Trả về bộ quy tắc từ khóa dùng chung, nạp từ file một lần"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                try:
+                    _engine = KeywordEngine.from_file()
+                except Exception as e:
+                    print(f"[ERROR] Không thể tải bộ quy tắc từ khóa {DEFAULT_RULES_PATH}: {e}")
+                    _engine = KeywordEngine([])
+    return _engine
+
+
+def reload_keyword_engine(path=DEFAULT_RULES_PATH):
+    """Nạp lại bộ quy tắc sau khi file từ khóa được cập nhật"""
+    global _engine
+    engine = KeywordEngine.from_file(path)
+    with _engine_lock:
+        _engine = engine
+    return engine
+
+
+def file_fingerprint(path):
+    """Tạo dấu vân tay rẻ cho một file (tên, kích thước, thời điểm sửa đổi)"""
+    if not path:
+        return 'none'
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+    raw = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def keyword_score(text, engine=None):
+    """Phân tích dựa trên từ khóa khi model ML không khả dụng, trả về (score, từ khóa khớp)"""
+    if not text or not isinstance(text, str):
+        return 0.0, []
+
+    # Chuyển text về chữ thường để dễ so sánh
+    text = text.lower()
+
+    # Quét một lượt bằng bộ quy tắc từ khóa đã biên dịch (app/spam_keywords.json)
+    matched_keywords, keyword_count, category_weights, has_suspicious_pattern = \
+        (engine or get_keyword_engine()).scan(text)
+    urgent_count = category_weights['urgent']
+    money_count = category_weights['money']
+    security_count = category_weights['security']
+    sensitive_info_count = category_weights['sensitive_info']
+
+    score = min(0.15 * keyword_count, 0.75)
+
+    # Các yếu tố khác
+    exclamation_count = text.count('!')
+    if exclamation_count > 3:
+        score += min(0.05 * (exclamation_count - 3), 0.15)
+
+    words = text.split()
+    uppercase_words = sum(1 for word in words if word.isupper() and len(word) > 2)
+    if uppercase_words > 3:
+        score += min(0.05 * (uppercase_words - 3), 0.2)
+
+    if '$' in text or '€' in text or '£' in text or 'tiền' in text or 'đô la' in text:
+        score += 0.15
+
+    url_count = text.count('http') + text.count('www') + text.count('.com') + text.count('.net')
+    if url_count > 1:
+        score += min(0.1 * url_count, 0.25)
+
+    if has_suspicious_pattern:
+        score += 0.15
+
+    if len(text) < 100:
+        score *= (len(text) / 100)
+
+    if urgent_count > 0:
+        score += min(0.2 * urgent_count, 0.4)
+
+    if sensitive_info_count > 0:
+        score += min(0.25 * sensitive_info_count, 0.5)
+
+    if urgent_count > 0 and sensitive_info_count > 0:
+        score += 0.2
+
+    if money_count > 0 and sensitive_info_count > 0:
+        score += 0.2
+
+    sentences = re.split(r'[.!?]', text)
+    short_sentences = sum(1 for s in sentences if len(s.strip()) < 5)
+    if short_sentences > len(sentences) * 0.5:
+        score += 0.1
+
+    score = min(score, 0.98)
+
+    # 🔥 Trả về cả score và danh sách từ khóa
+    return score, matched_keywords
+
+
+class KeywordScorer:
+    """Bộ chấm điểm chỉ dùng từ khóa, không cần torch.
+
+    Có cùng giao diện ``predict``/``keyword_based_prediction``/``model_version``
+    với SpamDetector để dùng thay thế khi model AI chưa được nạp xong.
+    """
+
+    @property
+    def model_version(self):
+        return f"keywords-only|{file_fingerprint(DEFAULT_RULES_PATH)}"
+
+    def keyword_based_prediction(self, text):
+        return keyword_score(text)
+
+    def predict(self, text):
+        return keyword_score(text)
@@ -1,8 +1,16 @@
-from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QMessageBox
+from PyQt6.QtCore import QObject, pyqtSignal
 import sys
 import os
 from app.authenticate import authenticate_gmail
 from app.email_manager import EmailManagerWindow  # Import màn hình quản lý email
+from app.model_warmup import get_model_warmup, start_model_warmup
+
+
+class ModelReadySignal(QObject):
+    """Chuyển thông báo nạp model xong từ luồng nền về luồng giao diện"""
+    ready = pyqtSignal(bool)
+
 
 class LoginWindow(QWidget):
     def __init__(self):
@@ -51,6 +59,24 @@ class LoginWindow(QWidget):
             self.label.setText("✅ Đã có thông tin đăng nhập Gmail. Nhấn nút để tiếp tục.")
             self.login_button.setText("Tiếp tục với tài khoản đã đăng nhập")
 
+        # Model AI được nạp nền khi cửa sổ hiện lên, báo kết quả qua tín hiệu Qt
+        self.model_signal = ModelReadySignal(self)
+        self.model_signal.ready.connect(self.on_model_ready)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not get_model_warmup().started:
+            start_model_warmup().add_done_callback(self.model_signal.ready.emit)
+
+    def on_model_ready(self, model_loaded):
+        if model_loaded:
+            return
+        QMessageBox.warning(self if self.isVisible() else None, "Cảnh báo",
+            "Model AI không được tìm thấy hoặc không hợp lệ!\n" +
+            "Tính năng phát hiện email lừa đảo chỉ dùng từ khóa.\n" +
+            "Hãy đảm bảo file 'best_model.pth' nằm trong thư mục 'models'."
+        )
+
     def login(self):
         try:
             authenticate_gmail()
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+
+from app.keyword_engine import file_fingerprint
+
+# ============== ĐỊNH DẠNG MODEL TẢI NHANH ================
+# Một artifact là một thư mục (ví dụ models/best_model/) gồm:
+#   - header.json : tham số mô hình (embedding_dim, hidden_dim, num_layers, ...)
+#                   và bảng tensor (tên, kiểu, shape, offset trong weights.bin)
+#   - weights.bin : toàn bộ trọng số dạng nhị phân thô, mỗi tensor căn lề 64 byte
+#   - vocab.txt   : mỗi dòng một token, số dòng chính là index
+# Khi tải, weights.bin được memory-map nên không sao chép trọng số vào RAM và
+# không cần unpickle đối tượng Python nào (kể cả Vocabulary).
+# header.json ghi dấu vân tay của checkpoint .pth nguồn ("source"). Artifact
+# nằm cạnh một file .pth (models/best_model/ và models/best_model.pth) chỉ được
+# dùng khi dấu vân tay đó khớp với file .pth hiện tại: thay best_model.pth thì
+# artifact cũ bị bỏ qua (và được tạo lại bởi ``ensure_artifact``).
+
+ARTIFACT_FORMAT = "phishemail-lstm"
+ARTIFACT_VERSION = 1
+HEADER_FILE = "header.json"
+WEIGHTS_FILE = "weights.bin"
+VOCAB_FILE = "vocab.txt"
+ALIGNMENT = 64
+
+
+def artifact_dir_for(model_path):
+    """Thư mục artifact tương ứng với một file .pth (models/best_model.pth -> models/best_model)"""
+    return os.path.splitext(model_path)[0]
+
+
+def checkpoint_for(artifact_dir):
+    """File .pth nằm cạnh một thư mục artifact (models/best_model -> models/best_model.pth)"""
+    return os.path.normpath(artifact_dir) + '.pth'
+
+
+def source_fingerprint(model_path):
+    """Dấu vân tay của checkpoint nguồn: của chính file .pth, hoặc giá trị ghi trong header của artifact"""
+    if os.path.isdir(model_path):
+        return read_header(model_path).get("source", {}).get("fingerprint")
+    return file_fingerprint(model_path)
+
+
+def artifact_is_current(artifact_dir, header=None):
+    """False nếu có file .pth cạnh artifact nhưng artifact không được tạo từ đúng file đó"""
+    checkpoint = checkpoint_for(artifact_dir)
+    if not os.path.exists(checkpoint):
+        return True
+    header = header or read_header(artifact_dir)
+    return header.get("source", {}).get("fingerprint") == file_fingerprint(checkpoint)
+
+
+def find_artifact(model_paths):
+    """Trả về thư mục artifact còn hợp lệ đầu tiên theo thứ tự ``model_paths``.
+
+    Trả về None khi gặp một checkpoint .pth trước (không có artifact, hoặc
+    artifact cũ hơn .pth); người gọi nạp chính file .pth đó.
+    """
+    for path in model_paths:
+        candidate = path if os.path.isdir(path) else artifact_dir_for(path)
+        if os.path.exists(os.path.join(candidate, HEADER_FILE)):
+            try:
+                if artifact_is_current(candidate):
+                    return candidate
+            except ValueError as e:
+                print(f"[WARNING] Bỏ qua artifact {candidate}: {e}")
+            else:
+                print(f"[WARNING] Artifact {candidate} không khớp với {checkpoint_for(candidate)}, "
+                      f"dùng checkpoint .pth (chạy lại python -m app.model_artifact để tạo lại)")
+        if os.path.isfile(path):
+            return None
+    return None
+
+
+def _vocab_tokens(vocab):
+    """Danh sách token theo thứ tự index từ Vocabulary hoặc dict token->index"""
+    token2idx = vocab.token2idx if hasattr(vocab, 'token2idx') else vocab
+    tokens = [''] * (max(token2idx.values()) + 1)
+    for token, index in token2idx.items():
+        if '\n' in token:
+            raise ValueError(f"Token chứa ký tự xuống dòng: {token!r}")
+        tokens[index] = token
+    return tokens
+
+
+def _replace(output_dir, name):
+    """Đổi file tạm thành file chính; tiến trình đang memory-map file cũ vẫn giữ nội dung cũ"""
+    path = os.path.join(output_dir, name)
+    os.replace(path + '.tmp', path)
+
+
+def write_artifact(output_dir, state_dict, vocab_tokens, hyperparameters, source=None):
+    """Ghi artifact từ state_dict, danh sách token và tham số mô hình.
+
+    ``source`` là dấu vân tay của checkpoint .pth nguồn. Mỗi file được ghi ra
+    file tạm rồi đổi tên, header.json sau cùng, nên ghi đè một artifact đang
+    được dùng là an toàn.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    tensors = {}
+    offset = 0
+    with open(os.path.join(output_dir, WEIGHTS_FILE + '.tmp'), 'wb') as f:
+        for name, tensor in state_dict.items():
+            array = tensor.detach().cpu().contiguous().numpy()
+            padding = (-offset) % ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(array.tobytes())
+            tensors[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+                "nbytes": array.nbytes,
+            }
+            offset += array.nbytes
+
+    with open(os.path.join(output_dir, VOCAB_FILE + '.tmp'), 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(vocab_tokens))
+
+    header = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "hyperparameters": hyperparameters,
+        "vocab_size": len(vocab_tokens),
+        "vocab_file": VOCAB_FILE,
+        "weights_file": WEIGHTS_FILE,
+        "tensors": tensors,
+    }
+    if source:
+        header["source"] = {"fingerprint": source}
+    with open(os.path.join(output_dir, HEADER_FILE + '.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=2)
+    for name in (WEIGHTS_FILE, VOCAB_FILE, HEADER_FILE):
+        _replace(output_dir, name)
+    return output_dir
+
+
+def convert_checkpoint(model_path, output_dir=None):
+    """Chuyển checkpoint .pth (pickle) sang artifact memory-map"""
+    from app.spam_detector import Vocabulary, checkpoint_hyperparameters
+
+    # Checkpoint cũ được pickle khi Vocabulary nằm trong __main__
+    sys.modules['__main__'].Vocabulary = Vocabulary
+    source = file_fingerprint(model_path)
+    checkpoint = torch.load(model_path, map_location='cpu', weights_only=False)
+    if not isinstance(checkpoint, dict) or 'model_state_dict' not in checkpoint or 'vocab' not in checkpoint:
+        raise ValueError("Checkpoint phải chứa 'model_state_dict' và 'vocab'")
+
+    output_dir = output_dir or artifact_dir_for(model_path)
+    write_artifact(output_dir, checkpoint['model_state_dict'],
+                   _vocab_tokens(checkpoint['vocab']), checkpoint_hyperparameters(checkpoint), source)
+    print(f"[INFO] Đã chuyển {model_path} sang {output_dir}")
+    return output_dir
+
+
+def read_header(artifact_dir):
+    with open(os.path.join(artifact_dir, HEADER_FILE), 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    if header.get("format") != ARTIFACT_FORMAT or header.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Định dạng artifact không được hỗ trợ: {header.get('format')} v{header.get('version')}")
+    return header
+
+
+def load_vocab(artifact_dir, header=None):
+    """Đọc vocab.txt thành dict token->index (chỉ giữ một chiều tra cứu)"""
+    header = header or read_header(artifact_dir)
+    with open(os.path.join(artifact_dir, header["vocab_file"]), 'r', encoding='utf-8') as f:
+        return {token: index for index, token in enumerate(f.read().split('\n')) if token}
+
+
+def load_state_dict(artifact_dir, header=None):
+    """Memory-map weights.bin và trả về state_dict gồm các tensor dùng chung bộ nhớ với file"""
+    header = header or read_header(artifact_dir)
+    # mode='c' (copy-on-write): không sao chép, trang chỉ được đọc khi cần
+    weights = np.memmap(os.path.join(artifact_dir, header["weights_file"]), dtype=np.uint8, mode='c')
+    state_dict = {}
+    for name, info in header["tensors"].items():
+        start = info["offset"]
+        array = weights[start:start + info["nbytes"]].view(np.dtype(info["dtype"])).reshape(info["shape"])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def load_artifact(artifact_dir):
+    """Tải model từ artifact; trả về (model, vocab dict, đường dẫn weights.bin)"""
+    from app.spam_detector import LSTMModel
+
+    header = read_header(artifact_dir)
+    vocab = load_vocab(artifact_dir, header)
+    state_dict = load_state_dict(artifact_dir, header)
+
+    # Khởi tạo trên thiết bị 'meta' để không cấp phát trọng số ngẫu nhiên,
+    # sau đó gán thẳng các tensor memory-map vào model
+    with torch.device('meta'):
+        model = LSTMModel(vocab_size=header["vocab_size"], **header["hyperparameters"])
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    return model, vocab, os.path.join(artifact_dir, header["weights_file"])
+
+
+if __name__ == "__main__":
+    # python -m app.model_artifact models/best_model.pth [thư_mục_đích]
+    if len(sys.argv) < 2:
+        print("Cách dùng: python -m app.model_artifact <checkpoint.pth> [output_dir]")
+        sys.exit(1)
+    convert_checkpoint(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
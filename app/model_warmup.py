@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+# ============== NẠP MODEL AI NỀN SAU KHI MỞ CỬA SỔ ĐĂNG NHẬP ================
+# app.spam_detector (torch, NLTK) không được import trên đường khởi động: cửa sổ
+# đăng nhập gọi start_model_warmup() khi hiện lên, một luồng nền nạp model qua
+# dịch vụ suy luận và chạy một lần forward. Nơi cần điểm spam có thể chờ với
+# timeout (wait) hoặc dùng bộ chấm từ khóa trong lúc model chưa sẵn sàng.
+
+# Thời gian tối đa (giây) bộ chấm điểm theo tầng chờ model trước khi dùng từ khóa
+MODEL_WAIT_SECONDS = float(os.environ.get('PHISH_MODEL_WAIT_S', '30'))
+WARMUP_TEXT = "Subject: warm up\n\nPlease verify your account to continue."
+
+
+class ModelWarmup:
+    """Nạp SpamDetector dùng chung trong luồng nền, báo khi xong qua callback"""
+
+    def __init__(self):
+        self.model_loaded = False
+        self.elapsed = None
+        self._thread = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def start(self):
+        """Bắt đầu nạp model (chỉ lần gọi đầu tiên có tác dụng)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ModelWarmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def is_ready(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Chờ nạp xong tối đa ``timeout`` giây; trả về True nếu đã xong"""
+        return self._event.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """Gọi ``callback(model_loaded)`` khi nạp xong (ngay lập tức nếu đã xong)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.model_loaded)
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            from app.inference_service import get_inference_service
+            from app.text_preprocessor import get_text_preprocessor
+
+            get_text_preprocessor()
+            service = get_inference_service()
+            # Model được nạp trong luồng của dịch vụ suy luận, sau khi số luồng torch đã được cấu hình
+            service.predict(WARMUP_TEXT)
+            self.model_loaded = service.detector.model is not None
+        except Exception as e:
+            print(f"[ERROR] Lỗi khi nạp model AI nền: {e}")
+        self.elapsed = time.perf_counter() - start
+        print(f"[INFO] Nạp model AI xong sau {self.elapsed:.2f}s (model {'sẵn sàng' if self.model_loaded else 'không khả dụng'})")
+
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self.model_loaded)
+            except Exception as e:
+                print(f"[WARNING] Lỗi trong callback nạp model: {e}")
+
+
+_warmup = ModelWarmup()
+
+
+def get_model_warmup():
+    return _warmup
+
+
+def start_model_warmup():
+    return _warmup.start()
+
+
+def get_detector(timeout=0):
+    """SpamDetector dùng chung nếu đã nạp xong trong ``timeout`` giây, ngược lại bộ chấm từ khóa"""
+    if _warmup.start().wait(timeout):
+        from app.spam_detector import get_spam_detector
+        return get_spam_detector()
+    from app.keyword_engine import KeywordScorer
+    return KeywordScorer()
@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import threading
+
+# ============== TÀI NGUYÊN NLTK ĐÓNG GÓI SẴN ================
+# Stopwords tiếng Anh và phần dữ liệu của mô hình Punkt cần cho văn bản đã chuyển
+# về chữ thường (từ viết tắt, collocation và các từ có thể mở đầu câu khi viết
+# thường) được biên dịch một lần thành app/nltk_resources.json (vài KB) và đóng gói cùng ứng dụng
+# (kể cả bản PyInstaller trong main.spec). Khi chạy không cần nltk_data, không
+# gọi mạng và không dò thư mục nào; file chỉ được đọc ở lần dùng đầu tiên.
+#   python -m app.nltk_resources build   # biên dịch lại từ NLTK (máy có nltk_data)
+#   python -m app.nltk_resources check   # kiểm tra import app.spam_detector không làm I/O
+
+if getattr(sys, 'frozen', False):
+    RESOURCES_DIR = os.path.join(sys._MEIPASS, 'app')
+else:
+    RESOURCES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_RESOURCES_PATH = os.path.join(RESOURCES_DIR, 'nltk_resources.json')
+
+# Phần mở rộng của file mã nguồn/thư viện được phép mở khi import module
+_CODE_SUFFIXES = ('.py', '.pyc', '.so', '.pyd', '.dll', '.dylib', '.pth')
+# Thư mục hệ thống mà thư viện (torch, numpy...) tự đọc khi import
+_SYSTEM_DIRS = ('/proc/', '/sys/', '/dev/')
+
+
+def _library_dirs():
+    """Thư mục của trình thông dịch và các gói đã cài: file trong đó là việc của thư viện"""
+    import site
+    dirs = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+    try:
+        dirs.update(site.getsitepackages())
+        dirs.add(site.getusersitepackages())
+    except AttributeError:
+        pass
+    return tuple(os.path.join(os.path.abspath(d), '') for d in dirs if d)
+
+
+class NltkResources:
+    """Stopwords và dữ liệu Punkt đã nạp vào bộ nhớ"""
+
+    def __init__(self, stopwords=(), abbreviations=(), collocations=(), sentence_starters=()):
+        self.stopwords = frozenset(stopwords)
+        self.abbreviations = frozenset(abbreviations)
+        self.collocations = frozenset(tuple(pair) for pair in collocations)
+        self.sentence_starters = frozenset(sentence_starters)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RESOURCES_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('stopwords', []), data.get('abbreviations', []),
+                   data.get('collocations', []), data.get('sentence_starters', []))
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def get_nltk_resources():
+    """Trả về tài nguyên NLTK dùng chung, đọc file đóng gói đúng một lần"""
+    global _resources
+    if _resources is None:
+        with _resources_lock:
+            if _resources is None:
+                try:
+                    _resources = NltkResources.from_file()
+                except Exception as e:
+                    print(f"[ERROR] Không thể tải tài nguyên NLTK {DEFAULT_RESOURCES_PATH}: {e}")
+                    _resources = NltkResources()
+    return _resources
+
+
+def reference_tokenizer_available():
+    """NLTK và dữ liệu punkt đã cài để chạy preprocess_text gốc (chỉ cần khi đối chiếu/huấn luyện)"""
+    try:
+        import nltk
+    except ImportError:
+        return False
+    for resource in ('tokenizers/punkt_tab/english/', 'tokenizers/punkt/english.pickle'):
+        try:
+            nltk.data.find(resource)
+            return True
+        except LookupError:
+            continue
+    return False
+
+
+def build_resources(output_path=DEFAULT_RESOURCES_PATH):
+    """Biên dịch stopwords và dữ liệu Punkt từ NLTK đã cài (có nltk_data) sang file JSON"""
+    from nltk.corpus import stopwords
+    from nltk.tokenize.punkt import _ORTHO_BEG_LC, _ORTHO_UC
+    try:
+        # NLTK >= 3.8.2 dùng punkt_tab
+        from nltk.tokenize.punkt import PunktTokenizer
+        params = PunktTokenizer('english')._params
+    except Exception:
+        import nltk
+        params = nltk.data.load('tokenizers/punkt/english.pickle')._params
+
+    data = {
+        "language": "english",
+        "stopwords": sorted(set(stopwords.words('english'))),
+        "abbreviations": sorted(params.abbrev_types),
+        # Cặp (từ trước dấu chấm, từ sau) không bao giờ ngắt câu; văn bản đã bỏ chữ số
+        # nên không cần các cặp bắt đầu bằng ##number##
+        "collocations": sorted([first, second] for first, second in params.collocations
+                               if first != '##number##'),
+        # Từ viết thường mà Punkt không loại trừ được khả năng mở đầu câu: từng xuất
+        # hiện viết thường ở đầu câu và chưa từng viết hoa (heuristic chính tả)
+        "sentence_starters": sorted(word for word, context in params.ortho_context.items()
+                                    if context & _ORTHO_BEG_LC and not context & _ORTHO_UC),
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+    print(f"[INFO] Đã ghi {len(data['stopwords'])} stopwords, {len(data['abbreviations'])} từ viết tắt và "
+          f"{len(data['collocations'])} collocation vào {output_path}")
+    return output_path
+
+
+def check_import(module='app.spam_detector'):
+    """Import ``module`` và trả về các file dữ liệu đã mở (ngoài thư viện đã cài) cùng các kết nối mạng.
+
+    Dùng audit hook của Python nên phải chạy trong tiến trình mới (module chưa được import).
+    """
+    import importlib
+
+    events = []
+    library_dirs = _library_dirs()
+
+    def hook(event, args):
+        if event == 'open':
+            path = args[0]
+            if isinstance(path, (str, bytes, os.PathLike)):
+                path = os.fsdecode(path)
+                if (not path.endswith(_CODE_SUFFIXES) and not path.startswith(_SYSTEM_DIRS)
+                        and not os.path.abspath(path).startswith(library_dirs) and not os.path.isdir(path)):
+                    events.append(('open', path))
+        elif event.startswith('socket.') or event in ('urllib.Request', 'sqlite3.connect'):
+            events.append((event, repr(args)[:200]))
+
+    sys.addaudithook(hook)
+    importlib.import_module(module)
+    allowed = os.path.abspath(DEFAULT_RESOURCES_PATH)
+    return [(event, detail) for event, detail in events
+            if not (event == 'open' and os.path.abspath(detail) == allowed)]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command == 'build':
+        build_resources(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_RESOURCES_PATH)
+    elif command == 'check':
+        violations = check_import(sys.argv[2] if len(sys.argv) > 2 else 'app.spam_detector')
+        for event, detail in violations:
+            print(f"[ERROR] {event}: {detail}")
+        print("[INFO] Import không làm I/O ngoài tài nguyên đóng gói" if not violations
+              else f"[ERROR] {len(violations)} thao tác I/O khi import")
+        sys.exit(1 if violations else 0)
+    else:
+        print("Cách dùng: python -m app.nltk_resources [build|check] [đường_dẫn|module]")
+        sys.exit(1)
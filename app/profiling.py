@@ -0,0 +1,177 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ============== ĐO THỜI GIAN TỪNG GIAI ĐOẠN CHẤM ĐIỂM ================
+# Các giai đoạn: preprocess, numericalize, forward, keyword_fallback, db_update
+# (và score: toàn bộ một lần chấm điểm trong analyze_email_for_spam).
+# Mỗi giai đoạn có một histogram độ trễ trong tiến trình; các bộ đếm ghi lại
+# đường đi (model/fallback), văn bản rỗng và lỗi. Có thể gắn hook start/stop
+# (ví dụ để đẩy sang hệ thống đo bên ngoài) và lấy báo cáo bất cứ lúc nào:
+#   from app.profiling import get_profiler; get_profiler().print_report()
+# Đặt PHISH_PROFILE_DUMP=<file.json> để ghi báo cáo khi thoát ứng dụng,
+# PHISH_PROFILE=0 để tắt hoàn toàn.
+
+PROFILING_ENABLED = os.environ.get('PHISH_PROFILE', '1') != '0'
+PROFILE_DUMP_PATH = os.environ.get('PHISH_PROFILE_DUMP')
+
+# Cận trên của các bucket histogram (ms), bucket cuối là vô cùng
+BUCKET_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """Histogram độ trễ với bucket cố định theo thang log"""
+
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms):
+        self.buckets[bisect.bisect_left(self.bounds, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def percentile(self, fraction):
+        """Ước lượng phân vị bằng cận trên của bucket chứa nó"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target:
+                return min(self.bounds[index], self.max_ms) if index < len(self.bounds) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+            "buckets": {
+                (f"<={bound}" if index < len(self.bounds) else f">{self.bounds[-1]}"): bucket
+                for index, (bound, bucket) in enumerate(zip(self.bounds + (None,), self.buckets)) if bucket
+            },
+        }
+
+
+class Profiler:
+    """Thu thập histogram theo giai đoạn, bộ đếm và gọi các hook start/stop"""
+
+    def __init__(self, enabled=PROFILING_ENABLED):
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, on_start=None, on_stop=None):
+        """Gắn hook: ``on_start(stage)`` và ``on_stop(stage, elapsed_ms, error)``; trả về hook để gỡ"""
+        hook = (on_start, on_stop)
+        with self._lock:
+            self._hooks = self._hooks + [hook]
+        return hook
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks = [h for h in self._hooks if h is not hook]
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record(self, stage, elapsed_ms):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(elapsed_ms)
+
+    @contextmanager
+    def stage(self, name):
+        """Đo thời gian khối lệnh như một giai đoạn; lỗi được đếm vào ``exceptions.<name>``"""
+        if not self.enabled:
+            yield
+            return
+        hooks = self._hooks
+        for on_start, _ in hooks:
+            if on_start:
+                on_start(name)
+        error = None
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.record(name, elapsed_ms)
+            if error is not None:
+                self.count(f"exceptions.{name}")
+            for _, on_stop in hooks:
+                if on_stop:
+                    on_stop(name, elapsed_ms, error)
+
+    def snapshot(self):
+        """Báo cáo hiện tại dạng dict (histogram theo giai đoạn và bộ đếm)"""
+        with self._lock:
+            return {
+                "stages": {name: histogram.snapshot() for name, histogram in self._histograms.items()},
+                "counters": dict(self._counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def dump(self, path):
+        """Ghi báo cáo ra file JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+        return path
+
+    def print_report(self):
+        report = self.snapshot()
+        print("[INFO] Thời gian theo giai đoạn chấm điểm:")
+        for name, stats in report["stages"].items():
+            print(f"  {name:<18} n={stats['count']:<7} mean={stats['mean_ms']:.2f}ms "
+                  f"p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms "
+                  f"max={stats['max_ms']:.2f}ms")
+        for name, value in sorted(report["counters"].items()):
+            print(f"  {name:<18} {value}")
+        return report
+
+
+_profiler = Profiler()
+
+
+def get_profiler():
+    return _profiler
+
+
+def _dump_at_exit():
+    try:
+        _profiler.dump(PROFILE_DUMP_PATH)
+    except Exception as e:
+        print(f"[WARNING] Không thể ghi báo cáo đo thời gian {PROFILE_DUMP_PATH}: {e}")
+
+
+if PROFILE_DUMP_PATH:
+    atexit.register(_dump_at_exit)
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+from app.database import (apply_rescored_batch, clear_rescore_checkpoint, count_stale_emails,
+                          get_rescore_checkpoint, get_spam_threshold, get_stale_emails_batch)
+from app.text_preprocessor import scoring_text
+
+# ============== CHẤM ĐIỂM LẠI HỘP THƯ KHI MODEL THAY ĐỔI ================
+# Mỗi email lưu phiên bản bộ chấm điểm đã tạo ra điểm của nó (spam_model_version).
+# Khi best_model.pth hoặc spam_keywords.json được thay, công việc nền này duyệt
+# các email có phiên bản cũ theo từng lô (keyset theo id), chấm điểm cả lô một
+# lần và ghi kết quả cùng checkpoint trong một transaction. Có thể dừng bất cứ
+# lúc nào và chạy tiếp từ checkpoint; ``cpu_budget`` giới hạn tỉ lệ thời gian
+# dành cho chấm điểm để không tranh CPU với giao diện.
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('PHISH_RESCORE_BATCH_SIZE', '64'))
+# Tỉ lệ thời gian tối đa dành cho chấm điểm (0 < budget <= 1)
+DEFAULT_CPU_BUDGET = float(os.environ.get('PHISH_RESCORE_CPU_BUDGET', '0.25'))
+
+
+class RescoringJob:
+    """Công việc nền chấm điểm lại các email có điểm do phiên bản model cũ tạo ra"""
+
+    def __init__(self, scorer=None, batch_size=DEFAULT_BATCH_SIZE, cpu_budget=DEFAULT_CPU_BUDGET,
+                 on_progress=None, on_finished=None, cascade=None):
+        self._scorer = scorer
+        self._cascade = cascade
+        self.batch_size = batch_size
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.on_progress = on_progress    # on_progress(đã chấm, tổng số)
+        self.on_finished = on_finished    # on_finished(số email đã chấm lại, bị hủy hay không)
+        self.rescored = 0
+        self.total = 0
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    @property
+    def scorer(self):
+        """Bộ chấm điểm theo lô (mặc định là dịch vụ suy luận dùng chung)"""
+        if self._scorer is None:
+            from app.inference_service import get_inference_service
+            self._scorer = get_inference_service()
+        return self._scorer
+
+    @property
+    def cascade(self):
+        """Các tầng chấm điểm giống lúc nhận email (allowlist, cache, từ khóa) trên bộ chấm điểm của job"""
+        if self._cascade is None:
+            from app.scoring_cascade import ScoringCascade
+            self._cascade = ScoringCascade(scorer=self.scorer)
+        return self._cascade
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._cancelled.clear()
+            self._thread = threading.Thread(target=self.run, name="RescoringJob", daemon=True)
+            self._thread.start()
+        return self
+
+    def cancel(self, wait=False):
+        """Yêu cầu dừng sau lô hiện tại (checkpoint đã ghi được giữ lại)"""
+        self._cancelled.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _score_rows(self, rows):
+        items = [(scoring_text(sender, subject, body), sender, bool(authenticated))
+                 for _, sender, subject, body, authenticated in rows]
+        return [score for score, _ in self.cascade.score_batch_with_version(items)]
+
+    def run(self):
+        """Chấm điểm lại đồng bộ; trả về số email đã chấm lại trong lần chạy này"""
+        model_version = self.scorer.model_version
+        last_id, self.rescored = get_rescore_checkpoint(model_version)
+        self.total = self.rescored + count_stale_emails(model_version)
+        rescored_now = 0
+        if self.total > self.rescored:
+            print(f"[INFO] Chấm điểm lại {self.total - self.rescored} email cho model {model_version}")
+
+        while not self._cancelled.is_set():
+            rows = get_stale_emails_batch(model_version, last_id, self.batch_size)
+            if not rows:
+                if last_id and count_stale_emails(model_version):
+                    # Còn email cũ có id nhỏ hơn checkpoint (ví dụ được thêm vào sau khi bắt đầu)
+                    last_id = ''
+                    continue
+                clear_rescore_checkpoint(model_version)
+                break
+
+            start = time.perf_counter()
+            try:
+                scores = self._score_rows(rows)
+            except Exception as e:
+                print(f"[ERROR] Lỗi khi chấm điểm lại lô sau id {last_id!r}: {e}")
+                break
+            threshold = get_spam_threshold()
+            updates = [(row[0], score, 1 if score > threshold else 0) for row, score in zip(rows, scores)]
+
+            last_id = rows[-1][0]
+            self.rescored += len(rows)
+            rescored_now += len(rows)
+            apply_rescored_batch(model_version, updates, last_id, self.rescored)
+            elapsed = time.perf_counter() - start
+
+            if self.on_progress:
+                self.on_progress(self.rescored, self.total)
+
+            # Nghỉ để thời gian chấm điểm chỉ chiếm ``cpu_budget`` tổng thời gian
+            if self.cpu_budget < 1.0:
+                self._cancelled.wait(elapsed * (1 - self.cpu_budget) / self.cpu_budget)
+
+        cancelled = self._cancelled.is_set()
+        if rescored_now:
+            print(f"[INFO] Đã chấm lại {rescored_now} email{' (tạm dừng)' if cancelled else ''}")
+        if self.on_finished:
+            self.on_finished(rescored_now, cancelled)
+        return rescored_now
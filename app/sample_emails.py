@@ -0,0 +1,89 @@
+# ============== EMAIL MẪU (spam-test-*) ================
+# Nội dung cứng của các email mẫu dùng để thử giao diện, bộ chấm điểm và benchmark.
+# Tách riêng khỏi app.fetch_emails để có thể dùng mà không cần Gmail API hay database.
+
+from app.text_preprocessor import scoring_text
+
+SAMPLE_EMAILS = {
+    "spam-test-1": {
+        "subject": "URGENT: $5,000,000 inheritance waiting for you",
+        "sender": "Nigerian Prince <prince@nigeria.com>",
+        "body": """Dear Sir/Madam,
+                
+I am Prince Alyusi Islassis, the only son of the late King of Nigeria. I am writing to you because I need your urgent assistance in transferring the sum of $5,000,000 USD from Nigeria to your country.
+
+Due to certain political circumstances and government restrictions on my family's assets, I cannot transfer these funds directly. I am seeking a foreign partner who can help me transfer this money out of Nigeria.
+
+For your assistance, I am prepared to offer you 30% of the total funds. To proceed, I will need:
+1. Your full name
+2. Your bank account details
+3. A small administrative fee of $1,000 to cover transfer costs
+
+Please reply urgently as this matter is very sensitive and confidential.
+
+Yours faithfully,
+Prince Alyusi Islassis
+"""
+    },
+    "spam-test-2": {
+        "subject": "Your account has been BLOCKED - Verify NOW",
+        "sender": "Bank Security <security@bank-verificati0n.com>",
+        "body": """URGENT SECURITY NOTICE
+                
+Your bank account has been temporarily BLOCKED due to suspicious activity.
+
+We have detected multiple unauthorized login attempts to your account from different locations. To protect your funds, we have temporarily restricted access to your account.
+
+To verify your identity and restore access immediately, please click on the link below:
+
+[SECURE VERIFICATION LINK]
+
+You must complete this verification within 24 hours, or your account will be permanently suspended and your funds may be seized.
+
+Bank Security Team
+"""
+    },
+    "spam-test-3": {
+        "subject": "CONGRATULATIONS! You've WON $10,000,000!",
+        "sender": "Lottery Winner <claim@megamillions-winner.org>",
+        "body": """CONGRATULATIONS!!!
+                
+Your email address has been randomly selected as the winner of our $10,000,000 USD International Lottery!
+
+Your email was chosen from over 250 million email addresses worldwide. This is not a joke or scam - you have actually won!
+
+To claim your prize, you need to:
+
+1. Send us your full name, address, and phone number
+2. Provide a copy of your ID/passport
+3. Pay a small processing fee of $500 USD to cover transfer taxes
+
+Please note that this offer is valid for 5 days only. Respond immediately to claim your millions!
+
+Best regards,
+International Lottery Commission
+"""
+    }
+}
+
+
+UNKNOWN_SAMPLE_EMAIL = {
+    "subject": "Unknown Sample Email",
+    "sender": "Unknown Sender",
+    "body": "This is a sample email content."
+}
+
+
+def is_sample_email(email_id):
+    return email_id.startswith("spam-test")
+
+
+def get_sample_email(email_id):
+    """Nội dung của email mẫu (bản sao), hoặc nội dung mặc định nếu không có id này"""
+    return dict(SAMPLE_EMAILS.get(email_id, UNKNOWN_SAMPLE_EMAIL))
+
+
+def sample_email_texts():
+    """Văn bản đầy đủ (From/Subject/nội dung) của các email mẫu, giống văn bản đưa vào bộ chấm điểm"""
+    return [scoring_text(content['sender'], content['subject'], content['body'])
+            for content in SAMPLE_EMAILS.values()]
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import threading
+import time
+
+from app.database import (get_cached_spam_score, purge_spam_score_cache, save_cached_spam_score,
+                          touch_cached_spam_scores)
+
+# ============== CACHE ĐIỂM SPAM THEO NỘI DUNG ================
+# Cùng một nội dung (newsletter, email tải lại, email mẫu, cửa sổ chi tiết spam
+# mở nhiều lần) chỉ được chấm điểm một lần cho mỗi phiên bản model.
+# Chỉ cache kết quả tốn kém (LSTM, occlusion); bộ chấm từ khóa rẻ hơn một lần
+# đọc/ghi SQLite nên luôn được chạy trực tiếp. Lần trúng cache chỉ đọc
+# database; thời điểm sử dụng (cho LRU) được gom trong bộ nhớ và ghi một lần
+# cùng lần lưu kế tiếp hoặc khi đủ TOUCH_FLUSH_SIZE mục.
+
+MAX_CACHE_ENTRIES = 5000
+# Số lần trúng cache gom lại tối đa trước khi ghi last_used
+TOUCH_FLUSH_SIZE = 256
+
+
+def normalize_text(text):
+    """Chuẩn hóa văn bản trước khi băm (bộ chấm điểm không phân biệt hoa/thường)"""
+    return text.lower() if isinstance(text, str) else ""
+
+
+def text_hash(text):
+    """Băm SHA-256 của văn bản đã chuẩn hóa"""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class SpamScoreCache:
+    """Cache điểm spam lưu trong bảng ``spam_score_cache`` của database ứng dụng"""
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._purged_versions = set()
+        self._touches = {}
+
+    def _ensure_current(self, model_version):
+        """Xóa các mục của checkpoint cũ khi lần đầu gặp một phiên bản model"""
+        if model_version in self._purged_versions:
+            return
+        with self._lock:
+            if model_version in self._purged_versions:
+                return
+            removed = purge_spam_score_cache(model_version)
+            if removed:
+                print(f"[INFO] Đã xóa {removed} điểm spam cache của model cũ")
+            self._purged_versions.add(model_version)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, text, kind, model_version):
+        """Trả về (score, keywords) đã cache hoặc None"""
+        self._ensure_current(model_version)
+        cached = get_cached_spam_score(text_hash(text), kind, model_version)
+        self._count(cached is not None)
+        if cached is None:
+            return None
+        self._touch((text_hash(text), kind, model_version))
+        score, keywords = cached
+        return score, json.loads(keywords) if keywords else []
+
+    def put(self, text, kind, model_version, score, keywords=None):
+        keywords_json = json.dumps(keywords, ensure_ascii=False) if keywords else None
+        save_cached_spam_score(text_hash(text), kind, model_version, score,
+                               keywords_json, self.max_entries, touches=self._take_touches())
+
+    def _touch(self, key):
+        """Ghi nhận một lần trúng cache; chỉ ghi xuống database khi đã gom đủ"""
+        with self._lock:
+            self._touches[key] = time.time()
+            full = len(self._touches) >= TOUCH_FLUSH_SIZE
+        if full:
+            self.flush()
+
+    def _take_touches(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        return [(last_used,) + key for key, last_used in touches.items()]
+
+    def flush(self):
+        """Ghi các thời điểm sử dụng đang chờ xuống database"""
+        touch_cached_spam_scores(self._take_touches())
+
+    def stats(self):
+        """Số lần trúng/trượt cache và tỉ lệ trúng"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+_score_cache = SpamScoreCache()
+
+
+def get_score_cache():
+    return _score_cache
+
+
+def get_cache_stats():
+    return _score_cache.stats()
+
+
+def cached_predict(detector, text):
+    """Giống ``detector.predict`` nhưng kiểm tra cache trước; luôn trả về float"""
+    model_version = detector.model_version
+    cached = _score_cache.get(text, 'predict', model_version)
+    if cached is not None:
+        return cached[0]
+
+    result = detector.predict(text)
+    score = result[0] if isinstance(result, tuple) else result
+    _score_cache.put(text, 'predict', model_version, score)
+    return score
@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import sys
+import threading
+from email.utils import parseaddr
+
+from app.keyword_engine import KeywordScorer, keyword_score
+from app.model_warmup import MODEL_WAIT_SECONDS, get_model_warmup
+from app.score_cache import get_score_cache
+
+if getattr(sys, 'frozen', False):
+    CONFIG_DIR = os.path.join(sys._MEIPASS, 'app')
+else:
+    CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_ALLOWLIST_PATH = os.path.join(CONFIG_DIR, 'sender_allowlist.json')
+
+# ============== CHẤM ĐIỂM THEO TẦNG (RẺ TRƯỚC, LSTM SAU) ================
+# 1. allowlist : người gửi/tên miền tin cậy VÀ đã xác thực (SPF/DKIM/DMARC, xem
+#                app/sender_auth.py) -> không phải spam; From chưa xác thực có
+#                thể bị giả mạo nên đi tiếp các tầng sau
+#    (fallback : model AI còn đang nạp nền quá thời gian chờ -> chỉ dùng điểm từ khóa)
+# 2. cache     : nội dung đã được chấm điểm với model hiện tại
+# 3. keywords  : điểm từ khóa rất cao (spam) hoặc rất thấp và không có URL (bình thường),
+#                chỉ quét phần đầu và cuối của email rất dài
+# 4. model     : chỉ chạy LSTM khi các tầng trên chưa kết luận được
+
+CASCADE_ENABLED = os.environ.get('PHISH_SCORING_CASCADE', '1') != '0'
+ALLOWLIST_SCORE = 0.0
+STRONG_SPAM_THRESHOLD = 0.9
+STRONG_HAM_THRESHOLD = 0.05
+# Số ký tự tối đa tầng từ khóa quét (nửa đầu, nửa cuối email)
+KEYWORD_VERDICT_CHARS = 20000
+STAGES = ('allowlist', 'fallback', 'cache', 'keywords', 'model')
+
+_URL_RE = re.compile(r'https?://|www\.', re.IGNORECASE)
+
+
+def load_allowlist(path=DEFAULT_ALLOWLIST_PATH):
+    """Đọc danh sách người gửi và tên miền tin cậy ({"senders": [...], "domains": [...]})"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return frozenset(), frozenset()
+    except Exception as e:
+        print(f"[WARNING] Không thể đọc danh sách người gửi tin cậy {path}: {e}")
+        return frozenset(), frozenset()
+    senders = frozenset(s.strip().lower() for s in data.get('senders', []))
+    domains = frozenset(d.strip().lower().lstrip('@') for d in data.get('domains', []))
+    return senders, domains
+
+
+class ScoringCascade:
+    """Chấm điểm spam theo tầng, đếm số email được kết luận ở mỗi tầng"""
+
+    def __init__(self, scorer=None, allowlist_path=DEFAULT_ALLOWLIST_PATH, enabled=CASCADE_ENABLED,
+                 strong_spam_threshold=STRONG_SPAM_THRESHOLD, strong_ham_threshold=STRONG_HAM_THRESHOLD,
+                 model_wait=MODEL_WAIT_SECONDS):
+        self._scorer = scorer
+        self._shared_scorer = scorer is None
+        self.model_wait = model_wait
+        self.enabled = enabled
+        self.allowed_senders, self.allowed_domains = load_allowlist(allowlist_path)
+        self.strong_spam_threshold = strong_spam_threshold
+        self.strong_ham_threshold = strong_ham_threshold
+        self.counters = dict.fromkeys(STAGES, 0)
+        self._lock = threading.Lock()
+
+    @property
+    def scorer(self):
+        """Bộ chấm điểm LSTM (mặc định là dịch vụ suy luận dùng chung)"""
+        if self._scorer is None:
+            from app.inference_service import get_inference_service
+            self._scorer = get_inference_service()
+        return self._scorer
+
+    def _resolved(self, stage, score):
+        with self._lock:
+            self.counters[stage] += 1
+        return score
+
+    def is_allowlisted(self, sender, authenticated=False):
+        """Người gửi nằm trong danh sách tin cậy; chỉ tính khi From đã được xác thực"""
+        if not authenticated:
+            return False
+        address = parseaddr(sender or '')[1].lower()
+        if not address:
+            return False
+        return address in self.allowed_senders or address.rpartition('@')[2] in self.allowed_domains
+
+    def model_available(self, wait=None):
+        """False khi model dùng chung vẫn đang được nạp nền sau ``wait`` giây (mặc định ``model_wait``)"""
+        if not self._shared_scorer:
+            return True
+        warmup = get_model_warmup()
+        return not warmup.started or warmup.wait(self.model_wait if wait is None else wait)
+
+    def keyword_verdict(self, text):
+        """Điểm từ khóa nếu đủ chắc chắn, ngược lại None.
+
+        Email dài hơn ``KEYWORD_VERDICT_CHARS`` chỉ được quét phần đầu và cuối;
+        khi đó chỉ kết luận spam, vì phần giữa chưa quét có thể chứa URL hay từ khóa.
+        """
+        excerpt = text
+        if len(text) > KEYWORD_VERDICT_CHARS:
+            half = KEYWORD_VERDICT_CHARS // 2
+            excerpt = text[:half] + "\n" + text[-half:]
+        score, _ = keyword_score(excerpt)
+        if score >= self.strong_spam_threshold:
+            return score
+        if excerpt is text and score <= self.strong_ham_threshold and not _URL_RE.search(text):
+            return score
+        return None
+
+    def score(self, text, sender=None, authenticated=False):
+        """Trả về xác suất spam (float) của văn bản"""
+        return self.score_with_version(text, sender, authenticated)[0]
+
+    def score_with_version(self, text, sender=None, authenticated=False):
+        """Trả về (xác suất spam, phiên bản bộ chấm điểm đã kết luận).
+
+        Là phiên bản chỉ-từ-khóa khi model chưa sẵn sàng, để công việc chấm
+        điểm lại (app/rescoring.py) xử lý sau.
+        """
+        return self.score_batch_with_version([(text, sender, authenticated)])[0]
+
+    def score_batch_with_version(self, items):
+        """Chấm điểm theo tầng cho cả lô ``[(văn bản, người gửi, đã xác thực), ...]``.
+
+        Trả về danh sách (xác suất spam, phiên bản) theo thứ tự đầu vào; các
+        văn bản phải chạy LSTM được gửi cho ``scorer.predict_batch`` một lần.
+        Người gửi tin cậy được gắn phiên bản hiện tại để không bị coi là cần
+        chấm lại.
+        """
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+
+        if self.enabled:
+            allowlisted = [i for i in pending if self.is_allowlisted(items[i][1], items[i][2])]
+            if allowlisted:
+                version = self._allowlist_version()
+                for i in allowlisted:
+                    results[i] = (self._resolved('allowlist', ALLOWLIST_SCORE), version)
+                pending = [i for i in pending if results[i] is None]
+        if not pending:
+            return results
+
+        if not self.model_available():
+            version = KeywordScorer().model_version
+            for i in pending:
+                results[i] = (self._resolved('fallback', keyword_score(items[i][0])[0]), version)
+            return results
+
+        cache = get_score_cache()
+        model_version = self.scorer.model_version
+        to_model = []
+        for i in pending:
+            text = items[i][0]
+            cached = cache.get(text, 'predict', model_version)
+            if cached is not None:
+                results[i] = (self._resolved('cache', cached[0]), model_version)
+                continue
+            if self.enabled:
+                verdict = self.keyword_verdict(text)
+                if verdict is not None:
+                    results[i] = (self._resolved('keywords', verdict), model_version)
+                    continue
+            to_model.append(i)
+
+        if to_model:
+            texts = [items[i][0] for i in to_model]
+            for i, text, result in zip(to_model, texts, self.scorer.predict_batch(texts)):
+                score = result[0] if isinstance(result, tuple) else result
+                cache.put(text, 'predict', model_version, score)
+                results[i] = (self._resolved('model', score), model_version)
+        return results
+
+    def _allowlist_version(self):
+        """Phiên bản gắn cho email của người gửi tin cậy: của model nếu đã sẵn sàng (không chờ)"""
+        if self.model_available(wait=0):
+            return self.scorer.model_version
+        return KeywordScorer().model_version
+
+    def stats(self):
+        """Số email được kết luận ở từng tầng"""
+        with self._lock:
+            return dict(self.counters)
+
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def get_scoring_cascade():
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                _cascade = ScoringCascade()
+    return _cascade
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# ============== CHẤM ĐIỂM SPAM BẰNG NHIỀU TIẾN TRÌNH ================
+# Dùng khi cần chấm điểm hàng nghìn email (ví dụ backfill hộp thư). Mỗi tiến
+# trình con giữ một SpamDetector riêng. Các worker luôn được tạo bằng ``spawn``:
+# fork sau khi torch đã nạp (luồng OpenMP, khóa nội bộ) có thể làm worker treo.
+# Trọng số vẫn được chia sẻ chỉ-đọc vì mọi worker memory-map cùng một artifact
+# (app/model_artifact.py), nên trang nhớ nằm chung trong page cache.
+
+DEFAULT_CHUNK_SIZE = 32
+
+_worker_detector = None
+
+
+def _worker_init(model_path, precision, num_threads):
+    """Khởi tạo detector một lần trong mỗi tiến trình con"""
+    global _worker_detector
+    import torch
+    from app.spam_detector import SpamDetector
+
+    # Mỗi worker chỉ dùng ít luồng để các tiến trình không tranh CPU với nhau
+    torch.set_num_threads(num_threads)
+    _worker_detector = SpamDetector.get_instance(model_path, precision=precision)
+
+
+def _worker_predict_batch(texts):
+    return _worker_detector.predict_batch(texts)
+
+
+def ensure_artifact(model_path):
+    """Tạo (hoặc tạo lại khi .pth đã bị thay) artifact memory-map từ checkpoint .pth.
+
+    Các worker nạp artifact nhanh và dùng chung trang nhớ; artifact cũ hơn
+    .pth hiện tại được ghi đè để worker không chấm điểm bằng trọng số cũ.
+    """
+    from app.model_artifact import HEADER_FILE, artifact_dir_for, artifact_is_current, convert_checkpoint
+
+    if os.path.isdir(model_path) or not os.path.exists(model_path):
+        return
+    artifact_dir = artifact_dir_for(model_path)
+    try:
+        if os.path.exists(os.path.join(artifact_dir, HEADER_FILE)) and artifact_is_current(artifact_dir):
+            return
+    except ValueError as e:
+        print(f"[WARNING] Artifact {artifact_dir} không đọc được, tạo lại: {e}")
+    try:
+        convert_checkpoint(model_path)
+    except Exception as e:
+        print(f"[WARNING] Không thể tạo artifact cho {model_path}, worker sẽ nạp checkpoint .pth: {e}")
+
+
+class ProcessPoolScorer:
+    """Backend chấm điểm đa tiến trình với cùng giao diện ``predict``/``predict_batch``"""
+
+    def __init__(self, num_workers=None, model_path='models/best_model.pth', precision=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, threads_per_worker=1):
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.chunk_size = chunk_size
+
+        ensure_artifact(model_path)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_worker_init,
+            initargs=(model_path, precision, threads_per_worker),
+        )
+
+    def predict(self, text):
+        """Chấm điểm một email, trả về xác suất spam (float)"""
+        return self._executor.submit(_worker_predict_batch, [text]).result()[0]
+
+    def predict_batch(self, texts):
+        """Chia danh sách email thành các phần và chấm điểm song song, giữ thứ tự đầu vào"""
+        texts = list(texts)
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        scores = []
+        for chunk_scores in self._executor.map(_worker_predict_batch, chunks):
+            scores.extend(chunk_scores)
+        return scores
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @classmethod
+    def autotuned(cls, sample_texts, max_workers=None, **kwargs):
+        """Tạo backend với số worker được chọn tự động bằng ``autotune_workers``"""
+        num_workers = autotune_workers(sample_texts, max_workers=max_workers, **kwargs)
+        return cls(num_workers=num_workers, **kwargs)
+
+
+def autotune_workers(sample_texts, max_workers=None, min_gain=1.1, **kwargs):
+    """Chọn số worker cho thông lượng (email/giây) cao nhất trên tập mẫu.
+
+    Thử lần lượt 1, 2, 4, ... worker và dừng khi tăng gấp đôi không còn cải
+    thiện ít nhất ``min_gain`` lần.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    sample_texts = list(sample_texts)
+    best_workers, best_throughput = 1, 0.0
+
+    num_workers = 1
+    while num_workers <= max_workers:
+        with ProcessPoolScorer(num_workers=num_workers, **kwargs) as scorer:
+            scorer.predict_batch(sample_texts[:scorer.chunk_size * num_workers])  # khởi động worker
+            start = time.perf_counter()
+            scorer.predict_batch(sample_texts)
+            elapsed = time.perf_counter() - start
+        throughput = len(sample_texts) / elapsed if elapsed > 0 else float('inf')
+        print(f"[INFO] {num_workers} worker: {throughput:.1f} email/giây")
+
+        if throughput < best_throughput * min_gain:
+            break
+        best_workers, best_throughput = num_workers, throughput
+        num_workers *= 2
+
+    print(f"[INFO] Chọn {best_workers} worker cho chấm điểm đa tiến trình")
+    return best_workers
@@ -0,0 +1,75 @@
+import os
+import re
+from email.utils import parseaddr
+
+# ============== XÁC THỰC NGƯỜI GỬI (SPF / DKIM / DMARC) ================
+# Header From do người gửi tự ghi nên không đủ để tin một email. Máy chủ nhận
+# (Gmail: authserv-id "mx.google.com") ghi kết quả kiểm tra vào header
+# Authentication-Results trên cùng của email. Người gửi chỉ được coi là đã xác
+# thực khi header trên cùng đó do máy chủ tin cậy ghi và có ít nhất một kết quả
+# pass khớp (alignment) với tên miền trong From:
+#   dmarc=pass header.from=<tên miền From>
+#   dkim=pass  header.d / header.i thuộc tên miền From
+#   spf=pass   smtp.mailfrom thuộc tên miền From
+# Các header Authentication-Results bên dưới có thể do chính người gửi chèn vào
+# nên bị bỏ qua.
+
+TRUSTED_AUTHSERV_IDS = frozenset(
+    value.strip().lower()
+    for value in os.environ.get('PHISH_TRUSTED_AUTHSERV_IDS', 'mx.google.com').split(',')
+    if value.strip()
+)
+
+_COMMENT_RE = re.compile(r'\([^()]*\)')
+_RESULT_RE = re.compile(r'^\s*(spf|dkim|dmarc)\s*=\s*([a-z]+)', re.IGNORECASE)
+_PROPERTY_RE = re.compile(r'\b((?:header|smtp)\.[a-z]+)\s*=\s*"?([^\s;"]+)', re.IGNORECASE)
+
+
+def _domain(value):
+    """Tên miền của một địa chỉ email hoặc tên miền (chữ thường, bỏ dấu @ và dấu chấm cuối)"""
+    return value.rpartition('@')[2].strip().strip('.').lower()
+
+
+def _aligned(domain, from_domain):
+    """Khớp kiểu relaxed: trùng nhau hoặc một bên là tên miền con của bên kia"""
+    return bool(domain) and (domain == from_domain or from_domain.endswith('.' + domain)
+                             or domain.endswith('.' + from_domain))
+
+
+def parse_authentication_results(value):
+    """Tách header Authentication-Results thành (authserv-id, [(phương thức, kết quả, {thuộc tính: giá trị})])"""
+    parts = _COMMENT_RE.sub(' ', value or '').split(';')
+    authserv_id = parts[0].split()[0].lower() if parts[0].split() else ''
+    results = []
+    for part in parts[1:]:
+        match = _RESULT_RE.match(part)
+        if match:
+            properties = {name.lower(): prop for name, prop in _PROPERTY_RE.findall(part)}
+            results.append((match.group(1).lower(), match.group(2).lower(), properties))
+    return authserv_id, results
+
+
+def sender_authenticated(sender, authentication_results):
+    """True nếu tên miền trong From được xác thực theo header Authentication-Results trên cùng.
+
+    ``authentication_results`` là danh sách giá trị các header theo thứ tự
+    trong email (trên cùng trước).
+    """
+    from_domain = _domain(parseaddr(sender or '')[1])
+    if not from_domain or not authentication_results:
+        return False
+    authserv_id, results = parse_authentication_results(authentication_results[0])
+    if authserv_id not in TRUSTED_AUTHSERV_IDS:
+        return False
+    for method, result, properties in results:
+        if result != 'pass':
+            continue
+        if method == 'dmarc':
+            domain = properties.get('header.from', '')
+        elif method == 'dkim':
+            domain = properties.get('header.d') or properties.get('header.i', '')
+        else:
+            domain = properties.get('smtp.mailfrom', '')
+        if _aligned(_domain(domain), from_domain):
+            return True
+    return False
@@ -1,8 +1,10 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTextEdit
 from PyQt6.QtCore import Qt
 from app.fetch_emails import get_email_content
-from app.spam_detector import SpamDetector
-import re
+from app.model_warmup import get_detector
+from app.explanations import explain_text, highlight_html, spans_in
+from app.text_preprocessor import scoring_text
+import html
 
 class SpamDetailsWindow(QWidget):
     def __init__(self, email_id):
@@ -12,32 +14,43 @@ class SpamDetailsWindow(QWidget):
 
         layout = QVBoxLayout()
         email_data = get_email_content(email_id)
-        raw_body = email_data.get("body", "")
-
-        # Dùng SpamDetector để lấy từ nghi ngờ
-        detector = SpamDetector.get_instance()
-        _, matched_keywords = detector.keyword_based_prediction(raw_body)
-
-        # Tô đỏ các từ được đánh giá nghi ngờ
-        for keyword in matched_keywords:
-            raw_body = re.sub(f"(?i)\\b{re.escape(keyword)}\\b",
-                f"<span style='color:red;font-weight:bold'>{keyword}</span>", raw_body)
+        sender = email_data.get("sender", "") or ""
+        subject = email_data.get("subject", "") or ""
+        raw_body = email_data.get("body", "") or ""
+
+        # Giải thích điểm spam trên đúng văn bản bộ chấm điểm nhận (From, Subject, nội dung):
+        # occlusion trên model AI, hoặc từ khóa nếu model chưa nạp xong (có cache)
+        detector = get_detector()
+        text = scoring_text(sender, subject, raw_body)
+        kind, explanation, spans = explain_text(detector, text)
+        subject_start = len(f"From: {sender}\nSubject: ")
+        body_start = len(text) - len(raw_body)
 
         # Tạo label hiển thị các từ nghi ngờ
-        if matched_keywords:
-            matched_text = "<br>".join(f"🔴 {kw}" for kw in sorted(set(matched_keywords)))
-            match_label = QLabel(f"<b>🛑 Những từ nghi ngờ trong nội dung:</b><br>{matched_text}")
+        if explanation:
+            if kind == 'occlusion':
+                title = "🛑 Những từ làm tăng điểm lừa đảo (theo model AI):"
+                matched_text = "<br>".join(f"🔴 {html.escape(term)} (+{weight * 100:.1f}%)"
+                                           for term, weight in explanation)
+            else:
+                title = "🛑 Những từ nghi ngờ trong nội dung:"
+                matched_text = "<br>".join(f"🔴 {html.escape(term)}" for term, _ in sorted(explanation))
+            match_label = QLabel(f"<b>{title}</b><br>{matched_text}")
             match_label.setWordWrap(True)
             layout.addWidget(match_label)
 
 
-        label = QLabel(f"<b>Tiêu đề:</b> {email_data.get('subject', '')}<br><b>Người gửi:</b> {email_data.get('sender', '')}")
+        subject_html = highlight_html(subject, spans_in(spans, subject_start, subject_start + len(subject)))
+        label = QLabel(f"<b>Tiêu đề:</b> {subject_html}<br>"
+                       f"<b>Người gửi:</b> {html.escape(sender)}")
         label.setWordWrap(True)
         layout.addWidget(label)
 
+        # Tô đỏ đúng những vị trí được giải thích (một lần duyệt, nội dung đã escape HTML)
         content = QTextEdit()
         content.setReadOnly(True)
-        content.setHtml(f"<div style='text-align: justify;'>{raw_body}</div>")
+        body_html = highlight_html(raw_body, spans_in(spans, body_start, len(text)))
+        content.setHtml(f"<div style='text-align: justify; white-space: pre-wrap;'>{body_html}</div>")
         layout.addWidget(content)
 
         self.setLayout(layout)
@@ -1,29 +1,23 @@
+import numpy as np
 import torch
 import torch.nn as nn
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import nltk
 import os
 import pickle
 import io
+import copy
 import re
 import sys
+import threading
+from itertools import islice
 
 if getattr(sys, 'frozen', False):
     BASE_DIR = sys._MEIPASS
 else:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Đảm bảo dữ liệu NLTK được cài đặt
-if not os.path.exists("nltk_data"):
-    print("[INFO] Tạo thư mục nltk_data và tải dữ liệu NLTK...")
-    os.makedirs("nltk_data")
-    nltk.download('punkt', download_dir="nltk_data")
-    nltk.download('stopwords', download_dir="nltk_data")
-try:
-    nltk.data.path.append("nltk_data")
-except:
-    print("[WARNING] Không thể thêm nltk_data vào đường dẫn")
+from app.text_preprocessor import get_text_preprocessor
+from app.keyword_engine import file_fingerprint, get_keyword_engine, keyword_score
+from app.profiling import get_profiler
 
 # ============== ĐỊNH NGHĨA LỚP VOCABULARY DÙNG TRONG HUẤN LUYỆN ================
 # Định nghĩa lớp Vocabulary ở cấp độ module chính để PyTorch có thể tìm thấy
@@ -66,48 +60,65 @@ class Vocabulary:
 
 # Adapter cho Vocabulary để xử lý nhiều cấu trúc khác nhau
 class VocabularyAdapter:
+    """Chuẩn hóa mọi dạng vocabulary về một dict token->index duy nhất.
+
+    Vocabulary của checkpoint giữ cả token2idx lẫn idx2token (~50k mục mỗi
+    chiều); adapter chỉ giữ lại token2idx.
+    """
     def __init__(self, vocab_object):
-        self.vocab_object = vocab_object
         # Xác định loại của vocab object
         if hasattr(vocab_object, 'token2idx'):
             # Đây là Vocabulary class
             self.vocab_type = 'vocab_class'
+            self.token2idx = dict(vocab_object.token2idx)
+            self.unk_index = 1
+            self._size = len(self.token2idx)
         elif isinstance(vocab_object, dict) and '<pad>' in vocab_object:
             # Đây là dictionary đơn giản token->idx
             self.vocab_type = 'dict'
+            self.token2idx = vocab_object
+            self.unk_index = vocab_object.get('<unk>', 1)
+            self._size = len(self.token2idx)
         else:
             # Loại không xác định
             print(f"[WARNING] Không thể xác định loại vocabulary: {type(vocab_object)}")
             self.vocab_type = 'unknown'
+            self.token2idx = {}
+            self.unk_index = 1
+            self._size = 50000  # Giá trị mặc định
             
     def __getitem__(self, token):
-        if self.vocab_type == 'vocab_class':
-            return self.vocab_object[token]
-        elif self.vocab_type == 'dict':
-            return self.vocab_object.get(token, self.vocab_object.get('<unk>', 1))
-        else:
-            return 1  # Trả về <unk> cho trường hợp không xác định
+        return self.token2idx.get(token, self.unk_index)
             
     def __len__(self):
-        if self.vocab_type == 'vocab_class':
-            return len(self.vocab_object)
-        elif self.vocab_type == 'dict':
-            return len(self.vocab_object)
-        else:
-            return 50000  # Giá trị mặc định
+        return self._size
+
+    def token_index(self):
+        """Trả về (dict token->index, index của <unk>) để tra cứu nhanh"""
+        return self.token2idx, self.unk_index
 
 # ============== ĐỊNH NGHĨA LỚP MODEL DÙNG TRONG HUẤN LUYỆN ================
 class LSTMModel(nn.Module):
-    def __init__(self, vocab_size, embedding_dim, hidden_dim, num_layers, output_dim, dropout, bidirectional=True):
+    def __init__(self, vocab_size, embedding_dim, hidden_dim, num_layers, output_dim, dropout, bidirectional=True,
+                 embedding_rank=None):
         super().__init__()
-        self.embedding = nn.Embedding(vocab_size, embedding_dim)
+        if embedding_rank:
+            # Bảng embedding hạng thấp (V x r) + phép chiếu r -> embedding_dim (xem app/compact_model.py)
+            self.embedding = nn.Embedding(vocab_size, embedding_rank)
+            self.embedding_projection = nn.Linear(embedding_rank, embedding_dim, bias=False)
+        else:
+            self.embedding = nn.Embedding(vocab_size, embedding_dim)
+            self.embedding_projection = None
         self.lstm = nn.LSTM(embedding_dim, hidden_dim, num_layers, batch_first=True, 
                           dropout=dropout if num_layers > 1 else 0, bidirectional=bidirectional)
         self.fc = nn.Linear(hidden_dim * 2 if bidirectional else hidden_dim, output_dim)
         self.dropout = nn.Dropout(dropout)
         
     def forward(self, text, text_lengths=None):
-        embedded = self.dropout(self.embedding(text))
+        embedded = self.embedding(text)
+        if self.embedding_projection is not None:
+            embedded = self.embedding_projection(embedded)
+        embedded = self.dropout(embedded)
         
         if text_lengths is not None:
             # Nếu có text_lengths, sử dụng pack_padded_sequence
@@ -130,7 +141,14 @@ class LSTMModel(nn.Module):
 
 # Hàm tiền xử lý văn bản - cải tiến phù hợp với hàm dùng để train
 def preprocess_text(text):
-    """Hàm tiền xử lý văn bản: loại bỏ stopwords, biến đổi về chữ thường..."""
+    """Hàm tiền xử lý văn bản: loại bỏ stopwords, biến đổi về chữ thường...
+
+    Bản gốc dùng NLTK word_tokenize (cần punkt), chỉ giữ lại để huấn luyện và
+    đối chiếu; khi suy luận dùng app.text_preprocessor.
+    """
+    from nltk.tokenize import word_tokenize
+    from app.nltk_resources import get_nltk_resources
+
     if not isinstance(text, str):
         return []
     
@@ -146,7 +164,7 @@ def preprocess_text(text):
     tokens = word_tokenize(text)
     
     # Loại bỏ stopwords
-    stop_words = set(stopwords.words('english'))
+    stop_words = get_nltk_resources().stopwords
     tokens = [token for token in tokens if token not in stop_words]
     
     return tokens
@@ -178,30 +196,126 @@ def create_vocab_from_scratch():
     
     return vocab
 
+# ============== CHẾ ĐỘ ĐỘ CHÍNH XÁC KHI SUY LUẬN ================
+# fp32 (mặc định), int8 (dynamic quantization cho LSTM và Linear) hoặc bf16.
+# Có thể chọn bằng biến môi trường PHISH_MODEL_PRECISION.
+SUPPORTED_PRECISIONS = ('fp32', 'int8', 'bf16')
+DEFAULT_PRECISION = os.environ.get('PHISH_MODEL_PRECISION', 'fp32')
+# Sai lệch điểm tối đa cho phép so với fp32 trên tập hiệu chuẩn
+PRECISION_TOLERANCE = float(os.environ.get('PHISH_MODEL_PRECISION_TOLERANCE', '0.02'))
+
+# Tập hiệu chuẩn nhỏ (cả email lừa đảo lẫn email bình thường) để kiểm tra sai lệch
+CALIBRATION_TEXTS = [
+    "URGENT: $5,000,000 inheritance waiting for you. I need your bank account details "
+    "and a small administrative fee to transfer the funds.",
+    "Your bank account has been temporarily BLOCKED due to suspicious activity. "
+    "Verify your identity within 24 hours or your account will be suspended.",
+    "CONGRATULATIONS! Your email address won our International Lottery. Send your "
+    "full name and pay a processing fee to claim your prize.",
+    "Hi team, the quarterly planning meeting is moved to Thursday at 10am in room B. "
+    "Please bring the updated roadmap slides.",
+    "Thanks for your order. Your package has shipped and should arrive on Monday. "
+    "You can track the delivery from your account page.",
+    "Reminder: the library will be closed on Friday for maintenance. Books can be "
+    "returned using the drop box near the entrance.",
+    "Can you review the attached pull request before lunch? I left a few comments "
+    "about the database migration.",
+    "Limited time offer! Click here to get a free gift card, no risk, guaranteed "
+    "winner, act now before the deadline expires!!!",
+]
+
+
+# ============== CHẾ ĐỘ EMAIL DÀI ================
+# Email dài hơn max_len token được chấm trên nhiều cửa sổ (đầu, cuối và cửa sổ
+# có mật độ từ khóa cao nhất) trong một lần forward, rồi gộp điểm bằng max/mean.
+# Tắt mặc định (model được huấn luyện trên cửa sổ đầu và ngưỡng được chỉnh theo
+# đó); bật bằng PHISH_LONG_DOCUMENT=1. Phiên bản model khác nhau giữa hai chế độ
+# nên điểm đã lưu được chấm lại khi đổi chế độ.
+LONG_DOCUMENT_MODE = os.environ.get('PHISH_LONG_DOCUMENT', '0') != '0'
+LONG_DOCUMENT_AGGREGATE = os.environ.get('PHISH_LONG_DOCUMENT_AGGREGATE', 'max')
+# Số token tối đa được xử lý cho mỗi email (giới hạn chi phí với email 1 MB)
+LONG_DOCUMENT_MAX_TOKENS = int(os.environ.get('PHISH_LONG_DOCUMENT_MAX_TOKENS', '2000'))
+# Số ký tự cuối email được đọc riêng để lấy cửa sổ cuối khi vượt giới hạn token
+LONG_DOCUMENT_TAIL_CHARS = 20000
+# Số ký tự tối đa (đầu + cuối) đưa vào bộ chấm từ khóa khi kết hợp điểm
+LONG_DOCUMENT_KEYWORD_CHARS = 200000
+
+
+def cpu_supports_bf16():
+    """Kiểm tra CPU có hỗ trợ bf16 (AVX512-BF16/AMX) hay không"""
+    checker = getattr(torch.cpu, '_is_avx512_bf16_supported', None)
+    try:
+        return bool(checker()) if checker else False
+    except Exception:
+        return False
+
+# Tham số mặc định của LSTMModel khi checkpoint không ghi lại
+DEFAULT_HYPERPARAMETERS = {
+    'embedding_dim': 300,
+    'hidden_dim': 256,
+    'num_layers': 2,
+    'output_dim': 1,
+    'dropout': 0.5,
+    'bidirectional': True,
+    'embedding_rank': None,
+}
+
+
+def checkpoint_hyperparameters(checkpoint):
+    """Lấy tham số khởi tạo LSTMModel từ checkpoint (dùng giá trị mặc định nếu thiếu)"""
+    if not isinstance(checkpoint, dict):
+        return dict(DEFAULT_HYPERPARAMETERS)
+    return {name: checkpoint.get(name, default) for name, default in DEFAULT_HYPERPARAMETERS.items()}
+
 # ============== LỚP SPAM DETECTOR ================
 class SpamDetector:
-    _instance = None  # Biến tĩnh để lưu trữ instance duy nhất
+    _instances = {}  # Registry: mỗi đường dẫn model chỉ được tải một lần cho toàn tiến trình
+    _registry_lock = threading.Lock()
     
     @classmethod
-    def get_instance(cls, model_path='models/best_model.pth'):
-        """Triển khai Singleton pattern để tránh tải model nhiều lần"""
-        if cls._instance is None:
-            cls._instance = cls(model_path)
-        return cls._instance
+    def get_instance(cls, model_path='models/best_model.pth', precision=None):
+        """Trả về detector dùng chung cho ``model_path`` (tải checkpoint đúng một lần).
+
+        An toàn khi nhiều luồng gọi cùng lúc: chỉ một luồng tải model, các
+        luồng còn lại chờ và nhận cùng instance.
+        """
+        precision = precision or DEFAULT_PRECISION
+        key = (os.path.abspath(model_path), precision)
+        instance = cls._instances.get(key)
+        if instance is None:
+            with cls._registry_lock:
+                instance = cls._instances.get(key)
+                if instance is None:
+                    instance = cls(model_path, precision=precision)
+                    cls._instances[key] = instance
+        return instance
+
+    @classmethod
+    def clear_instances(cls):
+        """Xóa các detector đã tải (ví dụ khi thay model mới)"""
+        with cls._registry_lock:
+            cls._instances.clear()
     
-    def __init__(self, model_path='models/best_model.pth', max_len=200):
+    def __init__(self, model_path='models/best_model.pth', max_len=200,
+                 precision=None, precision_tolerance=PRECISION_TOLERANCE,
+                 long_document=LONG_DOCUMENT_MODE, aggregate=LONG_DOCUMENT_AGGREGATE,
+                 max_tokens=LONG_DOCUMENT_MAX_TOKENS):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.precision = 'fp32'
         self.max_len = max_len
+        self.long_document = long_document
+        self.aggregate = aggregate
+        self.max_tokens = max(max_tokens, max_len)
         self.model = None
         self.vocab = None
+        self.model_file = None
+        # Dấu vân tay checkpoint .pth mà model đang dùng được tạo ra từ
+        self.source_fingerprint = None
+        self._model_version = None
+        # Khóa để các luồng không chạy forward đồng thời trên cùng một model
+        self._inference_lock = threading.Lock()
         
         try:
-            # Đăng ký Vocabulary class với global namespace
-            try:
-                sys.modules['__main__'].Vocabulary = Vocabulary
-            except:
-                pass
-            
             # Tìm model ở các vị trí khác nhau
             possible_paths = [
                 model_path,
@@ -209,115 +323,276 @@ class SpamDetector:
                 os.path.join(os.getcwd(), 'models', 'best_model.pth')
             ]
             
-            model_file = None
-            for path in possible_paths:
-                if os.path.exists(path):
-                    model_file = path
-                    break
-            
-            if not model_file:
-                print("[WARNING] Không tìm thấy model, sẽ sử dụng phương pháp dự phòng")
-                return
-                
-            # Tải checkpoint
-            checkpoint = None
-            try:
-                checkpoint = torch.load(model_file, map_location=self.device, weights_only=False)
-            except:
-                checkpoint = torch.load(model_file, map_location=self.device)
-            
-            if checkpoint is None:
-                return
-                
-            # Lấy vocabulary từ checkpoint hoặc tạo mới
-            if isinstance(checkpoint, dict) and 'vocab' in checkpoint:
-                self.vocab = VocabularyAdapter(checkpoint['vocab'])
+            # Ưu tiên artifact đã chuyển đổi (memory-map, không dùng pickle)
+            from app.model_artifact import find_artifact, load_artifact, source_fingerprint
+            artifact_dir = find_artifact(possible_paths)
+            if artifact_dir:
+                self.model, vocab, self.model_file = load_artifact(artifact_dir)
+                self.vocab = VocabularyAdapter(vocab)
+                self.source_fingerprint = source_fingerprint(artifact_dir)
             else:
-                self.vocab = VocabularyAdapter(create_vocab_from_scratch())
-            
-            vocab_size = len(self.vocab)
-            
-            # Khởi tạo model với tham số
-            embedding_dim = checkpoint.get('embedding_dim', 300) if isinstance(checkpoint, dict) else 300
-            hidden_dim = checkpoint.get('hidden_dim', 256) if isinstance(checkpoint, dict) else 256
-            num_layers = checkpoint.get('num_layers', 2) if isinstance(checkpoint, dict) else 2
-            output_dim = checkpoint.get('output_dim', 1) if isinstance(checkpoint, dict) else 1
-            dropout = checkpoint.get('dropout', 0.5) if isinstance(checkpoint, dict) else 0.5
-            bidirectional = checkpoint.get('bidirectional', True) if isinstance(checkpoint, dict) else True
-            
-            self.model = LSTMModel(
-                vocab_size=vocab_size,
-                embedding_dim=embedding_dim,
-                hidden_dim=hidden_dim,
-                num_layers=num_layers,
-                output_dim=output_dim,
-                dropout=dropout,
-                bidirectional=bidirectional
-            )
-            
-            # Tải trọng số
-            if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
-                self.model.load_state_dict(checkpoint['model_state_dict'])
-            else:
-                try:
-                    self.model.load_state_dict(checkpoint)
-                except:
-                    print("[WARNING] Không thể tải trọng số model")
+                model_file = None
+                for path in possible_paths:
+                    if os.path.exists(path):
+                        model_file = path
+                        break
+                
+                if not model_file:
+                    print("[WARNING] Không tìm thấy model, sẽ sử dụng phương pháp dự phòng")
+                    return
+                self.model_file = model_file
+                self.source_fingerprint = file_fingerprint(model_file)
+                self._load_checkpoint(model_file)
+                if self.model is None:
+                    return
                     
             # Chuyển model sang device và đặt ở chế độ evaluation
             self.model.to(self.device)
             self.model.eval()
             
+            # Chế độ độ chính xác thấp (int8/bf16) trên CPU nếu được cấu hình
+            self._apply_precision(precision or DEFAULT_PRECISION, precision_tolerance)
+            
         except Exception as e:
             print(f"[ERROR] Lỗi khi tải model: {e}")
             self.model = None
             self.vocab = None
     
+    def _load_checkpoint(self, model_file):
+        """Tải checkpoint .pth (pickle) của quá trình huấn luyện"""
+        # Đăng ký Vocabulary class với global namespace
+        try:
+            sys.modules['__main__'].Vocabulary = Vocabulary
+        except:
+            pass
+        
+        # Tải checkpoint
+        checkpoint = None
+        try:
+            checkpoint = torch.load(model_file, map_location=self.device, weights_only=False)
+        except:
+            checkpoint = torch.load(model_file, map_location=self.device)
+        
+        if checkpoint is None:
+            return
+            
+        # Lấy vocabulary từ checkpoint hoặc tạo mới
+        if isinstance(checkpoint, dict) and 'vocab' in checkpoint:
+            self.vocab = VocabularyAdapter(checkpoint['vocab'])
+        else:
+            self.vocab = VocabularyAdapter(create_vocab_from_scratch())
+        
+        # Khởi tạo model với tham số
+        hyperparameters = checkpoint_hyperparameters(checkpoint)
+        self.model = LSTMModel(vocab_size=len(self.vocab), **hyperparameters)
+        
+        # Tải trọng số
+        if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
+            self.model.load_state_dict(checkpoint['model_state_dict'])
+        else:
+            try:
+                self.model.load_state_dict(checkpoint)
+            except:
+                print("[WARNING] Không thể tải trọng số model")
+
+    def _apply_precision(self, precision, tolerance):
+        """Chuyển model sang int8 (dynamic quantization) hoặc bf16 nếu đạt ngưỡng sai lệch.
+
+        Chấm điểm tập hiệu chuẩn bằng model fp32 và model mới; nếu sai lệch lớn
+        nhất vượt ``tolerance`` thì giữ nguyên fp32.
+        """
+        if precision == 'fp32':
+            return
+        if precision not in SUPPORTED_PRECISIONS:
+            print(f"[WARNING] Chế độ độ chính xác không hợp lệ: {precision}, dùng fp32")
+            return
+        if self.device.type != 'cpu':
+            print(f"[WARNING] Chế độ {precision} chỉ hỗ trợ CPU, dùng fp32")
+            return
+
+        try:
+            if precision == 'int8':
+                candidate = torch.ao.quantization.quantize_dynamic(
+                    self.model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+            else:
+                if not cpu_supports_bf16():
+                    print("[WARNING] CPU không hỗ trợ bf16, dùng fp32")
+                    return
+                candidate = copy.deepcopy(self.model).to(dtype=torch.bfloat16)
+            candidate.eval()
+
+            calibration = [indices for indices in map(self._encode, CALIBRATION_TEXTS) if indices]
+            reference = self._score_indices(calibration)
+            reduced = self._score_indices(calibration, model=candidate)
+            drift = max(abs(a - b) for a, b in zip(reference, reduced))
+        except Exception as e:
+            print(f"[WARNING] Không thể chuyển model sang {precision}: {e}, dùng fp32")
+            return
+
+        if drift > tolerance:
+            print(f"[WARNING] Từ chối chế độ {precision}: sai lệch {drift:.4f} > {tolerance:.4f}, dùng fp32")
+            return
+
+        self.model = candidate
+        self.precision = precision
+        self._model_version = None
+        print(f"[INFO] Đang dùng model {precision} (sai lệch tối đa {drift:.4f})")
+
+    @property
+    def model_version(self):
+        """Dấu vân tay của bộ chấm điểm đang dùng (checkpoint + file từ khóa).
+
+        Thay đổi khi ``best_model.pth`` hoặc ``spam_keywords.json`` bị thay thế,
+        dùng để vô hiệu hóa các điểm spam đã lưu trong cache. Với artifact, gồm
+        cả dấu vân tay của weights.bin lẫn của checkpoint .pth nguồn.
+        """
+        if self._model_version is None:
+            from app.keyword_engine import DEFAULT_RULES_PATH
+            if self.model is not None:
+                model_part = f"{file_fingerprint(self.model_file)}:{self.precision}"
+                if self.source_fingerprint and self.source_fingerprint != file_fingerprint(self.model_file):
+                    model_part += f":src-{self.source_fingerprint}"
+                if self.long_document:
+                    model_part += f":long-{self.aggregate}-{self.max_tokens}"
+            else:
+                model_part = 'keywords-only'
+            self._model_version = f"{model_part}|{file_fingerprint(DEFAULT_RULES_PATH)}"
+        return self._model_version
+
+    def _encode(self, text):
+        """Tiền xử lý và chuyển văn bản thành dãy index (đã cắt theo max_len)"""
+        profiler = get_profiler()
+        with profiler.stage('preprocess'):
+            tokens = list(islice(get_text_preprocessor().iter_tokens(text), self.max_len))
+        with profiler.stage('numericalize'):
+            token2idx, unk_index = self.vocab.token_index()
+            lookup = token2idx.get
+            return [lookup(token, unk_index) for token in tokens]
+
+    def _encode_windows(self, text):
+        """Chuyển văn bản thành các cửa sổ index để chấm điểm.
+
+        Email ngắn (hoặc khi tắt chế độ email dài) cho đúng một cửa sổ giống
+        ``_encode``. Email dài cho tối đa ba cửa sổ: đầu, cuối và cửa sổ có
+        nhiều token từ khóa nhất; số token xử lý không vượt quá ``max_tokens``.
+        """
+        if not self.long_document:
+            indices = self._encode(text)
+            return [indices] if indices else []
+
+        profiler = get_profiler()
+        preprocessor = get_text_preprocessor()
+        token2idx, unk_index = self.vocab.token_index()
+        lookup = token2idx.get
+        keyword_tokens = get_keyword_engine().keyword_tokens
+
+        with profiler.stage('preprocess'):
+            tokens = list(islice(preprocessor.iter_tokens(text), self.max_tokens + 1))
+        truncated = len(tokens) > self.max_tokens
+        if truncated:
+            del tokens[self.max_tokens:]
+        with profiler.stage('numericalize'):
+            indices = [lookup(token, unk_index) for token in tokens]
+            hits = [1 if token in keyword_tokens else 0 for token in tokens]
+
+        window = self.max_len
+        if len(indices) <= window:
+            return [indices] if indices else []
+
+        head = indices[:window]
+        if truncated:
+            # Chỉ tách token phần cuối email thay vì toàn bộ phần ở giữa
+            tail_text = text[-LONG_DOCUMENT_TAIL_CHARS:]
+            match = re.search(r'\s', tail_text)
+            tail_text = tail_text[match.end():] if match else tail_text
+            with profiler.stage('preprocess'):
+                tail_tokens = preprocessor.tokenize(tail_text)[-window:]
+            with profiler.stage('numericalize'):
+                tail = [lookup(token, unk_index) for token in tail_tokens]
+        else:
+            tail = indices[-window:]
+
+        # Cửa sổ trượt tìm vùng có nhiều token từ khóa nhất
+        best_start = 0
+        best_hits = current = sum(hits[:window])
+        for start in range(1, len(indices) - window + 1):
+            current += hits[start + window - 1] - hits[start - 1]
+            if current > best_hits:
+                best_start, best_hits = start, current
+        dense = indices[best_start:best_start + window]
+
+        windows = []
+        for candidate in (head, tail, dense):
+            if candidate and candidate not in windows:
+                windows.append(candidate)
+        return windows
+
+    def _aggregate(self, probabilities):
+        """Gộp điểm các cửa sổ của một email theo quy tắc max hoặc mean"""
+        if self.aggregate == 'mean':
+            return sum(probabilities) / len(probabilities)
+        return max(probabilities)
+
+    def _keyword_excerpt(self, text):
+        """Giới hạn độ dài văn bản đưa vào bộ chấm từ khóa với email rất dài"""
+        if not self.long_document or len(text) <= LONG_DOCUMENT_KEYWORD_CHARS:
+            return text
+        half = LONG_DOCUMENT_KEYWORD_CHARS // 2
+        return text[:half] + "\n" + text[-half:]
+
+    def _blend_with_keywords(self, prediction, text):
+        """Áp dụng quy tắc từ khóa khi mô hình phân vân (0.4 - 0.6)"""
+        if 0.4 <= prediction <= 0.6:
+            keyword_score, _ = self.keyword_based_prediction(text)
+            if keyword_score > 0.7:
+                prediction = max(prediction, (prediction + keyword_score) / 2)
+            elif keyword_score < 0.3:
+                prediction = min(prediction, (prediction + keyword_score) / 2)
+        return prediction
+
     def predict(self, text):
         """Dự đoán xem email có phải là spam hay không"""
+        profiler = get_profiler()
         # Nếu không có model, sử dụng phương pháp fallback
         if self.model is None or self.vocab is None:
-            return self.keyword_based_prediction(text)
+            return self._keyword_fallback(text)
             
         try:
-            # Tiền xử lý văn bản
-            processed_text = preprocess_text(text)
+            # Tiền xử lý văn bản và chuyển tokens thành các cửa sổ indices
+            windows = self._encode_windows(text)
             
             # Kiểm tra xem văn bản có rỗng không
-            if not processed_text:
+            if not windows:
+                profiler.count('empty_text')
                 print("[WARNING] Văn bản rỗng sau khi tiền xử lý")
                 return 0.1  # Trả về xác suất thấp cho văn bản rỗng
             
-            # Chuyển tokens thành indices
-            indices = [self.vocab[token] for token in processed_text]
-            
-            # Cắt hoặc padding để đạt max_len
-            if len(indices) < self.max_len:
-                indices = indices + [0] * (self.max_len - len(indices))  # <pad> token có index là 0
+            if len(windows) > 1:
+                # Email dài: chấm tất cả cửa sổ trong một lần forward rồi gộp điểm
+                prediction = self._aggregate(self._score_indices(windows))
             else:
-                indices = indices[:self.max_len]
-            
-            # Chuyển sang tensor
-            text_tensor = torch.LongTensor([indices]).to(self.device)
-            length_tensor = torch.LongTensor([min(len(processed_text), self.max_len)]).to(self.device)
-            
-            # Dự đoán
-            with torch.no_grad():
-                logits = self.model(text_tensor, length_tensor)
+                indices = windows[0]
+                length = len(indices)
+                # Padding để đạt max_len
+                indices = indices + [0] * (self.max_len - length)  # <pad> token có index là 0
+                
+                # Chuyển sang tensor
+                text_tensor = torch.LongTensor([indices]).to(self.device)
+                length_tensor = torch.LongTensor([length]).to(self.device)
+                
+                # Dự đoán
+                with profiler.stage('forward'), torch.no_grad(), self._inference_lock:
+                    logits = self.model(text_tensor, length_tensor)
                 # Xử lý trường hợp logits là float
                 if isinstance(logits, float):
                     prediction = logits
                 else:
-                    logits = logits.squeeze()
+                    logits = logits.float().squeeze()
                     prediction = torch.sigmoid(logits).item()
-                    
-                # Áp dụng quy tắc để cải thiện độ chính xác:
-                if 0.4 <= prediction <= 0.6:
-                    keyword_score = self.keyword_based_prediction(text)
-                    if keyword_score > 0.7:
-                        prediction = max(prediction, (prediction + keyword_score) / 2)
-                    elif keyword_score < 0.3:
-                        prediction = min(prediction, (prediction + keyword_score) / 2)
+                
+            # Áp dụng quy tắc để cải thiện độ chính xác:
+            prediction = self._blend_with_keywords(prediction, self._keyword_excerpt(text))
+            profiler.count('path.model')
             
             print(f"[INFO] Dự đoán thành công với mô hình AI. Điểm spam: {prediction:.4f}")
             return prediction  # Trả về xác suất là spam (0-1)
@@ -325,139 +600,91 @@ class SpamDetector:
             print(f"[ERROR] Lỗi khi dự đoán: {e}")
             import traceback
             traceback.print_exc()
+            profiler.count('exceptions.predict')
             # Nếu có lỗi, sử dụng phương pháp dự phòng dựa trên từ khóa
-            return self.keyword_based_prediction(text)
-    
-    def keyword_based_prediction(self, text):
-        """Phân tích dựa trên từ khóa khi model ML không khả dụng"""
-        if not text or not isinstance(text, str):
-            return 0.0
-            
-        # Chuyển text về chữ thường để dễ so sánh
-        text = text.lower()
-        
-        # Danh sách các từ khóa phổ biến trong email lừa đảo/spam - CẢI TIẾN DANH SÁCH
-        spam_keywords = [
-            # Từ khóa liên quan đến tính khẩn cấp
-            'urgent', 'immediate action', 'act now', 'limited time', 'deadline', 'expiration',
-            'last chance', 'don\'t delay', 'hurry', 'khẩn cấp', 'không được bỏ lỡ',
-            
-            # Tiền bạc và cơ hội
-            'lottery', 'winner', 'free money', 'million dollar', 'prize', 'jackpot', 'cash', 
-            'investment opportunity', 'nigeria', 'inheritance', 'prince', 'loan', 'profit',
-            'claim your prize', 'bank transfer', 'offshore', 'opportunity', 'fortune',
-            'xổ số', 'trúng thưởng', 'tiền tỷ', 'bạn đã trúng', 'cơ hội đầu tư',
-            
-            # Ưu đãi và khuyến mãi đáng ngờ
-            'congratulations', 'click here', 'offer', 'free', 'guaranteed', 'no risk',
-            'best price', 'cash bonus', 'discount', 'special offer', 'exclusive deal',
-            'limited offer', 'lifetime opportunity', 'free gift', 'premium', 'no cost',
-            
-            # Y tế và giảm cân
-            'cialis', 'viagra', 'weight loss', 'lose weight', 'miracle cure', 'no medical exams',
-            'medicine', 'drug', 'pharmacy', 'prescription', 'diet', 'fat', 'slim',
-            
-            # Tài chính
-            'earn extra cash', 'eliminate debt', 'extra income', 'fast cash', 'for free', 
-            'for just $', 'double your money', 'financial freedom', 'get rich quick',
-            'debt free', 'cash advance', 'payday loan', 'installment', 'refinance',
-            'for only', 'from home', 'gửi tiền', 'hidden assets', 'incredible deal',
-            'money back', 'order now', 'please help', 'potential earnings', 'pure profit', 
-            'risk-free', 'special promotion', 'supplies limited', 'take action now',
-            'miễn phí', 'hành động ngay', 'cơ hội cuối cùng', 'thanh toán',
-            
-            # Bảo mật và tài khoản ngân hàng
-            'verify', 'identity', 'suspicious', 'account', 'security', 'password', 
-            'verify', 'bank', 'secure', 'unauthorized', 'access', 'credit card', 
-            'authenticate', 'confirm', 'verification', 'validate', 'authorization',
-            'bảo mật', 'ngân hàng quốc tế', 'thẻ tín dụng',
-            'account blocked', 'suspended', 'verify identity', 'security alert',
-            'password expired', 'login information', 'social security', 'update account',
-            'suspicious activity', 'login details', 'personal details', 'credentials',
-            
-            # Làm việc tại nhà
-            'work from home', 'no experience', 'guaranteed income', 'be your own boss',
-            'make money online', 'earn money fast', 'income opportunity', 'residual income',
-            
-            # Các dấu hiệu lừa đảo khác
-            'this is not spam', 'not spam', 'removed at any time', 'removal instructions', 
-            'to be removed', 'to unsubscribe', 'this is not a scam', 'no scam', 'no spam', 
-            'legitimate', 'this is legitimate', 'real thing', 'serious offer', 'serious business',
-            'direct marketing', 'direct email', 'bulk email', 'mass email', 'opt in'
-        ]
-        
-        # Đếm số lượng từ khóa xuất hiện và trọng số cho từng loại
-        keyword_count = 0
-        urgent_count = 0
-        money_count = 0
-        security_count = 0
-        sensitive_info_count = 0
-        matched_keywords = []
-
-        # Phân tích ngữ cảnh sử dụng từ khóa
-        for keyword in spam_keywords:
-            if keyword in text:
-                matched_keywords.append(keyword)
-                keyword_count += 1
-
-                if keyword in ['urgent', 'immediate action', 'act now', 'deadline', 'expiration', 'khẩn cấp']:
-                    urgent_count += 1
-                elif keyword in ['money', 'cash', 'bank', 'transfer', 'million', 'dollar', 'payment']:
-                    money_count += 1
-                elif keyword in ['security', 'secure', 'verify', 'validate', 'authenticate', 'bảo mật']:
-                    security_count += 1
-                elif keyword in ['password', 'credit card', 'account number', 'login', 'social security', 'thẻ tín dụng']:
-                    sensitive_info_count += 1
+            return self._keyword_fallback(text)
 
-        score = min(0.15 * keyword_count, 0.75)
-
-        # Các yếu tố khác
-        exclamation_count = text.count('!')
-        if exclamation_count > 3:
-            score += min(0.05 * (exclamation_count - 3), 0.15)
-
-        words = text.split()
-        uppercase_words = sum(1 for word in words if word.isupper() and len(word) > 2)
-        if uppercase_words > 3:
-            score += min(0.05 * (uppercase_words - 3), 0.2)
-
-        if '$' in text or '€' in text or '£' in text or 'tiền' in text or 'đô la' in text:
-            score += 0.15
+    def _keyword_fallback(self, text):
+        """Chấm điểm bằng từ khóa khi không dùng được model (có đo thời gian)"""
+        profiler = get_profiler()
+        profiler.count('path.fallback')
+        with profiler.stage('keyword_fallback'):
+            return self.keyword_based_prediction(text)
 
-        url_count = text.count('http') + text.count('www') + text.count('.com') + text.count('.net')
-        if url_count > 1:
-            score += min(0.1 * url_count, 0.25)
+    def _score_indices(self, batch_indices, model=None):
+        """Chạy một lần forward dạng packed cho một nhóm dãy index, trả về xác suất spam"""
+        model = model if model is not None else self.model
+        lengths = [len(indices) for indices in batch_indices]
+        # Ghi index của cả lô vào một buffer cấp phát sẵn (0 là <pad>) rồi dùng chung bộ nhớ với tensor
+        buffer = np.zeros((len(batch_indices), max(lengths)), dtype=np.int64)
+        for row, indices in enumerate(batch_indices):
+            buffer[row, :len(indices)] = indices
+        text_tensor = torch.from_numpy(buffer)
 
-        suspicious_patterns = ['click here', 'click this link', 'nhấp vào đây', 'bấm vào liên kết']
-        for pattern in suspicious_patterns:
-            if pattern in text.lower():
-                score += 0.15
-                break
+        with get_profiler().stage('forward'), torch.no_grad(), self._inference_lock:
+            logits = model(text_tensor.to(self.device), torch.LongTensor(lengths))
+        return torch.sigmoid(logits.float().view(len(batch_indices), -1)[:, 0]).tolist()
 
-        if len(text) < 100:
-            score *= (len(text) / 100)
+    def predict_batch(self, texts, bucket_size=32):
+        """Dự đoán spam cho nhiều email cùng lúc.
 
-        if urgent_count > 0:
-            score += min(0.2 * urgent_count, 0.4)
+        Các email được sắp theo độ dài và chia thành từng nhóm (bucket) tối đa
+        ``bucket_size`` phần tử; mỗi nhóm chỉ padding tới chuỗi dài nhất của nhóm
+        và chạy một lần forward dạng packed. Kết quả trả về là danh sách điểm
+        spam (float) theo đúng thứ tự đầu vào, giống với ``predict``.
+        """
+        texts = list(texts)
+        scores = [0.0] * len(texts)
+        if not texts:
+            return scores
 
-        if sensitive_info_count > 0:
-            score += min(0.25 * sensitive_info_count, 0.5)
+        # Nếu không có model, sử dụng phương pháp fallback cho từng email
+        if self.model is None or self.vocab is None:
+            return [self._keyword_fallback(text)[0] for text in texts]
 
-        if urgent_count > 0 and sensitive_info_count > 0:
-            score += 0.2
+        try:
+            encoded = []
+            for position, text in enumerate(texts):
+                windows = self._encode_windows(text)
+                if not windows:
+                    get_profiler().count('empty_text')
+                    scores[position] = 0.1  # Văn bản rỗng: xác suất thấp như predict
+                else:
+                    encoded.extend((position, indices) for indices in windows)
 
-        if money_count > 0 and sensitive_info_count > 0:
-            score += 0.2
+            # Sắp theo độ dài để các email trong cùng bucket có độ dài gần nhau
+            encoded.sort(key=lambda item: len(item[1]))
 
-        sentences = re.split(r'[.!?]', text)
-        short_sentences = sum(1 for s in sentences if len(s.strip()) < 5)
-        if short_sentences > len(sentences) * 0.5:
-            score += 0.1
+            window_scores = {}
+            for start in range(0, len(encoded), bucket_size):
+                bucket = encoded[start:start + bucket_size]
+                probabilities = self._score_indices([indices for _, indices in bucket])
+                for (position, _), prediction in zip(bucket, probabilities):
+                    window_scores.setdefault(position, []).append(prediction)
 
-        score = min(score, 0.98)
+            for position, probabilities in window_scores.items():
+                text = texts[position]
+                scores[position] = self._blend_with_keywords(
+                    self._aggregate(probabilities), self._keyword_excerpt(text))
+            get_profiler().count('path.model', len(window_scores))
 
-        # 🔥 Trả về cả score và danh sách từ khóa
-        return score, matched_keywords
+            print(f"[INFO] Dự đoán theo lô thành công cho {len(texts)} email")
+            return scores
+        except Exception as e:
+            print(f"[ERROR] Lỗi khi dự đoán theo lô: {e}")
+            get_profiler().count('exceptions.predict_batch')
+            import traceback
+            traceback.print_exc()
+            # Nếu có lỗi, dự đoán lần lượt từng email
+            results = []
+            for text in texts:
+                result = self.predict(text)
+                results.append(result[0] if isinstance(result, tuple) else result)
+            return results
+    
+    def keyword_based_prediction(self, text):
+        """Phân tích dựa trên từ khóa khi model ML không khả dụng"""
+        return keyword_score(text)
 
 
 # Hàm lấy detector đã được tối ưu (singleton)
@@ -468,8 +695,4 @@ def get_spam_detector():
 class FallbackSpamDetector:
     def predict(self, text):
         """Dự đoán spam dựa trên từ khóa khi không có model AI"""
-        temp_detector = SpamDetector.__new__(SpamDetector)
-        temp_detector.device = torch.device('cpu')
-        temp_detector.model = None 
-        temp_detector.vocab = None
-        return temp_detector.keyword_based_prediction(text) 
\ No newline at end of file
+        return keyword_score(text) 
\ No newline at end of file
@@ -0,0 +1,406 @@
+import re
+import threading
+
+# ============== BỘ TIỀN XỬ LÝ VĂN BẢN ĐÃ BIÊN DỊCH SẴN ================
+# Thay thế cho chuỗi lower -> 2 lần re.sub -> word_tokenize -> lọc stopwords
+# trong spam_detector.preprocess_text. Mọi thứ (stopwords, regex, danh sách
+# viết tắt của Punkt) chỉ được xây dựng một lần cho toàn tiến trình.
+
+# Loại bỏ mọi ký tự không phải chữ cái, khoảng trắng và dấu câu quan trọng
+_CLEAN_RE = re.compile(r'[^a-zA-Z\s.,!?]')
+_KEPT_CHAR_RE = re.compile(r'[a-zA-Z\s.,!?]')
+
+# Một regex duy nhất tái tạo kết quả word_tokenize trên văn bản đã làm sạch
+# (chỉ còn a-z, khoảng trắng và . , ! ?):
+#   - word: từ, có thể chứa dấu chấm bên trong (u.s, www.site.com) hoặc bắt đầu
+#     bằng dấu chấm (".co" còn lại sau khi bỏ "12" trong "12.co"), và một dấu
+#     chấm ở cuối; việc dấu chấm cuối có tách ra hay không được quyết định sau
+#   - ellipsis: "..", "..." được Treebank giữ nguyên thành một token
+#   - commas: chuỗi dấu phẩy; Treebank tách dấu phẩy theo từng cặp nên với số
+#     chẵn dấu phẩy liền trước một từ, dấu cuối dính vào từ đó (",,inc" -> ",", ",inc")
+#   - punct: từng dấu . ! ? riêng lẻ
+_TOKEN_RE = re.compile(r'''
+    (?P<word>(?:(?<![a-z.])\.)?[a-z]+(?:\.[a-z]+)*)(?P<dot>\.(?!\.))?
+  | (?P<ellipsis>\.{2,})
+  | (?P<commas>,+)
+  | (?P<punct>[.!?])
+''', re.VERBOSE)
+
+# Các từ ghép mà Treebank (CONTRACTIONS2) tách làm hai
+_CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+# Trong từ có dấu chấm/phẩy ("xworld.cannot"), Treebank vẫn tách các từ ghép trên theo \b,
+# riêng "wanna" chỉ được tách khi theo sau là khoảng trắng (tức là đứng cuối từ):
+# "wanna.," (dấu chấm không cuối câu) giữ nguyên "wanna."
+_CONTRACTION_RE = re.compile(r'\b(%s\b|wanna$)' % '|'.join(
+    word for word in _CONTRACTIONS if word != 'wanna'))
+
+
+# Bộ tách từ của Punkt (PunktLanguageVars.word_tokenize) rút gọn cho văn bản
+# đã làm sạch (chỉ còn a-z, khoảng trắng và . , ! ?)
+_PUNKT_MULTI_CHAR = r'\.{2,}|(?:\.\s){2,}\.'
+_PUNKT_WORD_RE = re.compile(
+    rf'{_PUNKT_MULTI_CHAR}'
+    rf'|(?=[^,])\S+?(?=\s|$|[?!]|{_PUNKT_MULTI_CHAR}|,(?=$|\s|[?!]|{_PUNKT_MULTI_CHAR}))'
+    r'|\S'
+)
+_PUNKT_ELLIPSIS_RE = re.compile(r'\.\.+$')
+_PUNKT_INITIAL_RE = re.compile(r'[^\W\d]\.$')
+_SENT_END_CHARS = ('.', '?', '!')
+# Token Punkt chắc chắn không mở đầu câu
+_PUNKT_PUNCTUATION = (';', ':', ',', '.', '!', '?')
+
+# Kích thước đoạn văn bản được làm sạch/tách token mỗi lần
+CHUNK_SIZE = 16 * 1024
+_WHITESPACE_RE = re.compile(r'\s')
+_NON_SPACE_RE = re.compile(r'\S+')
+_PLAIN_WORD_RE = re.compile(r'[a-z]+')
+_WORD_START_RE = re.compile(r'\.?[a-z]|\.(?!\.)')
+
+
+def scoring_text(sender, subject, body):
+    """Văn bản bộ chấm điểm nhận cho một email: From, Subject rồi nội dung"""
+    return f"From: {sender or ''}\nSubject: {subject or ''}\n\n{body or ''}"
+
+
+def _iter_chunks(text, chunk_size):
+    """Chia văn bản thành các đoạn, mỗi đoạn (trừ đoạn cuối) kết thúc bằng một khoảng trắng"""
+    start = 0
+    length = len(text)
+    while start < length:
+        end = start + chunk_size
+        if end >= length:
+            yield text[start:]
+            return
+        match = _WHITESPACE_RE.search(text, end)
+        if match is None:
+            yield text[start:]
+            return
+        yield text[start:match.end()]
+        start = match.end()
+
+
+def _load_stopwords():
+    """Stopwords tiếng Anh của NLTK, đọc từ tài nguyên đóng gói (một lần)"""
+    from app.nltk_resources import get_nltk_resources
+    return get_nltk_resources().stopwords
+
+
+def _load_punkt_resources():
+    """Từ viết tắt, collocation và từ mở đầu câu của mô hình Punkt tiếng Anh (tài nguyên đóng gói)"""
+    from app.nltk_resources import get_nltk_resources
+    resources = get_nltk_resources()
+    return resources.abbreviations, resources.collocations, resources.sentence_starters
+
+
+class TextPreprocessor:
+    """Tiền xử lý văn bản email thành token hoặc trực tiếp thành index.
+
+    Cho cùng kết quả với ``preprocess_text`` (lower, làm sạch, word_tokenize,
+    bỏ stopwords) nhưng chỉ dùng một lần ``re.sub`` và một lần ``finditer``.
+    """
+
+    def __init__(self, stop_words=None, abbreviations=None, collocations=None, sentence_starters=None):
+        self.stop_words = frozenset(stop_words) if stop_words is not None else _load_stopwords()
+        if abbreviations is None or collocations is None or sentence_starters is None:
+            default_abbreviations, default_collocations, default_starters = _load_punkt_resources()
+        self.abbreviations = frozenset(abbreviations if abbreviations is not None else default_abbreviations)
+        self.collocations = frozenset(collocations if collocations is not None else default_collocations)
+        self.sentence_starters = frozenset(sentence_starters if sentence_starters is not None
+                                           else default_starters)
+
+    def clean(self, text):
+        """Chuyển về chữ thường và loại bỏ ký tự đặc biệt"""
+        return _CLEAN_RE.sub('', text.lower())
+
+    def iter_tokens(self, text, chunk_size=None):
+        """Sinh lần lượt các token (đã bỏ stopwords) của văn bản.
+
+        Văn bản được làm sạch và tách token theo từng đoạn (cắt ngay sau một
+        khoảng trắng nên kết quả không đổi), vì vậy người gọi dừng sớm thì phần
+        còn lại của email dài không phải xử lý.
+        """
+        for _, cleaned, following in self._iter_cleaned_chunks(text, chunk_size):
+            for token, _ in self._iter_chunk_tokens(cleaned, following):
+                yield token
+
+    def iter_token_spans(self, text, chunk_size=None):
+        """Giống ``iter_tokens`` nhưng sinh (token, start, end) với vị trí trong ``text`` gốc.
+
+        Dùng để tô sáng đúng những chỗ bộ chấm điểm đã thấy; chậm hơn
+        ``iter_tokens`` vì phải dựng bảng vị trí của từng ký tự được giữ lại.
+        """
+        chunk_start = 0
+        for chunk, cleaned, following in self._iter_cleaned_chunks(text, chunk_size):
+            positions = None
+            for token, start in self._iter_chunk_tokens(cleaned, following):
+                if positions is None:
+                    positions = self._kept_positions(chunk)
+                end = start + len(token) - 1
+                yield token, chunk_start + positions[start], chunk_start + positions[end] + 1
+            chunk_start += len(chunk)
+
+    @staticmethod
+    def _kept_positions(chunk):
+        """Vị trí trong ``chunk`` gốc của từng ký tự còn lại sau ``clean(chunk)``"""
+        lowered = chunk.lower()
+        if len(lowered) == len(chunk):
+            return [match.start() for match in _KEPT_CHAR_RE.finditer(lowered)]
+        # Chữ thường của một số ký tự Unicode dài hơn một ký tự
+        return [index for index, char in enumerate(chunk) for lower in char.lower()
+                if _KEPT_CHAR_RE.match(lower)]
+
+    def _iter_cleaned_chunks(self, text, chunk_size=None):
+        """Sinh (đoạn gốc, đoạn đã làm sạch, đoạn làm sạch kế tiếp có nội dung hoặc None)"""
+        if not isinstance(text, str):
+            return
+        # preprocess_text gốc strip() văn bản sau khi làm sạch, nên Punkt coi dấu
+        # chấm trước phần chỉ còn khoảng trắng (kể cả "Inc. 5\n" sau khi bỏ số) là
+        # cuối văn bản. Đọc trước các đoạn kế tiếp để biết đoạn nào là đoạn cuối.
+        chunks = ((chunk, self.clean(chunk)) for chunk in _iter_chunks(text, chunk_size or CHUNK_SIZE))
+        current = next(chunks, None)
+        while current is not None:
+            following = next(chunks, None)
+            skipped = []
+            while following is not None and (not following[1] or following[1].isspace()):
+                skipped.append(following)
+                following = next(chunks, None)
+            chunk, cleaned = current
+            if following is None:
+                cleaned = cleaned.rstrip()
+            yield chunk, cleaned, following and following[1]
+            # Các đoạn chỉ còn khoảng trắng không sinh token nhưng vẫn chiếm vị trí
+            for chunk, _ in skipped:
+                yield chunk, '', None
+            current = following
+
+    def _is_sentbreak(self, token, next_token):
+        """Chú thích của Punkt (lượt 1 và 2) cho ``token``: có phải ngắt câu không"""
+        if token in _SENT_END_CHARS:
+            return True
+        if (not token.endswith('.') or token.endswith('..')
+                or _PUNKT_ELLIPSIS_RE.match(token) or token[:-1] in self.abbreviations):
+            # Không kết thúc bằng dấu chấm, dấu ba chấm hoặc từ viết tắt: văn bản
+            # đã viết thường nên heuristic chính tả không bao giờ biến chúng thành ngắt câu
+            return False
+        if next_token is None:
+            return True
+        next_type = next_token
+        if next_type.endswith('.') and not next_type.endswith('..') and next_type[:-1] not in self.abbreviations:
+            next_type = next_type[:-1]
+        if (token[:-1], next_type) in self.collocations:
+            return False
+        if _PUNKT_INITIAL_RE.match(token):
+            # Chữ cái đầu (initial): không ngắt câu nếu từ sau chắc chắn không mở đầu câu
+            if next_token in _PUNKT_PUNCTUATION:
+                return False
+            if next_token[0].islower() and next_type not in self.sentence_starters:
+                return False
+        return True
+
+    def _ends_sentence(self, text, dot, following, word_start=None):
+        """Dấu chấm ở vị trí ``dot`` có kết thúc câu theo sent_tokenize của Punkt không.
+
+        Treebank chỉ tách dấu chấm cuối câu. Punkt xét dấu . ? ! cuối cùng của
+        mỗi cụm không có khoảng trắng, nếu sau nó là ! ? hoặc một cụm khác, và
+        ngắt câu khi một token (trừ token cuối) trong ngữ cảnh đó là ngắt câu.
+        """
+        length = len(text)
+        if dot + 1 == length:
+            # Cuối văn bản (đoạn cuối đã được rstrip)
+            return True
+        if word_start is not None and (word_start == 0 or text[word_start - 1].isspace()):
+            run_start = word_start
+        else:
+            run_start = dot
+            while run_start > 0 and not text[run_start - 1].isspace():
+                run_start -= 1
+        run_end = dot + 1
+        while run_end < length and not text[run_end].isspace():
+            run_end += 1
+
+        next_run = None
+        match = _NON_SPACE_RE.search(text, run_end)
+        if match is not None:
+            next_run = match.group(0)
+        elif following:
+            match = _NON_SPACE_RE.search(following)
+            next_run = match.group(0) if match else None
+
+        # Vị trí ngắt câu tiềm năng của cụm: dấu . ? ! cuối cùng thỏa điều kiện
+        candidate = None
+        for position in range(run_end - 1, dot - 1, -1):
+            if text[position] not in _SENT_END_CHARS:
+                continue
+            if position + 1 < run_end:
+                if text[position + 1] in '?!':
+                    candidate = position
+                    break
+            elif next_run is not None:
+                candidate = position
+                break
+        if candidate != dot:
+            return False
+
+        if run_end == dot + 1 and run_start == word_start and _PLAIN_WORD_RE.fullmatch(next_run):
+            # Trường hợp phổ biến "từ. từ": ngữ cảnh chỉ có hai token Punkt
+            return self._is_sentbreak(text[run_start:dot + 1], next_run)
+
+        after = text[dot + 1] if dot + 1 < run_end else ' ' + next_run
+        tokens = _PUNKT_WORD_RE.findall(text[run_start:dot + 1] + after)
+        return any(self._is_sentbreak(token, tokens[index + 1])
+                   for index, token in enumerate(tokens[:-1]))
+
+    def _iter_chunk_tokens(self, text, following=None):
+        """Sinh (token, vị trí bắt đầu trong ``text`` đã làm sạch) của một đoạn"""
+        stop_words = self.stop_words
+        lead_end = -1
+
+        for match in _TOKEN_RE.finditer(text):
+            word = match.group('word')
+            start = match.start()
+            if word is None:
+                token = match.group(0)
+                commas = match.group('commas')
+                if commas is not None:
+                    count = len(commas)
+                    if count % 2 == 0 and _WORD_START_RE.match(text, match.end()):
+                        count -= 1
+                        lead_end = match.end()
+                    if ',' not in stop_words:
+                        for offset in range(count):
+                            yield ',', start + offset
+                elif start == lead_end:
+                    # ",." dính nhau, trừ khi dấu chấm kết thúc câu
+                    if self._ends_sentence(text, start, following):
+                        parts = ((',', start - 1), (token, start))
+                    else:
+                        parts = ((',' + token, start - 1),)
+                    for part in parts:
+                        if part[0] not in stop_words:
+                            yield part
+                elif token not in stop_words:
+                    yield token, start
+                continue
+            if start == lead_end:
+                word = ',' + word
+                start -= 1
+
+            trailing = None
+            if match.group('dot'):
+                # Treebank chỉ tách dấu chấm đứng cuối câu (theo Punkt)
+                if self._ends_sentence(text, match.start('dot'), following, match.start()):
+                    trailing = '.'
+                else:
+                    word += '.'
+
+            if ('.' in word or ',' in word) and _CONTRACTION_RE.search(word):
+                parts = [part for piece in _CONTRACTION_RE.split(word) if piece
+                         for part in _CONTRACTIONS.get(piece, (piece,))]
+            else:
+                parts = _CONTRACTIONS.get(word)
+            if parts is None:
+                if word not in stop_words:
+                    yield word, start
+            else:
+                # Các phần ghép lại đúng bằng từ gốc nên vị trí là độ dài cộng dồn
+                for part in parts:
+                    if part not in stop_words:
+                        yield part, start
+                    start += len(part)
+
+            if trailing is not None and trailing not in stop_words:
+                yield trailing, match.start('dot')
+
+    def tokenize(self, text):
+        """Trả về danh sách token giống ``preprocess_text``"""
+        return list(self.iter_tokens(text))
+
+    def encode(self, text, token2idx, unk_index=1, max_len=None):
+        """Chuyển văn bản thẳng thành dãy index, dừng sớm khi đủ ``max_len``"""
+        lookup = token2idx.get
+        indices = []
+        append = indices.append
+        for token in self.iter_tokens(text):
+            append(lookup(token, unk_index))
+            if max_len is not None and len(indices) >= max_len:
+                break
+        return indices
+
+
+_default_preprocessor = None
+_default_lock = threading.Lock()
+
+
+def get_text_preprocessor():
+    """Trả về bộ tiền xử lý dùng chung (khởi tạo một lần, an toàn đa luồng)"""
+    global _default_preprocessor
+    if _default_preprocessor is None:
+        with _default_lock:
+            if _default_preprocessor is None:
+                _default_preprocessor = TextPreprocessor()
+    return _default_preprocessor
+
+
+def compare_with_reference(texts, preprocessor=None):
+    """Đối chiếu kết quả với ``preprocess_text`` gốc, trả về danh sách khác biệt.
+
+    Trả về None (bỏ qua) nếu máy không có NLTK và dữ liệu punkt.
+    """
+    from app.nltk_resources import reference_tokenizer_available
+    if not reference_tokenizer_available():
+        print("[WARNING] Không có NLTK/punkt, bỏ qua đối chiếu với preprocess_text")
+        return None
+    from app.spam_detector import preprocess_text
+    preprocessor = preprocessor or get_text_preprocessor()
+    mismatches = []
+    for text in texts:
+        expected = preprocess_text(text)
+        actual = preprocessor.tokenize(text)
+        if expected != actual:
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+
+def benchmark(texts, repeat=20):
+    """Đo thời gian trung bình (ms/email) của bộ tiền xử lý mới và preprocess_text (nếu có NLTK)"""
+    import time
+    from app.nltk_resources import reference_tokenizer_available
+    preprocessor = get_text_preprocessor()
+    preprocessor.tokenize("warm up")
+
+    functions = [("TextPreprocessor", preprocessor.tokenize)]
+    if reference_tokenizer_available():
+        from app.spam_detector import preprocess_text
+        functions.insert(0, ("preprocess_text", preprocess_text))
+
+    results = {}
+    for name, function in functions:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                function(text)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed * 1000 / (repeat * len(texts))
+    return results
+
+
+if __name__ == "__main__":
+    from app.sample_emails import sample_email_texts
+
+    samples = sample_email_texts()
+
+    mismatches = compare_with_reference(samples)
+    if mismatches is not None:
+        print(f"Khác biệt so với preprocess_text: {len(mismatches)}/{len(samples)}")
+    for text, expected, actual in mismatches or []:
+        print(f"  - {text[:60]!r}\n    expected={expected}\n    actual={actual}")
+
+    for name, ms in benchmark(samples).items():
+        print(f"{name}: {ms:.3f} ms/email")
@@ -1,6 +1,14 @@
 import sys
 import os
-from PyQt6.QtWidgets import QApplication, QMessageBox
+
+# Giới hạn luồng của torch để không chiếm hết CPU của vòng lặp sự kiện Qt. Đây là
+# thiết lập toàn tiến trình nên đặt ở đây (trước khi torch được import) thay vì
+# trong thư viện; OMP_NUM_THREADS do người dùng đặt vẫn được ưu tiên. Số luồng inter-op
+# (PHISH_TORCH_INTEROP_THREADS) được đặt khi dịch vụ suy luận nạp model lần đầu.
+os.environ.setdefault('OMP_NUM_THREADS',
+                      os.environ.get('PHISH_TORCH_THREADS', str(max(1, (os.cpu_count() or 2) // 2))))
+
+from PyQt6.QtWidgets import QApplication
 from app.login_window import LoginWindow
 from app.database import recreate_database
 
@@ -12,30 +20,11 @@ def setup_environment():
     print(f"Thư mục làm việc hiện tại: {os.getcwd()}")
     
     # Đảm bảo các thư mục cần thiết tồn tại
-    required_dirs = ["models", "data", "nltk_data"]
+    required_dirs = ["models", "data"]
     for directory in required_dirs:
         if not os.path.exists(directory):
             os.makedirs(directory)
 
-def check_model():
-    """Kiểm tra xem model AI có tồn tại không và hiển thị thông báo"""
-    # Kiểm tra model AI
-    model_path = os.path.join("models", "best_model.pth")
-    if not os.path.exists(model_path):
-        print(f"CẢNH BÁO: Model AI không được tìm thấy ở {model_path}")
-        print("Tính năng phát hiện email lừa đảo sẽ không hoạt động.")
-        return False
-    
-    # Kiểm tra kích thước file để đảm bảo đó là file hợp lệ
-    file_size = os.path.getsize(model_path) / (1024 * 1024)  # Kích thước theo MB
-    print(f"Kích thước model: {file_size:.2f} MB")
-    
-    if file_size < 1:  # Nếu file nhỏ hơn 1MB thì có thể không phải là model hợp lệ
-        print("CẢNH BÁO: Model AI có thể không hợp lệ (kích thước quá nhỏ)")
-        return False
-        
-    return True
-
 def main():
     """Hàm chính khởi chạy ứng dụng"""
     # Thiết lập môi trường làm việc
@@ -48,22 +37,11 @@ def main():
             print("Đã khởi tạo lại database. Vui lòng chạy lại ứng dụng mà không có tham số --reset-db")
             return
     
-    # Kiểm tra model AI
-    model_ok = check_model()
-    
     # Khởi tạo ứng dụng
     app = QApplication(sys.argv)
     window = LoginWindow()
     
-    # Hiển thị thông báo nếu model không tìm thấy
-    if not model_ok:
-        QMessageBox.warning(window, "Cảnh báo", 
-            "Model AI không được tìm thấy hoặc không hợp lệ!\n" +
-            "Tính năng phát hiện email lừa đảo sẽ không hoạt động.\n" +
-            "Hãy đảm bảo file 'best_model.pth' nằm trong thư mục 'models'."
-        )
-    
-    # Hiển thị cửa sổ đăng nhập
+    # Hiển thị cửa sổ đăng nhập (model AI bắt đầu được nạp nền, cảnh báo nếu không tìm thấy)
     window.show()
     
     # Khởi chạy vòng lặp sự kiện
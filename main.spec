@@ -1,11 +1,18 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import os
+
+# Ưu tiên artifact memory-map (có thể đã rút gọn bằng app/compact_model.py) nếu đã được tạo
+if os.path.exists(os.path.join('models', 'best_model', 'header.json')):
+    model_datas = [('models/best_model', 'models/best_model')]
+else:
+    model_datas = [('models/best_model.pth', 'models')]
 
 a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('models/best_model.pth', 'models'), ('emails.db', '.'), ('credentials.json', '.')],
+    datas=model_datas + [('app/spam_keywords.json', 'app'), ('app/nltk_resources.json', 'app'), ('app/sender_allowlist.json', 'app'), ('emails.db', '.'), ('credentials.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+# Kiểm thử không được đụng tới emails.db của ứng dụng: app.database đọc biến này khi import
+os.environ.setdefault("PHISH_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="phish-tests-"), "emails.db"))
+
+import pytest
+
+TINY_VOCAB = ["<pad>", "<unk>", "account", "verify", "prize", "meeting", "agenda", "click", "subject", "from", "rare"]
+TINY_HYPERPARAMETERS = {"embedding_dim": 8, "hidden_dim": 8, "num_layers": 1, "output_dim": 1,
+                        "dropout": 0.0, "bidirectional": True, "embedding_rank": None}
+
+
+@pytest.fixture
+def tiny_checkpoint(tmp_path):
+    """Ghi checkpoint .pth của một LSTMModel rất nhỏ: ``tiny_checkpoint(seed=0)`` trả về đường dẫn.
+
+    Gọi lại với seed khác ghi đè cùng file (mô phỏng việc thay best_model.pth).
+    """
+    torch = pytest.importorskip("torch")
+    from app.spam_detector import LSTMModel
+
+    path = tmp_path / "tiny_model.pth"
+
+    def save(seed=0):
+        torch.manual_seed(seed)
+        model = LSTMModel(vocab_size=len(TINY_VOCAB), **TINY_HYPERPARAMETERS)
+        torch.save(dict(TINY_HYPERPARAMETERS, model_state_dict=model.state_dict(),
+                        vocab={token: index for index, token in enumerate(TINY_VOCAB)}), path)
+        return str(path)
+
+    return save
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import app.body_downloader as body_downloader
+import app.fetch_emails as fetch_emails
+from app.body_downloader import BodyDownloader
+from app.database import clear_database, get_db_connection, get_email_ids_without_body
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    """BodyDownloader với Gmail giả: ``drops`` là số lần mỗi id bị fetch_messages bỏ qua"""
+    clear_database()
+    fetch_emails.store_email_metadata([{"id": i, "from": "a@example.com", "subject": i} for i in "abc"])
+    drops = {}
+    calls = []
+
+    def fetch_messages(service, message_ids, not_found=None, **params):
+        calls.append(list(message_ids))
+        result = []
+        for message_id in message_ids:
+            if drops.get(message_id):
+                drops[message_id] -= 1
+            else:
+                result.append({"id": message_id, "payload": {"mimeType": "text/plain", "body": {}}})
+        return result
+
+    def store_email_bodies(email_infos):
+        conn = get_db_connection()
+        try:
+            with conn:
+                conn.executemany("UPDATE emails SET has_body = 1 WHERE id = ?", [(i["id"],) for i in email_infos])
+        finally:
+            conn.close()
+        return len(email_infos)
+
+    monkeypatch.setattr(body_downloader, "fetch_messages", fetch_messages)
+    monkeypatch.setattr(body_downloader, "BODY_RETRY_BACKOFF_SECONDS", 0.05)
+    monkeypatch.setattr(fetch_emails, "store_email_bodies", store_email_bodies)
+    instance = BodyDownloader(service_factory=object, batch_size=10)
+    yield instance, drops, calls
+    instance.clear()
+    clear_database()
+
+
+def test_dropped_ids_are_retried_with_backoff(downloader):
+    instance, drops, calls = downloader
+    drops["b"] = 2
+    done = threading.Event()
+    stored = []
+
+    def on_stored(ids):
+        stored.extend(ids)
+        if len(stored) == 3:
+            done.set()
+
+    instance.on_stored = on_stored
+    instance.enqueue(["a", "b", "c"])
+
+    assert done.wait(5)
+    assert sorted(stored) == ["a", "b", "c"]
+    assert calls == [["a", "b", "c"], ["b"], ["b"]]
+    assert get_email_ids_without_body() == []
+
+
+def test_clear_drops_the_cached_service(downloader):
+    instance, _, _ = downloader
+    service = instance._get_service()
+    assert instance._get_service() is service
+    instance.clear()
+    assert instance._get_service() is not service
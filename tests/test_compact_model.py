@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("torch")
+
+from app.compact_model import compact_model, score_drift, split_corpus
+
+
+class FixedScorer:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict_batch(self, texts):
+        return [self.scores[text] for text in texts]
+
+
+def test_split_is_stable_and_keeps_duplicates_together():
+    texts = [f"email {i}" for i in range(200)] + ["email 7"] * 3
+    selection, held_out = split_corpus(texts, holdout=0.25)
+
+    assert (selection, held_out) == split_corpus(texts, holdout=0.25)
+    assert len(selection) + len(held_out) == len(texts)
+    assert not set(selection) & set(held_out)
+    assert 20 < len(held_out) < 80
+
+
+def test_label_flips_use_the_app_threshold_strictly():
+    before = FixedScorer({"a": 0.7, "b": 0.69, "c": 0.71})
+    after = FixedScorer({"a": 0.71, "b": 0.7, "c": 0.7})
+
+    drift = score_drift(before, after, ["a", "b", "c"], threshold=0.7)
+    # a: 0.7 -> 0.71 đổi nhãn (0.7 chưa phải spam); b giữ nhãn; c: 0.71 -> 0.7 đổi nhãn
+    assert drift["label_flips"] == 2 and drift["threshold"] == 0.7
+
+
+def test_drift_is_measured_on_held_out_emails(tmp_path, tiny_checkpoint):
+    path = tiny_checkpoint()
+    texts = [f"verify account meeting agenda {i} click" for i in range(40)] + ["rare prize"] * 2
+
+    report = compact_model(path, str(tmp_path / "compact"), texts, holdout=0.3)
+
+    selection, held_out = split_corpus(texts, holdout=0.3)
+    assert report["corpus"]["emails"] == len(selection)
+    assert report["drift"]["count"] == report["corpus"]["held_out_emails"] == len(held_out)
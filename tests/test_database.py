@@ -0,0 +1,19 @@
+from app.database import get_db_connection, get_spam_threshold, recreate_database, set_spam_threshold
+
+
+def test_recreated_database_keeps_indexes_and_tables():
+    recreate_database()
+
+    conn = get_db_connection()
+    try:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    finally:
+        conn.close()
+    assert {"emails", "idx_emails_auto_spam_score", "settings", "rescore_checkpoint", "spam_score_cache"} <= names
+
+    # set_spam_threshold dùng INDEXED BY idx_emails_auto_spam_score
+    threshold = get_spam_threshold()
+    try:
+        assert set_spam_threshold(0.5) == []
+    finally:
+        set_spam_threshold(threshold)
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.detector_benchmark import RssSampler, benchmark_keyword_scan, build_corpus, current_rss_mb
+from app.sample_emails import sample_email_texts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_rss_sampler_reports_stage_local_growth():
+    if current_rss_mb() is None:
+        pytest.skip("Không đọc được RSS trên hệ điều hành này")
+    with RssSampler() as before:
+        block = bytearray(64 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])
+        del block
+    with RssSampler() as after:
+        sum(range(1000))
+
+    assert before.stats()["peak_rss_delta_mb"] >= 48
+    # Giai đoạn sau không thừa hưởng đỉnh của giai đoạn trước
+    assert after.stats()["peak_rss_delta_mb"] < 16
+
+
+def test_seed_texts_do_not_touch_the_database():
+    pytest.importorskip("torch")
+    code = ("import sys\n"
+            "from app.detector_benchmark import build_corpus\n"
+            "assert len(build_corpus(5)) == 5\n"
+            "assert 'app.database' not in sys.modules, 'app.database đã được import'\n")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_keyword_scan_matches_the_legacy_scan():
+    corpus = build_corpus(200, mean_words=300, seeds=sample_email_texts())
+    stages = benchmark_keyword_scan(corpus)
+
+    assert stages["keyword_scan"]["mismatches_vs_legacy"] == 0
+    assert stages["keyword_scan"]["count"] == stages["keyword_scan_legacy"]["count"] == 200
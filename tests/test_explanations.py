@@ -0,0 +1,63 @@
+import pytest
+
+import app.explanations as explanations
+from app.explanations import highlight_html, keyword_spans, spans_in
+from app.keyword_engine import keyword_score
+from app.text_preprocessor import TextPreprocessor, scoring_text
+
+
+def test_token_spans_point_into_the_original_text():
+    text = "Verify ACCOUNT #42 now, click: www.x.com. I'm Dr. Smith...\r\nİstanbul ok."
+    preprocessor = TextPreprocessor()
+    spans = list(preprocessor.iter_token_spans(text, chunk_size=8))
+
+    assert [token for token, _, _ in spans] == preprocessor.tokenize(text)
+    for token, start, end in spans:
+        assert preprocessor.clean(text[start:end]) == token, (token, text[start:end])
+
+
+def test_highlight_merges_spans_and_escapes():
+    text = "<b>gonna</b> & win"
+    assert highlight_html(text, [(3, 6), (6, 8), (15, 18)], style="x") == (
+        "&lt;b&gt;<span style='x'>gonna</span>&lt;/b&gt; &amp; <span style='x'>win</span>")
+    assert spans_in([(0, 2), (5, 9), (8, 12)], 4, 10) == [(1, 5)]
+
+
+def test_keyword_spans_come_from_the_matcher():
+    text = "Please VERIFY your account, Click Here today"
+    _, keywords = keyword_score(text)
+    assert set(keywords) == {"verify", "account", "click here"}
+
+    spans = keyword_spans(text, keywords)
+    assert sorted(text[start:end].lower() for start, end in spans) == ["account", "click here", "verify"]
+    assert keyword_spans(text, []) == []
+
+
+@pytest.fixture
+def detector(tiny_checkpoint):
+    from app.spam_detector import SpamDetector
+
+    return SpamDetector(tiny_checkpoint(), max_len=4, long_document=True, max_tokens=64)
+
+
+def test_occlusion_covers_every_window(detector, monkeypatch):
+    monkeypatch.setattr(explanations, "MIN_ATTRIBUTION", float("-inf"))
+    body = "meeting agenda " * 6 + "verify your account, click for the prize"
+    text = scoring_text("a@example.com", "agenda", body)
+    windows = detector._encode_windows(text)
+    assert len(windows) > 1
+
+    base, attributions = explanations.occlusion_attribution(detector, text)
+    assert base == pytest.approx(detector._aggregate(detector._score_indices(windows)))
+    # Token chỉ có ở cửa sổ cuối (ngoài max_len token đầu) vẫn được giải thích
+    assert {"prize", "click", "verify"} <= {term for term, _ in attributions}
+
+    token2idx, unk_index = detector.vocab.token_index()
+    masked = [[unk_index if index == token2idx["prize"] else index for index in window] for window in windows]
+    expected = base - detector._aggregate(detector._score_indices(masked))
+    assert dict(attributions)["prize"] == pytest.approx(expected, abs=1e-6)
+
+    kind, _, spans = explanations.explain_text(detector, text)
+    assert kind == "occlusion"
+    body_start = len(text) - len(body)
+    assert (body.rindex("prize"), body.rindex("prize") + 5) in spans_in(spans, body_start, len(text))
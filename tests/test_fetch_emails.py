@@ -0,0 +1,52 @@
+import base64
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from app.fetch_emails import extract_email_info, html_to_text, parse_payload
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+HTML = ("<html><head><style>p {color: red}</style></head><body>"
+        "<p>Your account &amp; password</p><div>Click <a href='http://x'>here</a> now</div>"
+        "<script>alert(1)</script></body></html>")
+
+
+def test_html_to_text_strips_tags_scripts_and_entities():
+    assert html_to_text(HTML) == "Your account & password\nClick here now"
+    assert html_to_text("") == ""
+
+
+def test_html_only_body_gets_plain_text():
+    payload = {"mimeType": "text/html", "body": {"data": encode(HTML)}}
+    text, html_body, attachments = parse_payload(payload)
+    assert text == "Your account & password\nClick here now"
+    assert html_body == HTML
+    assert attachments == []
+
+
+def test_plain_text_part_is_preferred_over_html():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        {"mimeType": "text/plain", "filename": "", "body": {"data": encode("plain body")}},
+        {"mimeType": "text/html", "filename": "", "body": {"data": encode(HTML)}},
+    ]}
+    info = extract_email_info({"id": "m1", "payload": payload})
+    assert info["body"] == "plain body"
+    assert info["body_html"] == HTML
+
+
+def test_only_the_topmost_authentication_results_header_counts():
+    def message(*results):
+        headers = [{"name": "From", "value": "Bank <alerts@bank.example>"}]
+        headers += [{"name": "Authentication-Results", "value": value} for value in results]
+        return {"id": "m", "payload": {"mimeType": "text/plain", "headers": headers, "body": {}}}
+
+    passed = "mx.google.com; dmarc=pass (p=REJECT) header.from=bank.example"
+    failed = "mx.google.com; dmarc=fail (p=NONE) header.from=bank.example"
+    assert extract_email_info(message(passed))["sender_authenticated"]
+    assert not extract_email_info(message(failed, passed))["sender_authenticated"]
+    assert not extract_email_info(message())["sender_authenticated"]
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import app.fetch_emails as fetch_emails
+from app.database import clear_database, get_db_connection
+from app.fake_gmail import FakeGmailServer, build_fake_service
+from app.gmail_batch import fetch_messages
+from app.gmail_sync import MAX_FETCH_ATTEMPTS, MailboxSync
+
+
+def stored_rows():
+    conn = get_db_connection()
+    try:
+        return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT id, is_deleted, is_read FROM emails")}
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    """Gmail giả lập + store_messages chỉ lưu metadata, bỏ qua các id trong ``failing``"""
+    clear_database()
+    failing = set()
+
+    def store_messages(service, message_ids, metadata_first=True):
+        ids = [i for i in message_ids if i not in failing]
+        messages = fetch_messages(service, ids, format="metadata", fields=fetch_emails.METADATA_FIELDS)
+        return fetch_emails.store_email_metadata([fetch_emails.extract_email_info(m) for m in messages])
+
+    monkeypatch.setattr(fetch_emails, "store_messages", store_messages)
+    with FakeGmailServer(message_count=10, latency_ms=0) as server:
+        yield server.gmail, MailboxSync(build_fake_service(server.base_url), full_sync_results=10), failing
+    clear_database()
+
+
+def test_failed_fetches_are_retried_on_next_sync(mailbox):
+    gmail, sync, failing = mailbox
+    sync.sync()
+    first, second = gmail.add_message(), gmail.add_message()
+    failing.add(first)
+
+    result = sync.sync()
+    assert result.added == 1 and result.pending == 1
+    assert first not in stored_rows()
+    assert sync.load_pending() == {first: 1}
+
+    failing.clear()
+    result = sync.sync()
+    assert result.added == 1 and result.pending == 0
+    assert {first, second} <= set(stored_rows())
+    assert sync.load_pending() == {}
+
+
+def test_pending_ids_are_dropped_after_max_attempts(mailbox):
+    gmail, sync, failing = mailbox
+    sync.sync()
+    failing.add(gmail.add_message())
+    for _ in range(MAX_FETCH_ATTEMPTS):
+        sync.sync()
+    assert sync.load_pending() == {}
+
+
+def test_full_sync_reconciles_deletions_and_labels(mailbox):
+    gmail, sync, _ = mailbox
+    sync.sync()
+    trashed, read, deleted = gmail.order[:3]
+    gmail.modify_labels(trashed, add=["TRASH"])
+    gmail.modify_labels(read, remove=["UNREAD"])
+    gmail.delete_message(deleted)
+    gmail.expire_history()
+
+    result = sync.sync()
+    rows = stored_rows()
+    assert result.full_sync
+    assert result.deleted == 1 and deleted not in rows
+    assert result.labels_changed == 2
+    assert rows[trashed] == (1, 0)
+    assert rows[read] == (0, 1)
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+import app.inference_service as inference_service
+from app.inference_service import InferenceService
+
+
+class RecordingDetector:
+    model_version = "test"
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+
+    def predict_batch(self, texts):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batches.append(list(texts))
+        return [len(text) / 100 for text in texts]
+
+
+@pytest.fixture
+def make_service():
+    services = []
+
+    def make(detector, **kwargs):
+        service = InferenceService(detector=detector, **kwargs)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.stop()
+
+
+def test_single_request_does_not_wait(make_service):
+    service = make_service(RecordingDetector(), max_wait_ms=500)
+    start = time.perf_counter()
+    assert service.predict("hello") == pytest.approx(0.05)
+    assert time.perf_counter() - start < 0.25
+
+
+def test_predict_batch_is_one_request_split_by_batch_size(make_service):
+    detector = RecordingDetector()
+    service = make_service(detector, max_wait_ms=500, max_batch_size=4)
+    texts = [f"email {i}" for i in range(10)]
+    start = time.perf_counter()
+    assert service.predict_batch(texts) == pytest.approx([len(t) / 100 for t in texts])
+    assert time.perf_counter() - start < 0.25
+    assert [len(batch) for batch in detector.batches] == [4, 4, 2]
+
+
+def test_concurrent_callers_share_a_batch(make_service):
+    gate = threading.Event()
+    detector = RecordingDetector(gate)
+    service = make_service(detector, max_wait_ms=50, max_batch_size=32)
+    first = service.submit("first")
+    time.sleep(0.05)  # Luồng nền đang chạy lô đầu tiên (bị chặn ở gate)
+    futures = [service.submit(f"caller {i}") for i in range(5)]
+    gate.set()
+
+    assert first.result(5) is not None and all(f.result(5) is not None for f in futures)
+    assert [len(batch) for batch in detector.batches] == [1, 5]
+
+
+def test_interop_threads_are_set_once_before_the_model_loads(make_service, monkeypatch):
+    torch = pytest.importorskip("torch")
+    import app.spam_detector as spam_detector
+
+    calls = []
+    monkeypatch.setattr(inference_service, "_interop_configured", False)
+    monkeypatch.setattr(torch, "set_num_interop_threads", lambda n: calls.append(("interop", n)))
+    monkeypatch.setattr(spam_detector, "get_spam_detector", lambda: calls.append("load") or RecordingDetector())
+
+    for _ in range(2):
+        service = make_service(None)
+        assert service.predict("hello") == pytest.approx(0.05)
+    assert calls == [("interop", inference_service.DEFAULT_NUM_INTEROP_THREADS), "load", "load"]
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.nltk_resources import DEFAULT_RESOURCES_PATH, NltkResources, reference_tokenizer_available
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_import_check(module, extra_path=None):
+    """Chạy ``python -m app.nltk_resources check`` trong tiến trình mới (audit hook cần module chưa import)"""
+    env = dict(os.environ)
+    if extra_path:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(extra_path), ROOT, env.get("PYTHONPATH")]))
+    return subprocess.run([sys.executable, "-m", "app.nltk_resources", "check", module],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=300)
+
+
+def test_text_preprocessor_import_does_no_io():
+    result = run_import_check("app.text_preprocessor")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_spam_detector_import_does_no_io():
+    pytest.importorskip("numpy")
+    pytest.importorskip("torch")
+    result = run_import_check("app.spam_detector")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_import_check_reports_io(tmp_path):
+    # Bộ kiểm tra phải bắt được việc mở file dữ liệu và SQLite khi import
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("x", encoding="utf-8")
+    (tmp_path / "io_probe.py").write_text(
+        "import sqlite3\n"
+        f"open({str(data_file)!r}).close()\n"
+        "sqlite3.connect(':memory:').close()\n", encoding="utf-8")
+    result = run_import_check("io_probe", extra_path=tmp_path)
+    assert result.returncode == 1
+    assert "sqlite3.connect" in result.stdout
+    assert str(data_file) in result.stdout
+
+
+def test_bundled_resources_match_installed_nltk(tmp_path):
+    """File JSON đóng gói phải đúng là kết quả của ``python -m app.nltk_resources build``"""
+    if not reference_tokenizer_available():
+        pytest.skip("Không có NLTK/punkt để biên dịch lại tài nguyên")
+    pytest.importorskip("nltk.corpus")
+    from nltk.corpus import stopwords
+    try:
+        stopwords.words("english")
+    except LookupError:
+        pytest.skip("Không có dữ liệu stopwords của NLTK")
+
+    from app.nltk_resources import build_resources
+    with open(build_resources(str(tmp_path / "nltk_resources.json")), encoding="utf-8") as f:
+        expected = json.load(f)
+    with open(DEFAULT_RESOURCES_PATH, encoding="utf-8") as f:
+        assert json.load(f) == expected
+
+
+def test_bundled_resources_load():
+    resources = NltkResources.from_file()
+    assert "the" in resources.stopwords
+    assert "inc" in resources.abbreviations
+    assert ("j", "walter") in resources.collocations
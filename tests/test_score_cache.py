@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import app.score_cache as score_cache
+from app.database import get_db_connection
+from app.score_cache import SpamScoreCache, text_hash
+
+
+def last_used():
+    conn = get_db_connection()
+    try:
+        return dict(conn.execute("SELECT text_hash, last_used FROM spam_score_cache"))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def cache():
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("DELETE FROM spam_score_cache")
+    finally:
+        conn.close()
+    return SpamScoreCache(max_entries=2)
+
+
+def test_hits_do_not_write_until_the_next_put(cache):
+    cache.put("a", "predict", "v1", 0.2)
+    before = last_used()
+    time.sleep(0.01)
+    for _ in range(3):
+        assert cache.get("a", "predict", "v1") == (0.2, [])
+    assert last_used() == before
+
+    cache.put("b", "predict", "v1", 0.3)
+    assert last_used()[text_hash("a")] > before[text_hash("a")]
+
+
+def test_batched_touches_keep_recently_used_entries(cache):
+    cache.put("a", "predict", "v1", 0.2)
+    time.sleep(0.01)
+    cache.put("b", "predict", "v1", 0.3)
+    time.sleep(0.01)
+    cache.get("a", "predict", "v1")
+    cache.put("c", "predict", "v1", 0.4)
+
+    assert set(last_used()) == {text_hash("a"), text_hash("c")}
+
+
+def test_touches_flush_when_enough_hits_are_pending(cache, monkeypatch):
+    monkeypatch.setattr(score_cache, "TOUCH_FLUSH_SIZE", 2)
+    cache.put("a", "predict", "v1", 0.2)
+    cache.put("b", "predict", "v1", 0.3)
+    before = last_used()
+    time.sleep(0.01)
+
+    cache.get("a", "predict", "v1")
+    assert last_used() == before
+    cache.get("b", "predict", "v1")
+    after = last_used()
+    assert all(after[key] > before[key] for key in before)
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from app.database import clear_database, count_stale_emails, get_db_connection, save_emails_to_db
+from app.rescoring import RescoringJob
+from app.scoring_cascade import ScoringCascade
+
+HAM = "From: friend@example.com\nSubject: hi\n\nLunch tomorrow at noon?"
+SPAM = ("From: x@promo.example\nSubject: URGENT winner\n\nCongratulations you won a free prize! "
+        "Verify your account password now, click here to claim lottery cash")
+UNSURE = "From: a@example.com\nSubject: report\n\nsee www.example.com/report for the quarterly numbers"
+
+
+class FakeScorer:
+    model_version = "test-model-v1"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, texts):
+        self.batches.append(list(texts))
+        return [0.5] * len(texts)
+
+
+@pytest.fixture
+def allowlist(tmp_path):
+    path = tmp_path / "allowlist.json"
+    path.write_text(json.dumps({"senders": [], "domains": ["trusted.example"]}), encoding="utf-8")
+    return str(path)
+
+
+def clear_score_cache():
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("DELETE FROM spam_score_cache")
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def empty_db():
+    clear_database()
+    clear_score_cache()
+    yield
+    clear_database()
+    clear_score_cache()
+
+
+def test_batch_runs_model_once_for_undecided_texts(allowlist, empty_db):
+    scorer = FakeScorer()
+    cascade = ScoringCascade(scorer=scorer, allowlist_path=allowlist)
+    spoofed = UNSURE + " spoofed"
+    items = [(HAM, "friend@example.com", False), (SPAM, "x@promo.example", False), (UNSURE, "a@example.com", False),
+             (UNSURE + " again", "Boss <boss@trusted.example>", True),
+             (spoofed, "Boss <boss@trusted.example>", False)]
+
+    results = cascade.score_batch_with_version(items)
+
+    # From trong allowlist nhưng chưa xác thực (có thể giả mạo) vẫn phải qua model
+    assert scorer.batches == [[UNSURE, spoofed]]
+    assert [version for _, version in results] == [scorer.model_version] * 5
+    assert results[0][0] == 0.0 and results[1][0] >= cascade.strong_spam_threshold
+    assert results[2][0] == 0.5 and results[3][0] == 0.0 and results[4][0] == 0.5
+    assert cascade.stats() == {"allowlist": 1, "fallback": 0, "cache": 0, "keywords": 2, "model": 2}
+
+    # Lần sau lấy từ cache, không chạy lại model
+    assert cascade.score_with_version(UNSURE, "a@example.com") == (0.5, scorer.model_version)
+    assert len(scorer.batches) == 1
+
+
+def test_rescoring_uses_cascade_and_stamps_allowlisted_rows(allowlist, empty_db):
+    save_emails_to_db([
+        {"id": "a", "sender": "friend@example.com", "subject": "hi", "body": "Lunch tomorrow at noon?"},
+        {"id": "b", "sender": "a@example.com", "subject": "report",
+         "body": "see www.example.com/report for the quarterly numbers"},
+        {"id": "c", "sender": "Boss <boss@trusted.example>", "subject": "report",
+         "body": "see www.example.com/report", "sender_authenticated": True},
+        {"id": "d", "sender": "Boss <boss@trusted.example>", "subject": "report",
+         "body": "see www.example.com/report"},
+    ])
+    scorer = FakeScorer()
+
+    cascade = ScoringCascade(scorer=scorer, allowlist_path=allowlist)
+    assert RescoringJob(scorer=scorer, cpu_budget=1.0, cascade=cascade).run() == 4
+
+    assert len(scorer.batches) == 1 and len(scorer.batches[0]) == 2
+    assert count_stale_emails(scorer.model_version) == 0
+    conn = get_db_connection()
+    try:
+        scores = dict(conn.execute("SELECT id, spam_score FROM emails"))
+    finally:
+        conn.close()
+    assert scores == {"a": 0.0, "b": 0.5, "c": 0.0, "d": 0.5}
+
+
+def test_store_emails_scores_the_whole_list_at_once(monkeypatch, empty_db):
+    pytest.importorskip("googleapiclient")
+    import app.fetch_emails as fetch_emails
+    import app.scoring_cascade as scoring_cascade
+
+    scorer = FakeScorer()
+    monkeypatch.setattr(scoring_cascade, "get_scoring_cascade", lambda: ScoringCascade(scorer=scorer))
+    infos = [{"id": f"m{i}", "from": f"user{i}@example.com", "subject": "report",
+              "body": f"see www.example.com/report/{i}", "attachments": []} for i in range(5)]
+
+    assert fetch_emails.store_emails_in_database(infos) == 5
+    assert len(scorer.batches) == 1 and len(scorer.batches[0]) == 5
+
+
+def test_keyword_verdict_only_scans_the_ends_of_long_emails(monkeypatch):
+    import app.scoring_cascade as scoring_cascade
+
+    scanned = []
+    monkeypatch.setattr(scoring_cascade, "keyword_score", lambda text: (scanned.append(len(text)) or 0.0, []))
+    cascade = ScoringCascade(scorer=FakeScorer())
+    long_text = "lunch tomorrow at noon " * 5000
+
+    # Chưa quét hết email thì không được kết luận là thư bình thường
+    assert cascade.keyword_verdict(long_text) is None
+    assert scanned == [scoring_cascade.KEYWORD_VERDICT_CHARS + 1]
+    assert cascade.keyword_verdict("lunch tomorrow at noon") == 0.0
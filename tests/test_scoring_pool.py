@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+
+from app.model_artifact import HEADER_FILE, artifact_dir_for
+from app.scoring_pool import ProcessPoolScorer, ensure_artifact
+from app.spam_detector import SpamDetector
+
+TEXTS = ["Verify your account and claim the prize, click now", "Meeting agenda attached", "hello"]
+
+
+@pytest.fixture
+def checkpoint(tiny_checkpoint):
+    return tiny_checkpoint(seed=0)
+
+
+def test_workers_are_spawned_and_load_the_memmap_artifact(checkpoint):
+    with ProcessPoolScorer(num_workers=2, model_path=checkpoint, chunk_size=1) as scorer:
+        assert scorer._executor._mp_context.get_start_method() == "spawn"
+        scores = scorer.predict_batch(TEXTS)
+
+    assert os.path.exists(os.path.join(artifact_dir_for(checkpoint), HEADER_FILE))
+    expected = SpamDetector.get_instance(checkpoint).predict_batch(TEXTS)
+    assert scores == pytest.approx(expected, abs=1e-6)
+
+
+def test_replaced_checkpoint_refreshes_the_artifact(checkpoint, tiny_checkpoint):
+    ensure_artifact(checkpoint)
+    old = SpamDetector(checkpoint)
+    assert old.model_file.endswith("weights.bin")
+
+    # Thay best_model.pth sau khi đã có artifact (thời điểm sửa đổi khác hẳn)
+    tiny_checkpoint(seed=1)
+    stat = os.stat(checkpoint)
+    os.utime(checkpoint, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    expected = SpamDetector(checkpoint)
+    assert expected.model_file == checkpoint  # artifact cũ bị bỏ qua
+    assert expected.predict_batch(TEXTS) != pytest.approx(old.predict_batch(TEXTS), abs=1e-6)
+
+    ensure_artifact(checkpoint)
+    new = SpamDetector(checkpoint)
+    assert new.model_file.endswith("weights.bin")
+    assert new.predict_batch(TEXTS) == pytest.approx(expected.predict_batch(TEXTS), abs=1e-6)
+    assert new.model_version != old.model_version
@@ -0,0 +1,30 @@
+from app.sender_auth import parse_authentication_results, sender_authenticated
+
+GOOGLE = ("mx.google.com;\r\n       dkim=pass header.i=@mail.bank.example header.s=s1 header.b=abc;\r\n"
+          "       spf=pass (google.com: domain of bounce@bank.example designates 1.2.3.4 as permitted sender) "
+          "smtp.mailfrom=bounce@bank.example;\r\n       dmarc=pass (p=REJECT sp=REJECT dis=NONE) header.from=bank.example")
+
+
+def test_parses_methods_and_properties():
+    authserv_id, results = parse_authentication_results(GOOGLE)
+    assert authserv_id == "mx.google.com"
+    assert [(method, result) for method, result, _ in results] == [("dkim", "pass"), ("spf", "pass"), ("dmarc", "pass")]
+    assert results[1][2]["smtp.mailfrom"] == "bounce@bank.example"
+
+
+def test_aligned_pass_from_trusted_server_authenticates():
+    assert sender_authenticated("Bank <alerts@bank.example>", [GOOGLE])
+    assert sender_authenticated("alerts@bank.example", ["mx.google.com; spf=pass smtp.mailfrom=bank.example"])
+    assert sender_authenticated("alerts@bank.example", ["mx.google.com; dkim=pass header.d=bank.example"])
+
+
+def test_spoofed_or_unaligned_senders_are_not_authenticated():
+    # Tên miền From khác tên miền đã được xác thực
+    assert not sender_authenticated("alerts@bank.example", ["mx.google.com; spf=pass smtp.mailfrom=evil.example"])
+    assert not sender_authenticated("alerts@bank.example", ["mx.google.com; dmarc=fail header.from=bank.example"])
+    assert not sender_authenticated("alerts@bank.example", ["mx.google.com; dkim=pass header.d=ank.example"])
+    # Header do người gửi tự chèn: không phải header trên cùng, hoặc không do máy chủ tin cậy ghi
+    assert not sender_authenticated("alerts@bank.example", ["mx.google.com; dmarc=fail header.from=bank.example",
+                                                            GOOGLE])
+    assert not sender_authenticated("alerts@bank.example", [GOOGLE.replace("mx.google.com", "mx.evil.example")])
+    assert not sender_authenticated("alerts@bank.example", [])
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("torch")
+
+from app.spam_detector import SpamDetector
+
+TEXTS = [
+    "",
+    "!!! ??? 123",
+    "hello",
+    "Meeting agenda attached",
+    "Verify your account and claim the prize, click now",
+    "URGENT winner! Congratulations, claim your prize: free cash, verify your password and bank account now!!!",
+    "Lunch tomorrow at noon? The meeting agenda is attached, thanks and regards.",
+    " ".join(["meeting agenda report"] * 20) + " verify your account click the prize",
+    "account " * 60,
+]
+
+
+def result_score(result):
+    return result[0] if isinstance(result, tuple) else result
+
+
+def single_scores(detector, texts):
+    return [result_score(detector.predict(text)) for text in texts]
+
+
+@pytest.mark.parametrize("long_document", [False, True])
+def test_predict_batch_matches_predict(tiny_checkpoint, long_document):
+    detector = SpamDetector(tiny_checkpoint(), max_len=8, long_document=long_document, max_tokens=32)
+    assert detector.model is not None
+
+    # bucket_size nhỏ để các email có độ dài khác nhau rơi vào nhiều lô
+    assert detector.predict_batch(TEXTS, bucket_size=3) == pytest.approx(single_scores(detector, TEXTS), abs=1e-6)
+
+
+def test_predict_batch_matches_predict_without_model(tmp_path):
+    detector = SpamDetector(str(tmp_path / "missing.pth"))
+    detector.model = detector.vocab = None  # bỏ qua models/ của máy chạy kiểm thử (nếu có)
+
+    assert detector.predict_batch(TEXTS) == pytest.approx(single_scores(detector, TEXTS), abs=1e-9)
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from app.nltk_resources import reference_tokenizer_available
+from app.text_preprocessor import TextPreprocessor
+
+# Kết quả của preprocess_text (word_tokenize của NLTK) cho các trường hợp khó:
+# khoảng trắng cuối văn bản, viết tắt, chữ cái đầu, dấu chấm lửng và rút gọn
+REFERENCE_CASES = [
+    ("Acme Inc.\r\n", ["acme", "inc", "."]),
+    ("Best, John Smith Jr.\n\n", ["best", ",", "john", "smith", "jr", "."]),
+    ("at 5 p.m.\n", ["p.m", "."]),
+    ("Hello world.  ", ["hello", "world", "."]),
+    ("end etc.", ["end", "etc", "."]),
+    ("end etc. \t", ["end", "etc", "."]),
+    ("Call Dr. Smith now. He is here.", ["call", "dr.", "smith", ".", "."]),
+    ("U.S. dollars e.g. cash, etc. ok.",
+     ["u.s.", "dollars", "e.g", ".", "cash", ",", "etc", ".", "ok", "."]),
+    ("Mr. X.", ["mr.", "x", "."]),
+    ("A. B. C.", ["a.", "b.", "c", "."]),
+    ("wait... really?! yes.", ["wait", "...", "really", "?", "!", "yes", "."]),
+    ("cannot gonna wanna. ", ["gon", "na", "wan", "na", "."]),
+    ("i wanna., ok", ["wanna.", ",", "ok"]),
+    ("gotta., x.wanna.y wanna,x", ["got", "ta", ".", ",", "x.wanna.y", "wan", "na", ",", "x"]),
+    ("visit www.site.com. now", ["visit", "www.site.com", "."]),
+    ("  Jan. 5 meeting", ["jan.", "meeting"]),
+    ("no. 5", ["."]),
+    ("Corp.,Ltd.", ["corp.", ",", "ltd", "."]),
+]
+
+VOCAB = ("please verify your account now click here to claim the prize we have detected "
+         "unusual activity meeting agenda attached report invoice payment thanks regards").split()
+SPECIAL = ["Inc.", "Jr.", "p.m.", "a.m.", "Dr.", "Mr.", "etc.", "e.g.", "i.e.", "U.S.", "Ltd.",
+           "No.", "Jan.", "J.", "www.secure-bank.com", "$5,000", "2.0", "http://x.co/a?b=1",
+           "cannot", "gonna", "wanna", "...", ",,", "I'm", "don't"]
+
+
+def random_email(rng):
+    sentences = []
+    for _ in range(rng.randint(1, 6)):
+        words = [rng.choice(VOCAB if rng.random() < 0.7 else SPECIAL) for _ in range(rng.randint(1, 10))]
+        if rng.random() < 0.3:
+            words[0] = words[0].capitalize()
+        sentences.append(" ".join(words) + rng.choice([".", ".", "!", "?", ",", ""]))
+    separator = rng.choice([" ", "\n", "\r\n", "\n\n"])
+    return separator.join(sentences) + rng.choice(["", "\n", "\r\n", "  \n\n", " 5\n"])
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    return TextPreprocessor()
+
+
+@pytest.mark.parametrize("text,expected", REFERENCE_CASES)
+def test_matches_reference_cases(preprocessor, text, expected):
+    assert preprocessor.tokenize(text) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [5, 7, 16, 64])
+def test_chunk_size_does_not_change_tokens(preprocessor, chunk_size):
+    rng = random.Random(chunk_size)
+    for _ in range(200):
+        text = random_email(rng)
+        assert list(preprocessor.iter_tokens(text, chunk_size)) == preprocessor.tokenize(text), repr(text)
+
+
+def test_matches_preprocess_text(preprocessor):
+    if not reference_tokenizer_available():
+        pytest.skip("Không có NLTK/punkt để đối chiếu")
+    pytest.importorskip("torch")
+    from app.text_preprocessor import compare_with_reference
+
+    rng = random.Random(3)
+    texts = [random_email(rng) for _ in range(500)] + [text for text, _ in REFERENCE_CASES]
+    assert compare_with_reference(texts, preprocessor) == []